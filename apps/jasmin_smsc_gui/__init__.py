@@ -14,6 +14,7 @@ from . import connector_manager
 from . import route_manager
 from . import stats
 from . import interceptor_manager
+from . import bulk_import
 # optional parameters
 __version__ = "1.0.0.0"
 __author__ = "John Bannister <eudorajab1@gmail.com>"
@@ -0,0 +1,380 @@
+"""
+Asyncio jCli client
+
+AsyncJptelnet offers the same operations as jtel.Jptelnet (same arguments,
+same return values) but never blocks a thread while Jasmin answers, so one
+event loop can hold many jCli conversations at once, e.g.
+
+    lists = run_jcli(('list_it', 'users'), ('list_it', 'filters'), ('stats', ['smppcs']))
+"""
+import asyncio
+import contextlib
+from . import settings
+from .jproto import TelnetCodec, escape, jCliSessionError
+
+STANDARD_PROMPT = b'jcli : '
+INTERACTIVE_PROMPT = b'> '
+
+LIST_COMMANDS = {
+    'smppcs': b"smppccm -l",
+    'imos': b"mointerceptor -l",
+    'imts': b"mtinterceptor -l",
+    'httpcs': b"httpccm -l",
+    'mtrouter': b"mtrouter -l",
+    'morouter': b"morouter -l",
+    'filters': b"filter -l",
+    'users': b"user -l",
+    'groups': b"group -l",
+}
+
+# filter type -> the jCli key holding its value, as sent by Jptelnet.filters
+FILTER_VALUE_KEYS = {
+    'TransparentFilter': None,
+    'ShortMessageFilter': 'short_message',
+    'DateIntervalFilter': 'dateInterval',
+    'TimeIntervalFilter': 'timeInterval',
+    'TagFilter': 'tag',
+    'EvalPyFilter': 'uid',
+    'UserFilter': 'uid',
+    'DestinationAddrFilter': 'destination_addr',
+    'GroupFilter': 'gid',
+    'SourceAddrFilter': 'source_addr',
+}
+
+# smppccm -u keys in the order of Jptelnet.connector(['update', cid, ...]) data[2:]
+CONNECTOR_UPDATE_KEYS = ('ripf', 'con_fail_delay', 'dlr_expiry', 'coding', 'logrotate', 'submit_throughput',
+                         'elink_interval', 'bind_to', 'port', 'con_fail_retry', 'password', 'src_addr',
+                         'bind_npi', 'addr_range', 'dst_ton', 'res_to', 'def_msg_id', 'priority',
+                         'con_loss_retry', 'username', 'dst_npi', 'validity', 'requeue_delay', 'host',
+                         'src_npi', 'trx_to', 'logfile', 'ssl', 'loglevel', 'bind', 'proto_id', 'dlr_msgid',
+                         'con_loss_delay', 'bind_ton', 'pdu_red_to', 'src_ton')
+
+# user -u keys in the order of Jptelnet.users(['update', uid, ...]) data[2:]
+USER_UPDATE_KEYS = ('defaultvalue src_addr', 'quota http_throughput', 'quota balance', 'quota smpps_throughput',
+                    'quota sms_count', 'quota early_percent', 'valuefilter priority', 'valuefilter content',
+                    'valuefilter src_addr', 'valuefilter dst_addr', 'valuefilter validity_period',
+                    'authorization http_send', 'authorization http_dlr_method', 'authorization http_balance',
+                    'authorization smpps_send', 'authorization priority', 'authorization http_long_content',
+                    'authorization src_addr', 'authorization dlr_level', 'authorization http_rate',
+                    'authorization validity_period', 'authorization http_bulk')
+
+
+def _b(value):
+    return value if isinstance(value, bytes) else str(value).encode()
+
+def _lines(response):
+    return response.decode('ascii').strip().replace("\r", '').split("\n") #splitlines()
+
+
+class AsyncJcliSession(object):
+    """One authenticated jCli conversation over asyncio streams"""
+
+    def __init__(self, reader, writer, timeout=20):
+        self.reader = reader
+        self.writer = writer
+        self.timeout = timeout
+        self.codec = TelnetCodec()
+        self.buffer = bytearray()
+        self.dirty = False
+
+    @classmethod
+    async def open(cls, host, port, username, password, timeout=16):
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        session = cls(reader, writer)
+        try:
+            await session.read_until(b"Authentication required.", timeout)
+            await session.write(b"\r\n")
+            await session.read_until(b"Username:", timeout)
+            await session.write(username.encode('ascii') + b"\r\n")
+            await session.read_until(b"Password:", timeout)
+            await session.write(password.encode('ascii') + b"\r\n")
+            await session.read_until(b"console", timeout)
+            await session.read_until(STANDARD_PROMPT, timeout)
+        except Exception:
+            await session.close()
+            raise
+        return session
+
+    async def write(self, data):
+        self.dirty = True
+        self.writer.write(escape(data))
+        await self.writer.drain()
+
+    async def read_until(self, marker, timeout=None):
+        """Stream data in until 'marker' shows up, returns everything up to and including it"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout)
+        scanned = 0
+        while True:
+            # only look at what arrived since the last pass (plus an overlap for a split marker)
+            idx = self.buffer.find(marker, max(0, scanned - len(marker) + 1))
+            if idx != -1:
+                end = idx + len(marker)
+                response = bytes(self.buffer[:end])
+                del self.buffer[:end]
+                if marker == STANDARD_PROMPT:
+                    self.dirty = False
+                return response
+            scanned = len(self.buffer)
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise jCliSessionError('Did not get prompt (%s)' % marker)
+            try:
+                chunk = await asyncio.wait_for(self.reader.read(65536), remaining)
+            except asyncio.TimeoutError:
+                raise jCliSessionError('Did not get prompt (%s)' % marker)
+            if not chunk:
+                raise jCliSessionError('jCli closed the connection waiting for (%s)' % marker)
+            cooked, replies = self.codec.feed(chunk)
+            if replies:
+                self.writer.write(replies)
+            self.buffer += cooked
+
+    async def command(self, command, prompt=STANDARD_PROMPT, timeout=None):
+        await self.write(command + b"\r\n")
+        return await self.read_until(prompt, timeout)
+
+    async def mutate(self, lines, ko=False, persist=True):
+        """Send an add/update/remove and persist on success
+
+        Returns None on success or the decoded jCli answer, like Jptelnet.
+        """
+        for line in lines[:-1]:
+            await self.write(line + b"\r\n")
+        resp = await self.command(lines[-1])
+        if b'Successfully' not in resp:
+            if ko:
+                await self.write(b"ko\r\n")
+            return resp.decode('ascii')
+        if persist:
+            await self.command(b"persist a")
+        return None
+
+    def usable(self):
+        return not self.dirty and not self.reader.at_eof() and not self.writer.is_closing()
+
+    async def close(self):
+        self.writer.close()
+        with contextlib.suppress(Exception):
+            await self.writer.wait_closed()
+
+
+def _interactive(head, fields):
+    """'smppccm -a' style command: header line, one 'key value' line per field and ok"""
+    lines = [head]
+    for key, value in fields:
+        lines.append(_b(key) + b" " + _b(value))
+    lines.append(b"ok")
+    return lines
+
+
+class AsyncJptelnet(object):
+    """Asyncio counterpart of jtel.Jptelnet
+
+    At most 'concurrency' sessions are open at once; finished sessions are
+    kept for the next call made on the same event loop. With defer_persist
+    mutations are not persisted one by one, call persist() once at the end.
+    """
+
+    def __init__(self, host=None, port=None, username=None, password=None, concurrency=None, timeout=20,
+                 defer_persist=False):
+        self.host = host or settings.JASMIN_HOST
+        self.port = port or settings.JASMIN_PORT
+        self.username = username or settings.JASMIN_USER
+        self.password = password or settings.JASMIN_PWD
+        self.concurrency = concurrency or settings.JCLI_ASYNC_CONCURRENCY
+        self.timeout = timeout
+        self.defer_persist = defer_persist
+        self._sem = None
+        self._idle = []
+
+    @contextlib.asynccontextmanager
+    async def session(self):
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.concurrency)
+        async with self._sem:
+            s = None
+            while self._idle and s is None:
+                s = self._idle.pop()
+                if not s.usable():
+                    await s.close()
+                    s = None
+            if s is None:
+                s = await AsyncJcliSession.open(self.host, self.port, self.username, self.password)
+                s.timeout = self.timeout
+            try:
+                yield s
+            finally:
+                if s.usable():
+                    self._idle.append(s)
+                else:
+                    await s.close()
+
+    async def aclose(self):
+        while self._idle:
+            await self._idle.pop().close()
+
+    async def _read(self, command):
+        async with self.session() as s:
+            return _lines(await s.command(command))
+
+    async def _mutate(self, lines, ko=False):
+        async with self.session() as s:
+            return await s.mutate(lines, ko=ko, persist=not self.defer_persist)
+
+    async def persist(self):
+        async with self.session() as s:
+            await s.command(b"persist a")
+
+    async def list_it(self, list_type=None):
+        if list_type not in LIST_COMMANDS:
+            return None
+        return await self._read(LIST_COMMANDS[list_type])
+
+    async def stats(self, data):
+        action = data[0]
+        if action == 'user':
+            return await self._read(b"stats --user=" + _b(data[1]))
+        elif action == 'smppc':
+            return await self._read(b"stats --smppc=" + _b(data[1]))
+        elif action in ('users', 'smppcs', 'smppsapi', 'httpapi'):
+            return await self._read(b"stats --" + _b(action))
+        return 'Unknown stats type'
+
+    async def interceptor(self, data):
+        direction, i_type, order, script, filters = data[:5]
+        cmd = b"mtinterceptor" if direction == 'mt' else b"mointerceptor"
+        if i_type == 'remove':
+            return await self._mutate([cmd + b" -r " + _b(order)], ko=True)
+        elif i_type == 'flush':
+            return await self._mutate([cmd + b" -f"], ko=True)
+        elif i_type in ('StaticMTInterceptor', 'StaticMOInterceptor'):
+            fields = [('type', i_type), ('order', order), ('script', script), ('filters', filters)]
+        else:
+            fields = [('type', i_type), ('script', script)]
+        return await self._mutate(_interactive(cmd + b" -a", fields), ko=True)
+
+    async def morouter(self, data):
+        action = data[0]
+        if action == 'StaticMORoute':
+            fields = [('type', action), ('order', data[1]), ('connector', data[2]), ('filters', data[3])]
+        elif action in ('RandomRoundrobinMORoute', 'FailoverMORoute'):
+            fields = [('type', action), ('order', data[1]), ('connectors', data[2]), ('filters', data[3])]
+        elif action == 'DefaultRoute':
+            fields = [('type', action), ('connector', data[1])]
+        elif action == 'remove':
+            return await self._mutate([b"morouter -r " + _b(data[1])])
+        elif action == 'flush':
+            return await self._mutate([b"morouter -f "])
+        else:
+            return 'Invalid MO router optoin'
+        return await self._mutate(_interactive(b"morouter -a", fields))
+
+    async def mtrouter(self, data):
+        action = data[0]
+        if action == 'StaticMTRoute':
+            fields = [('type', action), ('order', data[1]), ('connector', data[2]),
+                      ('filters', data[3][:-1]), ('rate', data[4])]
+        elif action in ('RandomRoundrobinMTRoute', 'FailoverMTRoute'):
+            fields = [('type', action), ('order', data[1]), ('connectors', data[2]),
+                      ('filters', data[3]), ('rate', data[4])]
+        elif action == 'DefaultRoute':
+            fields = [('type', action), ('connector', data[1]), ('rate', data[2])]
+        elif action == 'remove':
+            return await self._mutate([b"mtrouter -r " + _b(data[1])])
+        elif action == 'flush':
+            return await self._mutate([b"mtrouter -f"])
+        else:
+            return 'Invalid action for router'
+        return await self._mutate(_interactive(b"mtrouter -a", fields))
+
+    async def filters(self, data):
+        action = data[0]
+        if action == 'delete':
+            return await self._mutate([b"filter -r" + _b(data[1])])
+        elif action == 'create':
+            fid, ftype, fval = data[1], data[2], data[3]
+            if ftype not in FILTER_VALUE_KEYS:
+                return None
+            fields = [('fid', fid), ('type', ftype)]
+            if FILTER_VALUE_KEYS[ftype]:
+                fields.append((FILTER_VALUE_KEYS[ftype], fval))
+            return await self._mutate(_interactive(b"filter -a", fields))
+        return None
+
+    async def http_cons(self, data):
+        action = data[0]
+        if action == 'create':
+            fields = [('cid', data[1]), ('method', data[2]), ('url', data[3])]
+            return await self._mutate(_interactive(b"httpccm -a", fields))
+        elif action == 'remove':
+            return await self._mutate([b"httpccm -r " + _b(data[1])])
+        return None
+
+    async def connector(self, data):
+        action = data[0]
+        if action == 'start':
+            return await self._mutate([b"smppccm -1 " + _b(data[1])])
+        elif action == 'stop':
+            return await self._mutate([b"smppccm -0 " + _b(data[1])])
+        elif action == 'remove':
+            return await self._mutate([b"smppccm -r " + _b(data[1])])
+        elif action == 'show':
+            return await self._read(b"smppccm -s " + _b(data[1]))
+        elif action == 'update':
+            values = dict(zip(CONNECTOR_UPDATE_KEYS, data[2:]))
+            # bind goes first, as in Jptelnet
+            fields = [('bind', values.pop('bind'))] + list(values.items())
+            return await self._mutate(_interactive(b"smppccm -u " + _b(data[1]), fields))
+        elif action == 'create':
+            fields = [('cid', data[1]), ('username', data[2]), ('password', data[3]),
+                      ('host', data[4]), ('port', data[5]), ('submit_throughput', data[6])]
+            return await self._mutate(_interactive(b"smppccm -a", fields))
+        return 'Invalid fucntion for connectors'
+
+    async def users(self, data):
+        action = data[0]
+        if action == 'update':
+            fields = [('mt_messaging_cred ' + key, value) for key, value in zip(USER_UPDATE_KEYS, data[2:])]
+            return await self._mutate(_interactive(b"user -u " + _b(data[1]), fields))
+        elif action == 'unbind':
+            return await self._mutate([b"user --smpp-unbind=" + _b(data[1])])
+        elif action == 'ban':
+            return await self._mutate([b"user --smpp-ban=" + _b(data[1])])
+        elif action == 'create_user':
+            fields = [('uid', data[1]), ('gid', data[4]), ('username', data[2]), ('password', data[3])]
+            return await self._mutate(_interactive(b"user -a", fields))
+        elif action == 'get_creds':
+            return await self._read(b"user -s" + _b(data[1]))
+        elif action == 'create_group':
+            return await self._mutate(_interactive(b"group -a", [('gid', data[1])]))
+        elif action == 'enable_user':
+            return await self._mutate([b"user -e" + _b(data[1])])
+        elif action == 'enable_group':
+            return await self._mutate([b"group -e" + _b(data[1])])
+        elif action == 'disable_user':
+            return await self._mutate([b"user -d" + _b(data[1])])
+        elif action == 'disable_group':
+            return await self._mutate([b"group -d" + _b(data[1])])
+        elif action == 'remove_user':
+            return await self._mutate([b"user -r" + _b(data[1])])
+        elif action == 'remove_group':
+            return await self._mutate([b"group -r" + _b(data[1])])
+        return 'Invalid action for user management'
+
+
+def run_jcli(*calls, **kwargs):
+    """Run several AsyncJptelnet calls concurrently from blocking code
+
+    Each call is a (method name, argument) tuple; results come back in the
+    same order. Exceptions are returned in place of the result so one failing
+    call does not hide the others.
+    """
+    async def main():
+        client = AsyncJptelnet(**kwargs)
+        try:
+            return await asyncio.gather(*[getattr(client, name)(arg) for name, arg in calls],
+                                        return_exceptions=True)
+        finally:
+            await client.aclose()
+    return asyncio.run(main())
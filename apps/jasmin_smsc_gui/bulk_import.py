@@ -0,0 +1,469 @@
+"""
+Bulk import of groups, users (with credentials), filters and MT/MO routes
+
+The whole file is validated against the models before anything is sent to
+Jasmin. Work then runs in dependency order (groups, users, filters, routes),
+each phase spread over parallel jCli sessions with a single persist at the
+end, and the local tables are written in one transaction. The import runs
+in a thread of its own, with its own DB transaction, that goes to the end
+even when the client goes away; the response only streams its progress,
+one JSON object per line.
+
+JSON:
+    {"groups": [{"gid": "resellers"}],
+     "users": [{"uid": "R_1", "username": "r1", "password": "secret", "gid": "resellers",
+                "quota_balance": "100"}],
+     "filters": [{"fid": "r1", "type": "UserFilter", "value": "R_1"}],
+     "mt_routes": [{"type": "StaticMTRoute", "order": "20", "connectors": ["demo"],
+                    "filters": ["r1"], "rate": "0.02"}],
+     "mo_routes": []}
+
+CSV: one row per object with a 'kind' column (group, user, filter, mt_route,
+mo_route) and the same keys as columns; list cells are separated by ';'.
+"""
+import asyncio
+import csv
+import io
+import json
+import queue
+import re
+import threading
+import time
+
+from py4web import action, request, response
+from .common import db, session, auth, flash, Field, jasmin, logger
+from py4web.utils.form import Form, FormStyleBulma
+from .models import MT_FILTER_TYPES, MO_FILTER_TYPES, MTROUTE_TYPES, MOROUTE_TYPES
+from .ajtel import AsyncJptelnet, FILTER_VALUE_KEYS
+from .jparse import parse_listing
+from . import settings
+
+KINDS = ('groups', 'users', 'filters', 'mt_routes', 'mo_routes')
+CSV_KINDS = {'group': 'groups', 'user': 'users', 'filter': 'filters',
+             'mt_route': 'mt_routes', 'mo_route': 'mo_routes'}
+NAME = re.compile(r'^[A-Za-z0-9_.\-]+$')
+ORDER = re.compile(r'^\d+$')
+RATE = re.compile(r'^\d+(\.\d+)?$')
+CONNECTOR_REF = re.compile(r'^(smppc|http)\((.+)\)$')
+# j_user_cred fields in the order Jptelnet.users(['update', uid, ...]) expects them
+CRED_FIELDS = [f for f in db.j_user_cred.fields if f not in ('id', 'juser')]
+PROGRESS_INTERVAL = 0.5     # seconds between progress lines within a phase
+
+
+class BulkImportError(Exception):
+    pass
+
+
+def load_import(text):
+    """{kind: [records]} from a JSON or CSV document"""
+    text = text.lstrip('\ufeff')    # BOM left by spreadsheet exports
+    if text.lstrip()[:1] in ('{', '['):
+        data = json.loads(text)
+        if isinstance(data, list):
+            spec = {}
+            for rec in data:
+                spec.setdefault(CSV_KINDS.get(rec.get('kind'), rec.get('kind')), []).append(rec)
+            data = spec
+        unknown = set(data) - set(KINDS)
+        if unknown:
+            raise BulkImportError('Unknown section(s): %s' % ', '.join(sorted(map(str, unknown))))
+        return dict((kind, list(data.get(kind) or [])) for kind in KINDS)
+    spec = dict((kind, []) for kind in KINDS)
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames or 'kind' not in reader.fieldnames:
+        raise BulkImportError("CSV needs a header row with a 'kind' column")
+    for line, row in enumerate(reader, 2):
+        kind = CSV_KINDS.get((row.pop('kind') or '').strip().lower())
+        if kind is None:
+            raise BulkImportError('Line %s: kind must be one of %s' % (line, ', '.join(CSV_KINDS)))
+        spec[kind].append(dict((k, v.strip()) for k, v in row.items() if k and v and v.strip()))
+    return spec
+
+
+def _list(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [v for v in re.split(r'[;,\s]+', str(value)) if v]
+
+def _str(rec, key, default=''):
+    value = rec.get(key, default)
+    return '' if value is None else str(value).strip()
+
+
+def known_objects():
+    """What already exists, locally or in Jasmin, that imported objects may refer to"""
+    known = dict(
+        groups=set(r.name for r in db(db.j_group).select(db.j_group.name)),
+        users=set(r.j_uid for r in db(db.j_user).select(db.j_user.j_uid)),
+        filters=set(r.fid for r in db(db.mt_filter).select(db.mt_filter.fid)),
+        smppcs=set(r.name for r in db(db.connector).select(db.connector.name)),
+        httpcs=set(r.hcon_cid for r in db(db.http_cons).select(db.http_cons.hcon_cid)),
+        mt_orders=set(r.mt_order for r in db(db.mtroute).select(db.mtroute.mt_order)),
+        mo_orders=set(r.mo_order for r in db(db.moroute).select(db.moroute.mo_order)),
+    )
+    listings = (('groups', 'groups', lambda t: t.gid.lstrip('!')),
+                ('users', 'users', lambda t: t.uid.lstrip('!')),
+                ('filters', 'filters', lambda t: t.fid),
+                ('smppcs', 'smppcs', lambda t: t.cid),
+                ('httpcs', 'httpcs', lambda t: t.cid),
+                ('mt_orders', 'mtrouter', lambda t: str(t.order)),
+                ('mo_orders', 'morouter', lambda t: str(t.order)))
+    for key, list_type, ident in listings:
+        known[key].update(ident(t) for t in parse_listing(list_type, jasmin.list_it(list_type)))
+    return known
+
+
+def validate(spec, known):
+    """Check every record, returns (plan, errors)
+
+    The plan holds normalised records with the jCli calls to make and the
+    imported objects each one depends on.
+    """
+    errors = []
+    plan = dict((kind, []) for kind in KINDS)
+    seen = dict((kind, set()) for kind in KINDS)
+
+    def error(kind, index, ident, message):
+        errors.append(dict(kind=kind, index=index, id=ident, error=message))
+
+    def name(kind, index, ident, value, field, length):
+        if not value:
+            error(kind, index, ident, '%s is required' % field)
+        elif len(value) > length:
+            error(kind, index, ident, '%s must be at most %s characters' % (field, length))
+        elif not NAME.match(value):
+            error(kind, index, ident, '%s must not contain spaces or special characters' % field)
+        else:
+            return True
+        return False
+
+    for i, rec in enumerate(spec['groups']):
+        gid = _str(rec, 'gid')
+        if not name('groups', i, gid, gid, 'gid', db.j_group.name.length):
+            continue
+        if gid in seen['groups'] or gid in known['groups']:
+            error('groups', i, gid, 'group %s already exists' % gid)
+            continue
+        seen['groups'].add(gid)
+        plan['groups'].append(dict(id=gid, needs=(), calls=[('users', ['create_group', gid])]))
+
+    for i, rec in enumerate(spec['users']):
+        uid = _str(rec, 'uid')
+        ok = name('users', i, uid, uid, 'uid', db.j_user.j_uid.length)
+        ok = name('users', i, uid, _str(rec, 'username'), 'username', db.j_user.username.length) and ok
+        ok = name('users', i, uid, _str(rec, 'password'), 'password', db.j_user.password.length) and ok
+        gid = _str(rec, 'gid')
+        if gid not in seen['groups'] and gid not in known['groups']:
+            error('users', i, uid, 'unknown group %r' % gid)
+            ok = False
+        extra = set(rec) - set(CRED_FIELDS) - set(('uid', 'username', 'password', 'gid', 'kind'))
+        if extra:
+            error('users', i, uid, 'unknown field(s) %s' % ', '.join(sorted(extra)))
+            ok = False
+        if uid in seen['users'] or uid in known['users']:
+            error('users', i, uid, 'user %s already exists' % uid)
+            ok = False
+        if not ok:
+            continue
+        seen['users'].add(uid)
+        creds = dict((f, _str(rec, f)) for f in CRED_FIELDS if _str(rec, f))
+        calls = [('users', ['create_user', uid, _str(rec, 'username'), _str(rec, 'password'), gid])]
+        if creds:
+            values = [creds.get(f, str(db.j_user_cred[f].default)) for f in CRED_FIELDS]
+            calls.append(('users', ['update', uid] + values))
+        plan['users'].append(dict(id=uid, username=_str(rec, 'username'), password=_str(rec, 'password'),
+                                  gid=gid, creds=creds, calls=calls,
+                                  needs=(('groups', gid),) if gid in seen['groups'] else ()))
+
+    for i, rec in enumerate(spec['filters']):
+        fid = _str(rec, 'fid')
+        ftype = _str(rec, 'type')
+        value = _str(rec, 'value')
+        ok = name('filters', i, fid, fid, 'fid', db.mt_filter.fid.length)
+        if ftype not in MT_FILTER_TYPES + MO_FILTER_TYPES:
+            error('filters', i, fid, 'type must be one of %s' % ', '.join(sorted(set(MT_FILTER_TYPES + MO_FILTER_TYPES))))
+            ok = False
+        elif ftype not in FILTER_VALUE_KEYS:
+            error('filters', i, fid, '%s filters cannot be created from the panel' % ftype)
+            ok = False
+        elif FILTER_VALUE_KEYS[ftype] and not value:
+            error('filters', i, fid, '%s needs a value' % ftype)
+            ok = False
+        elif len(value) > db.mt_filter.f_value.length:
+            error('filters', i, fid, 'value must be at most %s characters' % db.mt_filter.f_value.length)
+            ok = False
+        needs = ()
+        if ftype == 'UserFilter':
+            if value in seen['users']:
+                needs = (('users', value),)
+            elif value not in known['users']:
+                error('filters', i, fid, 'unknown user %r' % value)
+                ok = False
+        elif ftype == 'GroupFilter':
+            if value in seen['groups']:
+                needs = (('groups', value),)
+            elif value not in known['groups']:
+                error('filters', i, fid, 'unknown group %r' % value)
+                ok = False
+        if fid in seen['filters'] or fid in known['filters']:
+            error('filters', i, fid, 'filter %s already exists' % fid)
+            ok = False
+        if not ok:
+            continue
+        seen['filters'].add(fid)
+        plan['filters'].append(dict(id=fid, type=ftype, value=value, needs=needs,
+                                    calls=[('filters', ['create', fid, ftype, value])]))
+
+    for kind, types, orders in (('mt_routes', MTROUTE_TYPES, 'mt_orders'), ('mo_routes', MOROUTE_TYPES, 'mo_orders')):
+        for i, rec in enumerate(spec[kind]):
+            rtype = _str(rec, 'type')
+            default = rtype == 'DefaultRoute'
+            order = '0' if default else _str(rec, 'order')
+            ident = order or '#%s' % i
+            ok = True
+            if rtype not in types:
+                error(kind, i, ident, 'type must be one of %s' % ', '.join(types))
+                ok = False
+            if not ORDER.match(order):
+                error(kind, i, ident, 'order must be a number')
+                ok = False
+            elif order in seen[kind] or order in known[orders]:
+                error(kind, i, ident, 'a route with order %s already exists' % order)
+                ok = False
+            connectors = []
+            for c in _list(rec.get('connectors', rec.get('connector'))):
+                m = CONNECTOR_REF.match(c)
+                ctype, cid = m.groups() if m else ('smppc', c)
+                if cid not in known['smppcs' if ctype == 'smppc' else 'httpcs']:
+                    error(kind, i, ident, 'unknown connector %s(%s)' % (ctype, cid))
+                    ok = False
+                connectors.append((ctype, cid))
+            single = default or rtype.startswith('Static')
+            if not connectors or (single and len(connectors) > 1):
+                error(kind, i, ident, '%s takes %s connector' % (rtype, 'exactly one' if single else 'at least one'))
+                ok = False
+            filters = _list(rec.get('filters'))
+            needs = []
+            for fid in filters:
+                if fid in seen['filters']:
+                    needs.append(('filters', fid))
+                elif fid not in known['filters']:
+                    error(kind, i, ident, 'unknown filter %r' % fid)
+                    ok = False
+            if default and filters:
+                error(kind, i, ident, 'DefaultRoute takes no filters')
+                ok = False
+            elif not default and not filters:
+                error(kind, i, ident, '%s needs at least one filter' % rtype)
+                ok = False
+            rate = _str(rec, 'rate', '0') or '0'
+            if kind == 'mt_routes' and not RATE.match(rate):
+                error(kind, i, ident, 'rate must be a decimal number')
+                ok = False
+            if not ok:
+                continue
+            seen[kind].add(order)
+            refs = ['%s(%s)' % c for c in connectors]
+            if kind == 'mt_routes':
+                if default:
+                    call = ['DefaultRoute', refs[0], rate]
+                elif single:
+                    call = [rtype, order, refs[0], ';'.join(filters) + ';', rate]
+                else:
+                    call = [rtype, order, ';'.join(refs), ';'.join(filters), rate]
+                method = 'mtrouter'
+            else:
+                if default:
+                    call = ['DefaultRoute', refs[0]]
+                elif single:
+                    call = [rtype, order, refs[0], ';'.join(filters)]
+                else:
+                    call = [rtype, order, ';'.join(refs), ';'.join(filters)]
+                method = 'morouter'
+            plan[kind].append(dict(id=order, type=rtype, connectors=connectors, filters=filters, rate=rate,
+                                   needs=tuple(needs), calls=[(method, call)]))
+    return plan, errors
+
+
+async def _apply(client, item):
+    for method, data in item['calls']:
+        result = await getattr(client, method)(data)
+        if result:
+            return result
+    return None
+
+
+def save_rows(plan, done):
+    """Write the local rows for everything Jasmin accepted, committed by the caller in one transaction"""
+    for item in plan['groups']:
+        if ('groups', item['id']) in done and not db(db.j_group.name == item['id']).count():
+            db.j_group.insert(name=item['id'])
+    for item in plan['users']:
+        if ('users', item['id']) not in done:
+            continue
+        group = db(db.j_group.name == item['gid']).select(db.j_group.id).first()
+        db.j_user.update_or_insert(db.j_user.j_uid == item['id'], j_uid=item['id'], username=item['username'],
+                                   password=item['password'], j_group=group.id if group else None)
+        db.j_user_cred.update_or_insert(db.j_user_cred.juser == item['id'], juser=item['id'], **item['creds'])
+    for item in plan['filters']:
+        if ('filters', item['id']) in done:
+            db.mt_filter.update_or_insert(db.mt_filter.fid == item['id'], fid=item['id'],
+                                          filter_type=item['type'], f_value=item['value'])
+    fids = dict((r.fid, r.id) for r in db(db.mt_filter).select(db.mt_filter.id, db.mt_filter.fid))
+    smppcs = dict((r.name, r.id) for r in db(db.connector).select(db.connector.id, db.connector.name))
+    httpcs = dict((r.hcon_cid, r.id) for r in db(db.http_cons).select(db.http_cons.id, db.http_cons.hcon_cid))
+    for item in plan['mt_routes']:
+        if ('mt_routes', item['id']) in done:
+            db.mtroute.update_or_insert(db.mtroute.mt_order == item['id'], mt_order=item['id'], mt_type=item['type'],
+                                        mt_connectors=[smppcs[c] for t, c in item['connectors'] if c in smppcs],
+                                        mt_filters=[fids[f] for f in item['filters'] if f in fids],
+                                        mt_rate=item['rate'])
+    for item in plan['mo_routes']:
+        if ('mo_routes', item['id']) in done:
+            db.moroute.update_or_insert(db.moroute.mo_order == item['id'], mo_order=item['id'], mo_type=item['type'],
+                                        mo_connectors=[smppcs[c] for t, c in item['connectors'] if t == 'smppc' and c in smppcs],
+                                        mo_http_cons=[httpcs[c] for t, c in item['connectors'] if t == 'http' and c in httpcs],
+                                        mo_filters=[fids[f] for f in item['filters'] if f in fids])
+
+
+def run_import(spec, dry_run=False):
+    """Generator of progress events (dicts) for an import"""
+    started = time.monotonic()
+    plan, errors = validate(spec, known_objects())
+    counts = dict((kind, len(plan[kind])) for kind in KINDS)
+    yield dict(event='validated', counts=counts, errors=errors, elapsed=round(time.monotonic() - started, 3))
+    if errors or dry_run:
+        yield dict(event='done', applied=0, failed=0, skipped=0, persisted=False,
+                   aborted=bool(errors), elapsed=round(time.monotonic() - started, 3))
+        return
+    done, failed = set(), set()
+    skipped = 0
+    phases = {}
+    tasks, pending = {}, set()
+    persisted = False
+    persist_error = None
+    client = AsyncJptelnet(concurrency=settings.JCLI_IMPORT_CONCURRENCY, defer_persist=True)
+    loop = asyncio.new_event_loop()
+    try:
+        for kind in KINDS:
+            phase_started = time.monotonic()
+            tasks = {}
+            for item in plan[kind]:
+                if any(dep in failed for dep in item['needs']):
+                    failed.add((kind, item['id']))
+                    skipped += 1
+                    yield dict(event='skipped', kind=kind, id=item['id'], error='depends on an object that failed')
+                    continue
+                tasks[loop.create_task(_apply(client, item))] = item
+            total, ok, ko = len(tasks), 0, 0
+            pending = set(tasks)
+            while pending:
+                finished, pending = loop.run_until_complete(asyncio.wait(pending, timeout=PROGRESS_INTERVAL))
+                for task in finished:
+                    item = tasks[task]
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        result = 'Exception: %s' % e
+                    if result:
+                        ko += 1
+                        failed.add((kind, item['id']))
+                        yield dict(event='failed', kind=kind, id=item['id'], error=str(result).strip())
+                    else:
+                        ok += 1
+                        done.add((kind, item['id']))
+                yield dict(event='progress', phase=kind, done=ok + ko, total=total, failed=ko,
+                           elapsed=round(time.monotonic() - phase_started, 3))
+            phases[kind] = dict(applied=ok, failed=ko, elapsed=round(time.monotonic() - phase_started, 3))
+    finally:
+        # however the phases ended, what Jasmin accepted is persisted there and recorded here
+        try:
+            if pending:
+                loop.run_until_complete(asyncio.wait(pending))
+                for task in pending:
+                    if not task.cancelled() and task.exception() is None and not task.result():
+                        done.add((kind, tasks[task]['id']))
+            if done:
+                try:
+                    loop.run_until_complete(client.persist())
+                    persisted = True
+                except Exception as e:
+                    persist_error = str(e)
+        finally:
+            try:
+                # committed at once, nothing that fails after this may roll the rows back
+                save_rows(plan, done)
+                db.commit()
+            finally:
+                loop.run_until_complete(client.aclose())
+                loop.close()
+                jasmin.list_cache.invalidate()
+    if persist_error is not None:
+        yield dict(event='persist_failed', error=persist_error)
+    yield dict(event='done', applied=len(done), failed=len(failed) - skipped, skipped=skipped,
+               persisted=persisted, phases=phases, elapsed=round(time.monotonic() - started, 3))
+
+
+def start_import(spec, dry_run=False):
+    """Run an import in its own thread and DB transaction, returns the queue of its events, None is the last"""
+    events = queue.Queue()
+
+    def work():
+        try:
+            # a thread of its own, connect to db
+            db._adapter.reconnect()
+            for event in run_import(spec, dry_run):
+                events.put(event)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.exception('bulk import failed')
+            events.put(dict(event='done', error='Import failed: %s' % e))
+        finally:
+            db._adapter.close()
+            events.put(None)
+
+    threading.Thread(target=work, name='bulk-import').start()
+    return events
+
+
+def _stream(events):
+    while True:
+        event = events.get()
+        if event is None:
+            return
+        yield json.dumps(event) + '\n'
+
+
+@action('bulk_import', method=['GET', 'POST'])
+@action.uses(db, session, auth, flash, 'record_content.html')
+def bulk_import():
+    dry_run = request.query.get('dry_run') in ('1', 'true', 'yes')
+    text = None
+    upload = request.files.get('file') if request.method == 'POST' else None
+    if upload is not None:
+        text = upload.file.read().decode('utf-8')
+    elif request.method == 'POST' and request.content_type and \
+            request.content_type.split(';')[0] in ('application/json', 'text/csv'):
+        text = request.body.read().decode('utf-8')
+    if text is None:
+        form = Form([Field('data', 'text', label='Import data',
+                           comment='JSON or CSV with groups, users, filters, mt_routes and mo_routes. '
+                                   'Everything is checked before anything is sent to Jasmin'),
+                     Field('dry_run', 'boolean', label='Only validate')],
+                    dbio=False, formstyle=FormStyleBulma)
+        if not form.accepted:
+            return dict(content=form, title='Bulk import', caller='super_admin')
+        text = form.vars['data'] or ''
+        dry_run = dry_run or bool(form.vars['dry_run'])
+    try:
+        spec = load_import(text)
+    except (ValueError, BulkImportError) as e:
+        response.status = 400
+        response.headers['Content-Type'] = 'application/json'
+        return json.dumps(dict(event='done', error='Invalid import: %s' % e))
+    response.headers['Content-Type'] = 'application/x-ndjson'
+    response.headers['Cache-Control'] = 'no-cache'
+    return _stream(start_import(spec, dry_run))
@@ -13,6 +13,12 @@ from pydal.tools.tags import Tags
 from py4web.utils.factories import ActionFactory
 from . import settings
 from .jtel import Jptelnet
+from .jsampler import StatsSampler
+from .jrates import RateEngine
+from .jexport import MetricsExporter
+from .jtsdb import StatsStore
+from .jstream import StatsBroadcaster
+from .jalerts import AlertDetector, Webhook
 # #######################################################
 # implement custom loggers form settings.LOGGERS
 # #######################################################
@@ -191,3 +197,32 @@ unauthenticated = ActionFactory(db, session, T, flash, auth)
 authenticated = ActionFactory(db, session, T, flash, auth.user)
 
 jasmin = Jptelnet()
+
+# stats history for the stats pages, sampled in the background over its own jcli session
+stats_sampler = StatsSampler(jasmin, interval=settings.STATS_SAMPLE_INTERVAL,
+                             points=settings.STATS_HISTORY_POINTS, logger=logger)
+stats_rates = RateEngine(tau=settings.STATS_RATE_TAU)
+stats_sampler.listeners.append(stats_rates.feed)
+stats_exporter = MetricsExporter(stats_sampler)    # /metrics, rendered once per sample
+stats_store = StatsStore(settings.STATS_DB_FOLDER,
+                         raw_retention=settings.STATS_DB_RAW_RETENTION,
+                         minute_retention=settings.STATS_DB_MINUTE_RETENTION,
+                         hour_retention=settings.STATS_DB_HOUR_RETENTION,
+                         sources=settings.STATS_DB_SOURCES,
+                         max_metrics=settings.STATS_DB_MAX_METRICS)
+if settings.STATS_DB:
+    # every worker samples, the first one to write holds the folder and the others only read it
+    stats_sampler.listeners.append(stats_store.write)
+# live updates for the stats pages, after stats_rates so the streamed rates are current
+stats_broadcaster = StatsBroadcaster(stats_sampler, stats_rates, keepalive=settings.STATS_STREAM_KEEPALIVE,
+                                     max_clients=settings.STATS_STREAM_MAX_CLIENTS)
+stats_alerts = AlertDetector(stats_sampler,
+                             webhook=Webhook(settings.ALERT_WEBHOOK_URL, timeout=settings.ALERT_WEBHOOK_TIMEOUT,
+                                             logger=logger) if settings.ALERT_WEBHOOK_URL else None,
+                             baseline_tau=settings.ALERT_BASELINE_TAU, drop_ratio=settings.ALERT_DROP_RATIO,
+                             min_rate=settings.ALERT_MIN_RATE, hold=settings.ALERT_HOLD,
+                             stuck_after=settings.ALERT_STUCK_AFTER, error_ratio=settings.ALERT_ERROR_RATIO,
+                             min_errors=settings.ALERT_MIN_ERRORS, feed_size=settings.ALERT_FEED_SIZE,
+                             sender=stats_store.leader, logger=logger)    # one worker posts the webhooks
+if settings.STATS_SAMPLER:
+    stats_sampler.start()
@@ -4,7 +4,7 @@ from .common import db, Field, session, jasmin, T, cache, auth, logger, authenti
 from py4web.utils.form import Form, FormStyleBulma
 from pydal.validators import *
 from . common import jasmin
-from .utils import cols_split
+from .jparse import parse_listing
 
 @action('start_smpp_connector/<cid>')
 @action.uses(db, flash, session)
@@ -112,21 +112,13 @@ def remove_smpp_connector(cid):
 
 def list_smpp_connectors():
     connectors = []
-    rows=(jasmin.list_it('smppcs'))
-    lines=rows
-    if not lines:
-        return connectors
-    tt = cols_split(lines[2:-2])
-    n = len(rows[0])
-    connector={}
-    for row in tt:
-        connector={}
-        connector.update(
-                cid=row[0][1:],
-                status=row[1],
-                session=row[2],
-                starts=row[3],
-                stops=row[4]
+    for row in parse_listing('smppcs', jasmin.list_it('smppcs')):
+        connector = dict(
+                cid=row.cid,
+                status=row.status,
+                session=row.session,
+                starts=row.starts,
+                stops=row.stops
                 )
         connectors.append(connector)
     return connectors
@@ -179,16 +171,8 @@ def delete_http_con(cid):
     
 def http_cons():
     connectors = []
-    rows=(jasmin.list_it('httpcs'))
-    lines=rows
-    if not rows:
-        return connectors
-    tt = cols_split(lines[2:-2])
-    n = len(rows[0])
-    connector={}
-    for row in tt:
-        connector={}
-        connector = dict(cid=row[0][1:], c_type=row[1],method=row[2], baseurl=row[3])
+    for row in parse_listing('httpcs', jasmin.list_it('httpcs')):
+        connector = dict(cid=row.cid, c_type=row.type, method=row.method, baseurl=row.url)
         connectors.append(connector)
     return connectors
 
@@ -5,7 +5,7 @@ from py4web.utils.form import Form, FormStyleBulma
 from .models import MT_FILTER_TYPES
 from pydal.validators import *
 from . common import jasmin
-from .utils import cols_split
+from .jparse import parse_listing
 
 @action('db_filters', method=['GET', 'POST'])
 @action.uses(db, auth, session, flash, 'generic.html')
@@ -28,48 +28,14 @@ def delete_filter(fid):
 
 def list_filters():
     filters = []
-    rows=jasmin.list_it('filters')
-    if rows:
-        tt = cols_split(rows[2:-2])
-        for t in tt:
-            j_filter={}
-            description = ''
-            if t[1] =='UserFilter':
-                description=t[4][5:-2]
-            elif t[1] == 'GroupFilter':
-                description=t[4][5:-2]
-            elif t[1] == 'DestinationAddrFilter':
-                description=t[5][10:-2]
-            elif t[1] == 'SourceAddrFilter':
-                description=t[5][10:-2]
-            elif t[1] == 'ShortMessageFilter':
-                description=t[5][5:-2]
-            elif t[1] == 'DateIntervalFilter':
-                description=t[5][1:-2]
-            elif t[1] == 'TimeIntervalFilter':
-                description=t[5][1:-2]
-            elif t[1] == 'TagFilter':
-                description=t[5][5:-2]
-            elif t[1] == 'TransparentFilter':
-                    description=''
-            else:
-                description = ''
-            if len(t) == 5:
-                j_filter.update(
-                    filter_id=t[0][1:],
-                    filter_type=t[1],
-                    route=t[2],
-                    description=description
-                    )
-            else:
-                j_filter.update(
-                    filter_id=t[0][1:],
-                    filter_type=t[1],
-                    route=t[2]+"/"+t[3],
-                    description=description
-                    )
-        
-            filters.append(j_filter)
+    for t in parse_listing('filters', jasmin.list_it('filters')):
+        j_filter = dict(
+            filter_id=t.fid,
+            filter_type=t.type,
+            route='/'.join(t.routes),
+            description=t.value,
+            )
+        filters.append(j_filter)
     return filters
 
 @action('manage_filters', method=['GET', 'POST'])
@@ -5,7 +5,7 @@ from py4web.utils.form import Form, FormStyleBulma
 from pydal.validators import *
 from .models import MTROUTE_TYPES, MOROUTE_TYPES
 from . common import jasmin
-from .utils import cols_split
+from .jparse import parse_listing
 
 @action('imt_remove/<order>', method=['GET', 'POST'])
 def imt_remove(order):
@@ -23,39 +23,8 @@ def imt_remove(order):
    
 def get_imts():
     imts = []
-    rows=jasmin.list_it('imts')
-   
-    if rows:
-        tt = cols_split(rows[2:-2])
-        imt={}
-        for t in tt:
-            imt={'i_order':'','i_type':'', 'i_script':'','i_filter':''}
-            n = len(t)
-            imt.update(
-                i_order=t[0][1:],
-                i_type=t[1],
-                i_script=t[2]
-                )
-            i = 3
-            if t[1]=='StaticMTInterceptor':
-                while t[i][0] != '<':
-                    test = t[i][0]
-                    imt.update(
-                        i_script = imt['i_script'] +" "+t[i]
-                        )
-                    i += 1
-                while i < n:
-                    imt.update(
-                        i_filter = imt['i_filter']+ " "+t[i])
-                    i += 1
-                imts.append(imt)
-            else:
-                while i < n:
-                    imt.update(
-                        i_script = imt['i_script'] +" "+t[i]
-                        )
-                    i += 1
-                imts.append(imt)
+    for t in parse_listing('imts', jasmin.list_it('imts')):
+        imts.append(dict(i_order=str(t.order), i_type=t.type, i_script=t.script, i_filter=' '.join(t.filters)))
     return imts
 
 @action('manage_imts', method=['GET', 'POST'])
@@ -104,38 +73,8 @@ def imo_remove(order):
     
 def get_imos():
     imos = []
-    rows=jasmin.list_it('imos')
-    if rows:
-        tt = cols_split(rows[2:-2])
-        imo={}
-        for t in tt:
-            n = len(t)
-            imo={'i_order':'','i_type':'', 'i_script':'','i_filter':''}
-            imo.update(
-                i_order=t[0][1:],
-                i_type=t[1],
-                i_script=t[2]
-                )
-            i = 3
-            if t[1]=='StaticMOInterceptor':
-                while t[i][0] != '<':
-                    test = t[i][0]
-                    imo.update(
-                        i_script = imo['i_script'] +" "+t[i]
-                        )
-                    i += 1
-                while i < n:
-                    imo.update(
-                        i_filter = imo['i_filter']+ " "+t[i])
-                    i += 1
-                imos.append(imo)
-            else:
-                while i < n:
-                    imo.update(
-                        i_script = imo['i_script'] +" "+t[i]
-                        )
-                    i += 1
-                imos.append(imo)
+    for t in parse_listing('imos', jasmin.list_it('imos')):
+        imos.append(dict(i_order=str(t.order), i_type=t.type, i_script=t.script, i_filter=' '.join(t.filters)))
     return imos
 
 @action('manage_imos', method=['GET', 'POST'])
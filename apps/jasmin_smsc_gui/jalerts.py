@@ -0,0 +1,242 @@
+"""
+Anomaly alerts on the SMPP connector stats
+
+AlertDetector listens to the StatsSampler and keeps a handful of numbers per
+connector (no history), checked on every sample:
+
+    throughput_drop   submit_sm_request rate under drop_ratio x its EWMA baseline
+                      for 'hold' samples in a row, once the baseline reached min_rate
+    stuck             service started but the session not BOUND_* (smppccm -l)
+                      for stuck_after seconds
+    submit_errors     QoS + other submit_sm_resp errors in one interval above
+                      error_ratio of the submit_sm sent in it, and at least min_errors
+
+The baseline is frozen while a drop alert is firing, so a dead bind does not
+become the new normal. Raised and resolved alerts go to a bounded feed (the
+alerts page, alerts_feed) and, with ALERT_WEBHOOK_URL set, are POSTed there
+as JSON by a background thread. A local stand-in to try the webhook with:
+
+    python3 - <<'EOF'
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    class Hook(BaseHTTPRequestHandler):
+        def do_POST(self):
+            print(self.rfile.read(int(self.headers['Content-Length'])).decode())
+            self.send_response(204)
+            self.end_headers()
+    HTTPServer(('127.0.0.1', 8765), Hook).serve_forever()
+    EOF
+
+then set ALERT_WEBHOOK_URL = 'http://127.0.0.1:8765/' and POST to alerts_webhook_test.
+
+Every py4web worker runs its own sampler and detector, so the feed and its
+seq numbers are per worker process (alerts() reports the pid). Only one
+process POSTs to the webhook: the one 'sender' elects, in common.py the
+holder of the StatsStore writer lock.
+"""
+import json
+import math
+import os
+import queue
+import threading
+import time
+import urllib.request
+from collections import deque
+
+BOUND = ('BOUND_TRX', 'BOUND_TX', 'BOUND_RX')
+KINDS = ('throughput_drop', 'stuck', 'submit_errors')
+
+
+class Watch(object):
+    """What is remembered of one connector between two samples"""
+    __slots__ = ('t', 'submits', 'errors', 'baseline', 'below', 'unbound_since')
+
+    def __init__(self):
+        self.t = None
+        self.submits = None
+        self.errors = None
+        self.baseline = None
+        self.below = 0
+        self.unbound_since = None
+
+
+class Webhook(object):
+    """POSTs alert events as JSON from its own thread, so a slow receiver never holds up the sampler"""
+
+    def __init__(self, url, timeout = 5, queue_size = 100, logger = None):
+        self.url = url
+        self.timeout = timeout
+        self.logger = logger
+        self.queue = queue.Queue(queue_size)
+        self.counters = dict(sent=0, failed=0, dropped=0)
+        self.last_error = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def send(self, event):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='alerts-webhook', daemon=True)
+                self._thread.start()
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.counters['dropped'] += 1
+
+    def _run(self):
+        while True:
+            event = self.queue.get()
+            try:
+                self.post(event)
+                self.counters['sent'] += 1
+            except Exception as e:
+                self.counters['failed'] += 1
+                self.last_error = str(e)
+                if self.logger is not None:
+                    self.logger.warning('alerts webhook %s: %s', self.url, e)
+
+    def post(self, event):
+        """Deliver one event now, returns the HTTP status"""
+        body = json.dumps(event, default=str).encode()
+        request = urllib.request.Request(self.url, data=body, method='POST',
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return response.status
+
+    def metrics(self):
+        return dict(self.counters, url=self.url, queued=self.queue.qsize(), last_error=self.last_error)
+
+
+class AlertDetector(object):
+
+    def __init__(self, sampler, webhook = None, baseline_tau = 900, drop_ratio = 0.2, min_rate = 1.0,
+                 hold = 3, stuck_after = 60, error_ratio = 0.05, min_errors = 10, feed_size = 200,
+                 sender = None, logger = None):
+        self.sampler = sampler
+        self.webhook = webhook
+        self.sender = sender    # callable, True when this process is the one posting webhooks
+        self.baseline_tau = baseline_tau
+        self.drop_ratio = drop_ratio
+        self.min_rate = min_rate
+        self.hold = hold
+        self.stuck_after = stuck_after
+        self.error_ratio = error_ratio
+        self.min_errors = min_errors
+        self.logger = logger
+        self.watches = {}       # cid -> Watch
+        self.active = {}        # (kind, cid) -> firing alert
+        self.feed = deque(maxlen=feed_size)
+        self.seq = 0
+        self.counters = dict(raised=0, resolved=0, not_sent=0)
+        self._lock = threading.Lock()
+        sampler.listeners.append(self.observe)
+
+    def observe(self, timestamp, values):
+        snapshot = self.sampler.latest
+        sessions = snapshot.sessions if snapshot is not None and snapshot.taken_at == timestamp else {}
+        cids = set(cid for source, cid, counter in values if source == 'smppc')
+        cids.update(sessions)
+        with self._lock:
+            for cid in cids:
+                self.check(cid, timestamp, values, sessions.get(cid))
+            for cid in [cid for cid in self.watches if cid not in cids]:
+                del self.watches[cid]
+                for kind in KINDS:
+                    self.resolve(kind, cid, timestamp, 'connector removed')
+
+    def check(self, cid, t, values, session):
+        w = self.watches.get(cid)
+        if w is None:
+            w = self.watches[cid] = Watch()
+        submits = values.get(('smppc', cid, 'submit_sm_request'))
+        qos, other = values.get(('smppc', cid, 'qos_errors')), values.get(('smppc', cid, 'other_errors'))
+        errors = qos + other if qos is not None and other is not None else None
+
+        if w.t is not None and t > w.t and submits is not None and w.submits is not None:
+            dt = t - w.t
+            sent = submits - w.submits
+            if sent < 0:
+                sent = submits      # counter reset
+            rate = sent / dt
+            if w.baseline is None:
+                w.baseline = rate
+            collapsed = w.baseline >= self.min_rate and rate < self.drop_ratio * w.baseline
+            w.below = w.below + 1 if collapsed else 0
+            if w.below >= self.hold:
+                self.raise_alert('throughput_drop', cid, t, 'submit_sm rate %.2f/s, baseline %.2f/s' % (rate, w.baseline),
+                                 rate=round(rate, 3), baseline=round(w.baseline, 3))
+            elif not collapsed:
+                self.resolve('throughput_drop', cid, t, 'submit_sm rate %.2f/s' % rate)
+            if ('throughput_drop', cid) not in self.active:
+                w.baseline += (1.0 - math.exp(-dt / self.baseline_tau)) * (rate - w.baseline)
+
+            if errors is not None and w.errors is not None:
+                failed = errors - w.errors
+                if failed < 0:
+                    failed = errors
+                if failed >= self.min_errors and failed > self.error_ratio * max(sent, 1):
+                    self.raise_alert('submit_errors', cid, t, '%d submit_sm_resp errors for %d submits in %ds' % (failed, sent, dt),
+                                     errors=failed, submits=sent)
+                else:
+                    self.resolve('submit_errors', cid, t, '%d submit_sm_resp errors in %ds' % (failed, dt))
+
+        if session is not None:
+            if session.status == 'started' and session.session not in BOUND:
+                if w.unbound_since is None:
+                    w.unbound_since = t
+                if t - w.unbound_since >= self.stuck_after:
+                    self.raise_alert('stuck', cid, t, 'started but %s for %ds' % (session.session, t - w.unbound_since),
+                                     session=session.session, since=w.unbound_since)
+            else:
+                w.unbound_since = None
+                self.resolve('stuck', cid, t, 'session %s' % session.session)
+
+        w.t, w.submits, w.errors = t, submits, errors
+
+    def raise_alert(self, kind, cid, t, message, **data):
+        alert = self.active.get((kind, cid))
+        if alert is not None:
+            alert.update(data, message=message, last_seen=t)
+            return
+        alert = dict(data, kind=kind, cid=cid, state='firing', raised_at=t, last_seen=t, message=message)
+        self.active[(kind, cid)] = alert
+        self.counters['raised'] += 1
+        self.emit(dict(alert))
+
+    def resolve(self, kind, cid, t, message):
+        alert = self.active.pop((kind, cid), None)
+        if alert is None:
+            return
+        self.counters['resolved'] += 1
+        self.emit(dict(alert, state='resolved', resolved_at=t, message=message))
+
+    def emit(self, event):
+        self.seq += 1
+        event['seq'] = self.seq
+        self.feed.append(event)
+        if self.logger is not None:
+            self.logger.warning('alert %s %s %s: %s', event['state'], event['kind'], event['cid'], event['message'])
+        if self.webhook is not None:
+            if self.sender is None or self.sender():
+                self.webhook.send(event)
+            else:
+                self.counters['not_sent'] += 1     # another worker sends it
+
+    def alerts(self, since = 0):
+        """Firing alerts and the feed events after seq 'since'"""
+        with self._lock:
+            return dict(seq=self.seq, pid=os.getpid(), active=[dict(a) for a in self.active.values()],
+                        events=[e for e in self.feed if e['seq'] > since])
+
+    def test_webhook(self):
+        """POST a test event right away, returns the HTTP status"""
+        if self.webhook is None:
+            raise ValueError('ALERT_WEBHOOK_URL is not set')
+        return self.webhook.post(dict(kind='test', cid='', state='test', raised_at=time.time(),
+                                      message='alerts webhook test'))
+
+    def metrics(self):
+        with self._lock:
+            m = dict(self.counters, watched=len(self.watches), active=len(self.active), seq=self.seq, pid=os.getpid())
+        if self.webhook is not None:
+            m['webhook'] = self.webhook.metrics()
+        return m
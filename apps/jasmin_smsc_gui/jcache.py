@@ -0,0 +1,107 @@
+"""
+Read-through cache for jCli listings
+
+Listings are kept for 'ttl' seconds per list type. When several requests
+miss on the same list type at once only the first one talks to jCli, the
+others wait for its result (single-flight). Every mutation invalidates the
+list types it touches; a load that was already running when the
+invalidation came in still answers its waiters but is not stored, so a
+listing fetched before a change never outlives it.
+
+Expired entries are kept until replaced or invalidated so stale() can
+still answer while jCli is unreachable.
+"""
+import threading
+import time
+
+
+class _Flight(object):
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ListingCache(object):
+
+    def __init__(self, ttl = 30):
+        self.ttl = ttl
+        self._entries = {}      # key -> (expires, value)
+        self._flights = {}      # key -> _Flight currently loading it
+        self._generation = {}   # key -> bumped on every invalidation
+        self._lock = threading.Lock()
+        self.counters = dict(hits=0, misses=0, waits=0, loads=0, load_errors=0,
+                             invalidations=0, stale_loads=0, stale_reads=0)
+
+    def get(self, key, loader):
+        """Cached value for 'key', calls loader() at most once per miss across threads"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.counters['hits'] += 1
+                return entry[1]
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.counters['waits'] += 1
+                leader = False
+            else:
+                self.counters['misses'] += 1
+                flight = self._flights[key] = _Flight()
+                generation = self._generation.get(key, 0)
+                leader = True
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = loader()
+        except Exception as e:
+            flight.error = e
+        with self._lock:
+            del self._flights[key]
+            self.counters['loads'] += 1
+            if flight.error is not None:
+                self.counters['load_errors'] += 1
+            elif flight.value is None:
+                pass    # jCli was unreachable, try again on the next call
+            elif self._generation.get(key, 0) != generation:
+                self.counters['stale_loads'] += 1
+            elif self.ttl > 0:
+                self._entries[key] = (time.monotonic() + self.ttl, flight.value)
+        flight.done.set()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def stale(self, key):
+        """Last value stored for 'key' even if expired, None if never loaded or invalidated"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self.counters['stale_reads'] += 1
+            return entry[1]
+
+    def invalidate(self, *keys):
+        """Drop 'keys' (everything if none given)"""
+        with self._lock:
+            if not keys:
+                keys = set(self._entries) | set(self._flights) | set(self._generation)
+            for key in keys:
+                self._entries.pop(key, None)
+                self._generation[key] = self._generation.get(key, 0) + 1
+                self.counters['invalidations'] += 1
+
+    def metrics(self):
+        with self._lock:
+            m = dict(self.counters)
+            now = time.monotonic()
+            m.update(ttl=self.ttl,
+                     cached=sorted(k for k, (expires, value) in self._entries.items() if expires > now),
+                     loading=sorted(self._flights))
+        lookups = m['hits'] + m['misses'] + m['waits']
+        m['hit_rate'] = round((m['hits'] + m['waits']) / lookups, 4) if lookups else 0.0
+        return m
@@ -0,0 +1,117 @@
+"""
+Capacity planning from the stored connector stats
+
+For each SMPP connector the submit_sm_request history in the StatsStore is
+read as per minute rates (1m rollups) and summarised as peak, p95 and mean
+MPS. Against the connector's configured c_submit_throughput (0 is
+unlimited) that gives the headroom left at p95 and at peak, and for a target
+volume how many more binds of the same throughput it takes. c_res_to is used
+for the worst case number of submit_sm waiting for their response at peak.
+
+Users are checked against the connectors their MT routes can reach: a route
+applies to a user when its UserFilter/GroupFilter filters (if any) all
+match. A user whose HTTP or SMPP throughput quota is above the combined
+throughput of those connectors can be accepted faster than it can be sent.
+"""
+import math
+
+from .jtsdb import metric_name
+
+UNLIMITED = float('inf')
+
+
+def throughput(value):
+    """MPS from a throughput field: 'ND', '' and 0 are unlimited, None when unreadable"""
+    if value in (None, '', 'ND', 'None'):
+        return UNLIMITED
+    try:
+        mps = float(value)
+    except (TypeError, ValueError):
+        return None
+    return UNLIMITED if mps <= 0 else mps
+
+
+def quantile(values, q):
+    """q quantile of 'values' by linear interpolation, None when empty"""
+    if not values:
+        return None
+    values = sorted(values)
+    pos = (len(values) - 1) * q
+    low = int(pos)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (pos - low)
+
+
+def rate_profile(store, cid, start, end, step = 60):
+    """peak, p95 and mean submit_sm_request MPS of a connector between start and end"""
+    series = store.query(metric_name('smppc', cid, 'submit_sm_request'), start, end, step, 'rate')
+    rates = [r for t, r in series['points']]
+    return dict(points=len(rates), resolution=series['resolution'], step=series['step'],
+                peak=max(rates) if rates else None, p95=quantile(rates, 0.95),
+                mean=sum(rates) / len(rates) if rates else None)
+
+
+def plan_connector(profile, configured, res_to = None, target = None):
+    """Headroom and extra binds for one connector
+
+    'configured' is the c_submit_throughput MPS (see throughput()), 'target'
+    the MPS it should carry, by default its observed peak.
+    """
+    peak, p95 = profile['peak'], profile['p95']
+    target = target if target is not None else peak
+    plan = dict(profile, throughput=None if configured == UNLIMITED else configured, target=target,
+                headroom_p95=None, headroom_peak=None, utilisation_p95=None, extra_binds=None, inflight_at_peak=None)
+    if configured is not None and configured != UNLIMITED:
+        if p95 is not None:
+            plan['headroom_p95'] = configured - p95
+            plan['utilisation_p95'] = p95 / configured
+        if peak is not None:
+            plan['headroom_peak'] = configured - peak
+        if target is not None:
+            plan['extra_binds'] = max(0, int(math.ceil(target / configured)) - 1)
+    elif configured == UNLIMITED:
+        plan['extra_binds'] = 0
+    try:
+        if peak is not None and res_to is not None:
+            plan['inflight_at_peak'] = int(math.ceil(peak * float(res_to)))
+    except ValueError:
+        pass
+    return plan
+
+
+def route_applies(filters, uid, gid):
+    """True when the (type, value) filters of an MT route let the user's messages through"""
+    for ftype, value in filters:
+        if ftype == 'UserFilter' and value != uid:
+            return False
+        if ftype == 'GroupFilter' and value != gid:
+            return False
+    return True
+
+
+def quota_overcommit(users, routes, capacities):
+    """Users whose quota is above the combined throughput of the connectors they route to,
+    users without a quota ('ND') are left out
+
+    users:      [(uid, gid, http quota, smpps quota)] as stored (strings)
+    routes:     [([connector cid], [(filter type, filter value)])]
+    capacities: {cid: MPS} from throughput()
+    """
+    flagged = []
+    for uid, gid, http_quota, smpps_quota in users:
+        cids = set()
+        for connectors, filters in routes:
+            if route_applies(filters, uid, gid):
+                cids.update(connectors)
+        capacity = 0.0
+        for cid in cids:
+            mps = capacities.get(cid)
+            capacity += mps if mps is not None else 0.0
+        for kind, quota in (('http', throughput(http_quota)), ('smpps', throughput(smpps_quota))):
+            if quota is None or quota == UNLIMITED:
+                continue    # no quota set
+            if quota > capacity:
+                flagged.append(dict(uid=uid, gid=gid, quota_kind=kind, quota=quota,
+                                    capacity=None if capacity == UNLIMITED else capacity,
+                                    connectors=sorted(cids)))
+    return flagged
@@ -0,0 +1,103 @@
+"""
+OpenMetrics exposition of the Jasmin stats
+
+Rendered once per StatsSampler sample from its stats snapshot, so the
+metrics action only hands out the cached text and any number of scrapers
+adds no jCli load. Counters follow the OpenMetrics naming (family name in
+TYPE, samples with _total); the same text without '# EOF' and with the
+_total family names is kept for scrapers asking for the Prometheus text
+format 0.0.4.
+"""
+import threading
+import time
+
+from .jmetrics import escape_label
+
+OPENMETRICS = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+PROMETHEUS = 'text/plain; version=0.0.4; charset=utf-8'
+
+# (metric, help, record attribute) for each row of stats --smppcs and stats --users
+SMPPC_METRICS = (
+    ('jasmin_smppc_submit_sm_requests', 'submit_sm sent to the SMSC', 'submit_sm_request'),
+    ('jasmin_smppc_submit_sm_responses', 'submit_sm_resp received from the SMSC', 'submit_sm'),
+    ('jasmin_smppc_deliver_sm', 'deliver_sm received from the SMSC', 'deliver_sm'),
+    ('jasmin_smppc_data_sm', 'data_sm received from the SMSC', 'data_sm'),
+    ('jasmin_smppc_qos_errors', 'Submits refused by throttling', 'qos_errors'),
+    ('jasmin_smppc_other_errors', 'Submits failed for other reasons', 'other_errors'),
+)
+# smppsapi items that go up and down
+GAUGE_PREFIXES = ('bound_', 'connected_')
+# sampled values of other sources that are gauges too (stats --users)
+GAUGE_COUNTERS = ('smpp_bound',)
+
+
+def is_gauge(counter):
+    """True for a sampled value that goes up and down rather than counting"""
+    return counter in GAUGE_COUNTERS or counter.startswith(GAUGE_PREFIXES)
+
+
+class MetricsExporter(object):
+
+    def __init__(self, sampler):
+        self.sampler = sampler
+        self.sampled_at = None
+        self._bodies = {True: '', False: ''}
+        self._lock = threading.Lock()
+        sampler.listeners.append(self.refresh)
+
+    def refresh(self, timestamp, values = None):
+        snapshot = self.sampler.latest
+        bodies = dict((openmetrics, self.render(snapshot, openmetrics)) for openmetrics in (True, False))
+        with self._lock:
+            self._bodies = bodies
+            self.sampled_at = timestamp
+
+    def render(self, snapshot, openmetrics = True):
+        out = []
+
+        def family(name, kind, help, samples):
+            # samples: [(labels, value)]
+            if not samples:
+                return
+            typed = name if openmetrics or kind != 'counter' else name + '_total'
+            out.append('# HELP %s %s' % (typed, help))
+            out.append('# TYPE %s %s' % (typed, kind))
+            suffix = '_total' if kind == 'counter' else ''
+            for labels, value in samples:
+                out.append('%s%s%s %s' % (name, suffix, labels, value))
+
+        connectors = snapshot.smppcs
+        for name, help, attr in SMPPC_METRICS:
+            family(name, 'counter', help, [('{cid="%s"}' % escape_label(c.cid), getattr(c, attr))
+                                           for c in connectors if getattr(c, attr) is not None])
+        family('jasmin_smppc_bound', 'gauge', 'Connector bound to its SMSC (1) or not (0)',
+               [('{cid="%s"}' % escape_label(c.cid), 1 if c.bound_at != 'ND' and c.disconnected_at == 'ND' else 0)
+                for c in connectors])
+        users = snapshot.users
+        family('jasmin_user_smpp_bound_connections', 'gauge', 'SMPP sessions bound by the user',
+               [('{uid="%s"}' % escape_label(u.uid), u.smpp_bound) for u in users if u.smpp_bound is not None])
+        family('jasmin_user_http_requests', 'counter', 'HTTP API requests of the user',
+               [('{uid="%s"}' % escape_label(u.uid), u.http_requests) for u in users if u.http_requests is not None])
+        for source in ('smppsapi', 'httpapi'):
+            for item, value in sorted(getattr(snapshot, source).items()):
+                if not isinstance(value, int):
+                    continue    # dates and ND
+                name = 'jasmin_%s_%s' % (source, item[:-len('_count')] if item.endswith('_count') else item)
+                kind = 'gauge' if is_gauge(item) or not item.endswith('_count') else 'counter'
+                family(name, kind, '%s %s' % (source, item), [('', value)])
+        return '\n'.join(out)
+
+    def body(self, openmetrics = True):
+        """The cached exposition plus how fresh it is"""
+        with self._lock:
+            body, sampled_at = self._bodies[openmetrics], self.sampled_at
+        age = time.time() - sampled_at if sampled_at else None
+        up = 1 if age is not None and age < 3 * self.sampler.interval else 0
+        tail = ['# HELP jasmin_stats_up Stats sampled from jcli within the last 3 intervals',
+                '# TYPE jasmin_stats_up gauge', 'jasmin_stats_up %d' % up]
+        if sampled_at:
+            tail += ['# HELP jasmin_stats_sample_age_seconds Seconds since the stats were sampled',
+                     '# TYPE jasmin_stats_sample_age_seconds gauge', 'jasmin_stats_sample_age_seconds %.3f' % age]
+        if openmetrics:
+            tail.append('# EOF')
+        return (body + '\n' if body else '') + '\n'.join(tail) + '\n'
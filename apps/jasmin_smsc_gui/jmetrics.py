@@ -0,0 +1,145 @@
+"""
+Per command timing for jCli
+
+Every jCli command is tagged with its family (the first word sent: smppccm,
+mtrouter, user, stats, persist...) and its phases go into in-process
+histograms: connect and auth for new sessions, write, time to prompt and
+parse. render() prints them in the Prometheus text format; commands slower
+than the threshold are also kept in a short slow log.
+"""
+import threading
+import time
+from collections import deque
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0)
+
+
+def family_of(command):
+    """'smppccm' for b'smppccm -l\\r\\n', '' for an empty line"""
+    if isinstance(command, (bytes, bytearray)):
+        command = command.decode('ascii', 'replace')
+    word = command.split(None, 1)
+    return word[0] if word else ''
+
+
+class Histogram(object):
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)    # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = 0
+        for bound in self.buckets:
+            if value <= bound:
+                break
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, n in zip(self.buckets + (float('inf'),), self.counts):
+            total += n
+            yield bound, total
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q quantile, None when empty"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return bound
+        return float('inf')
+
+
+class CommandMetrics(object):
+
+    def __init__(self, slow_threshold = 2.0, slow_log_size = 100, logger = None):
+        self.slow_threshold = slow_threshold
+        self.slow_log = deque(maxlen=slow_log_size)
+        self.logger = logger
+        self.histograms = {}    # (family, phase) -> Histogram
+        self.commands = {}      # family -> count
+        self.errors = {}        # family -> count
+        self.received = {}      # family -> bytes
+        self._lock = threading.Lock()
+
+    def observe(self, family, phase, seconds):
+        with self._lock:
+            h = self.histograms.get((family, phase))
+            if h is None:
+                h = self.histograms[(family, phase)] = Histogram()
+            h.observe(seconds)
+
+    def command(self, family, command, write, prompt, received, error = None):
+        """Record a finished command: seconds spent writing, seconds until the prompt came back"""
+        with self._lock:
+            for phase, seconds in (('write', write), ('prompt', prompt)):
+                h = self.histograms.get((family, phase))
+                if h is None:
+                    h = self.histograms[(family, phase)] = Histogram()
+                h.observe(seconds)
+            self.commands[family] = self.commands.get(family, 0) + 1
+            self.received[family] = self.received.get(family, 0) + received
+            if error is not None:
+                self.errors[family] = self.errors.get(family, 0) + 1
+        if self.slow_threshold and prompt >= self.slow_threshold:
+            entry = dict(time=time.time(), family=family, command=command,
+                         seconds=round(prompt, 4), write=round(write, 4), bytes=received, error=error)
+            self.slow_log.append(entry)
+            if self.logger is not None:
+                self.logger.warning('slow jcli command %r: %.3fs, %d bytes%s', command, prompt, received,
+                                    ' (%s)' % error if error else '')
+
+    def quantile(self, family, phase, q):
+        with self._lock:
+            h = self.histograms.get((family, phase))
+            return h.quantile(q) if h is not None else None
+
+    def count(self, family, phase):
+        with self._lock:
+            h = self.histograms.get((family, phase))
+            return h.count if h is not None else 0
+
+    def families(self, phase):
+        with self._lock:
+            return sorted(f for f, p in self.histograms if p == phase)
+
+    def slow(self):
+        return list(self.slow_log)
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        out = []
+        with self._lock:
+            out.append('# HELP jcli_command_seconds Time spent per jcli command phase')
+            out.append('# TYPE jcli_command_seconds histogram')
+            for (family, phase), h in sorted(self.histograms.items()):
+                labels = 'family="%s",phase="%s"' % (escape_label(family), phase)
+                for bound, total in h.cumulative():
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    out.append('jcli_command_seconds_bucket{%s,le="%s"} %d' % (labels, le, total))
+                out.append('jcli_command_seconds_sum{%s} %r' % (labels, h.sum))
+                out.append('jcli_command_seconds_count{%s} %d' % (labels, h.count))
+            for name, kind, help, values in (
+                    ('jcli_commands_total', 'counter', 'jcli commands run', self.commands),
+                    ('jcli_command_errors_total', 'counter', 'jcli commands that did not get their prompt', self.errors),
+                    ('jcli_received_bytes_total', 'counter', 'Bytes read back from jcli', self.received)):
+                out.append('# HELP %s %s' % (name, help))
+                out.append('# TYPE %s %s' % (name, kind))
+                for family, value in sorted(values.items()):
+                    out.append('%s{family="%s"} %d' % (name, escape_label(family), value))
+            out.append('# HELP jcli_slow_commands Commands in the slow log')
+            out.append('# TYPE jcli_slow_commands gauge')
+            out.append('jcli_slow_commands %d' % len(self.slow_log))
+        return '\n'.join(out) + '\n'
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,479 @@
+"""
+Table parser for jCli listings
+
+jCli prints listings as fixed width columns: every cell is left justified to
+the width of its header title and a value that does not fit pushes the rest
+of the row to the right. Instead of splitting on whitespace and guessing from
+the number of tokens, the column offsets are read from the header line once
+and compiled into a regular expression; each row is then a single match.
+
+    users = parse_listing('users', jasmin.list_it('users'))
+    users[0].uid, users[0].throughput_http
+"""
+import ast
+import re
+import time
+from datetime import datetime
+
+# extra characters a cell may run over its width with
+OVERFLOW = r'\S*'
+OVERFLOW_LIST = r'(?:, |\S)*'  # 'smppc(a), smppc(b)' style lists
+
+
+class Route(object):
+    __slots__ = ('order', 'type', 'rate', 'connectors', 'filters')
+
+    def __init__(self, order, type, rate, connectors, filters):
+        self.order = int(order)
+        self.type = type
+        self.rate = rate    # as shown by jCli, e.g. '0.00' or '0 (!)' for unrated routes
+        self.connectors = [c for c in connectors.split(', ') if c]
+        self.filters = FILTER_REPR.findall(filters)
+
+
+class User(object):
+    __slots__ = ('uid', 'gid', 'username', 'balance', 'sms_count', 'throughput_http', 'throughput_smpp')
+
+    def __init__(self, uid, gid, username, balance, sms_count, throughput):
+        self.uid = uid
+        self.gid = gid
+        self.username = username
+        self.balance = balance
+        self.sms_count = sms_count
+        self.throughput_http, _, self.throughput_smpp = throughput.partition('/')
+
+    @property
+    def enabled(self):
+        return not self.uid.startswith('!')
+
+
+class Group(object):
+    __slots__ = ('gid',)
+
+    def __init__(self, gid):
+        self.gid = gid
+
+    @property
+    def enabled(self):
+        return not self.gid.startswith('!')
+
+
+class Connector(object):
+    __slots__ = ('cid', 'status', 'session', 'starts', 'stops')
+
+    def __init__(self, cid, status, session, starts, stops):
+        self.cid = cid
+        self.status = status
+        self.session = session
+        self.starts = _int(starts)
+        self.stops = _int(stops)
+
+
+class HttpConnector(object):
+    __slots__ = ('cid', 'type', 'method', 'url')
+
+    def __init__(self, cid, type, method, url):
+        self.cid = cid
+        self.type = type
+        self.method = method
+        self.url = url
+
+
+class Filter(object):
+    __slots__ = ('fid', 'type', 'routes', 'description')
+
+    def __init__(self, fid, type, routes, description):
+        self.fid = fid
+        self.type = type
+        self.routes = routes.split()    # ['MT'], ['MO', 'MT'], ...
+        self.description = description  # e.g. '<U (uid=sandra)>'
+
+    @property
+    def value(self):
+        """The value the filter was created with: 'sandra' for '<U (uid=sandra)>'"""
+        return filter_value(self.description)
+
+
+class Interceptor(object):
+    __slots__ = ('order', 'type', 'script', 'filters')
+
+    def __init__(self, order, type, script, filters):
+        self.order = int(order)
+        self.type = type
+        self.script = script
+        self.filters = FILTER_REPR.findall(filters)
+
+
+class ConnectorStats(object):
+    """A row of 'stats --smppcs'; counters are None when jCli shows ND"""
+    __slots__ = ('cid', 'connected_at', 'bound_at', 'disconnected_at', 'submit_sm_request', 'submit_sm',
+                 'deliver_sm', 'data_sm', 'qos_errors', 'other_errors')
+
+    def __init__(self, cid, connected_at, bound_at, disconnected_at, submits, delivers, qos_errors, other_errors):
+        self.cid = cid
+        self.connected_at = connected_at
+        self.bound_at = bound_at
+        self.disconnected_at = disconnected_at
+        self.submit_sm_request, self.submit_sm = _pair(submits)
+        self.deliver_sm, self.data_sm = _pair(delivers)
+        self.qos_errors = _int(qos_errors)
+        self.other_errors = _int(other_errors)
+
+
+class UserStats(object):
+    """A row of 'stats --users'"""
+    __slots__ = ('uid', 'smpp_bound', 'smpp_last_activity', 'http_requests', 'http_last_activity')
+
+    def __init__(self, uid, smpp_bound, smpp_last_activity, http_requests, http_last_activity):
+        self.uid = uid
+        self.smpp_bound = _int(smpp_bound)
+        self.smpp_last_activity = smpp_last_activity
+        self.http_requests = _int(http_requests)
+        self.http_last_activity = http_last_activity
+
+
+class StatItem(object):
+    """A row of 'stats --user=<uid>' (item, type, value) or of the '#Item Value'
+    outputs (stats --smppc=<cid>, --smppsapi, --httpapi), value typed by stat_value()"""
+    __slots__ = ('item', 'type', 'value')
+
+    def __init__(self, item, type, value):
+        self.item = item
+        self.type = type
+        self.value = stat_value(value)
+
+def _untyped_item(item, value):
+    return StatItem(item, '', value)
+
+
+FILTER_REPR = re.compile(r'<[^<>]*>')
+_FILTER_ARG = re.compile(r'\((.*)\)')
+
+def filter_value(description):
+    m = _FILTER_ARG.search(description)
+    if not m:
+        return ''
+    arg = m.group(1)
+    return arg.split('=', 1)[1] if '=' in arg else arg
+
+def _int(value):
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+def stat_value(text):
+    """int or float for counters, datetime for timestamps, dict for bound
+    connections, None for ND/None/an empty cell; anything else stays text"""
+    if text in ('', 'ND', 'None'):
+        return None
+    first = text[0]
+    if first.isdigit() or first == '-':
+        try:
+            return int(text)
+        except ValueError:
+            pass
+        try:
+            return float(text)
+        except ValueError:
+            pass
+        try:
+            return datetime.fromisoformat(text)
+        except ValueError:
+            pass
+    elif first == '{':
+        try:
+            return ast.literal_eval(text)   # {'bind_transmitter': 0, 'bind_receiver': 1, ...}
+        except (ValueError, SyntaxError):
+            pass
+    return text
+
+def _pair(value):
+    """(12, 10) for '12/10'"""
+    left, _, right = value.partition('/')
+    return _int(left), _int(right)
+
+
+# list type (as for Jptelnet.list_it) -> record and its (header title, overflow) columns
+LISTINGS = {
+    'users': (User, (('User id', OVERFLOW), ('Group id', OVERFLOW), ('Username', OVERFLOW),
+                     ('Balance', OVERFLOW), ('MT SMS', OVERFLOW), ('Throughput', OVERFLOW))),
+    'groups': (Group, (('Group id', OVERFLOW),)),
+    'smppcs': (Connector, (('Connector id', OVERFLOW), ('Service', OVERFLOW), ('Session', OVERFLOW),
+                           ('Starts', OVERFLOW), ('Stops', OVERFLOW))),
+    'httpcs': (HttpConnector, (('Httpcc id', OVERFLOW), ('Type', OVERFLOW), ('Method', OVERFLOW),
+                               ('URL', OVERFLOW))),
+    'mtrouter': (Route, (('Order', OVERFLOW), ('Type', OVERFLOW), ('Rate', r'(?: \(!\))?'),
+                         ('Connector ID(s)', OVERFLOW_LIST), ('Filter(s)', OVERFLOW))),
+    'morouter': (Route, (('Order', OVERFLOW), ('Type', OVERFLOW),
+                         ('Connector ID(s)', OVERFLOW_LIST), ('Filter(s)', OVERFLOW))),
+    'filters': (Filter, (('Filter id', OVERFLOW), ('Type', OVERFLOW), ('Routes', OVERFLOW),
+                         ('Description', OVERFLOW))),
+    'imts': (Interceptor, (('Order', OVERFLOW), ('Type', OVERFLOW), ('Script', OVERFLOW),
+                           ('Filter(s)', OVERFLOW))),
+    'imos': (Interceptor, (('Order', OVERFLOW), ('Type', OVERFLOW), ('Script', OVERFLOW),
+                           ('Filter(s)', OVERFLOW))),
+    'stats_smppcs': (ConnectorStats, (('Connector id', OVERFLOW), ('Connected at', OVERFLOW),
+                                      ('Bound at', OVERFLOW), ('Disconnected at', OVERFLOW),
+                                      ('Submits', OVERFLOW), ('Delivers', OVERFLOW),
+                                      ('QoS errs', OVERFLOW), ('Other errs', OVERFLOW))),
+    'stats_users': (UserStats, (('User id', OVERFLOW), ('SMPP Bound connections', OVERFLOW),
+                                ('SMPP L.A.', OVERFLOW), ('HTTP requests counter', OVERFLOW),
+                                ('HTTP L.A.', OVERFLOW))),
+    'stats_user': (StatItem, (('Item', OVERFLOW), ('Type', OVERFLOW), ('Value', OVERFLOW))),
+    'stats_items': (_untyped_item, (('Item', OVERFLOW), ('Value', OVERFLOW))),
+}
+
+
+class TableDecoder(object):
+    """Row decoder compiled from one listing header"""
+    __slots__ = ('record', 'pattern', 'columns')
+
+    def __init__(self, header, columns, record=None):
+        self.record = record
+        self.columns = [title for title, overflow in columns]
+        starts = self.locate(header, self.columns)
+        parts = ['#']
+        for i, (title, overflow) in enumerate(columns):
+            if i == len(columns) - 1:
+                parts.append('(.*)')
+            else:
+                width = starts[i + 1] - starts[i] - 1
+                if overflow is OVERFLOW_LIST:
+                    # a list cell never ends on ', ', let the separator go
+                    parts.append('(.{0,%d}?%s) ?' % (width, overflow))
+                else:
+                    parts.append('(.{0,%d}%s) ?' % (width, overflow))
+        self.pattern = re.compile(''.join(parts))
+
+    @staticmethod
+    def locate(header, titles):
+        """Offset of each title in the header, searched left to right"""
+        lowered = header.lower()
+        starts = []
+        pos = 1
+        for title in titles:
+            idx = lowered.find(title.lower(), pos)
+            if idx == -1:
+                raise ValueError('Column %r not found in header %r' % (title, header))
+            starts.append(idx)
+            pos = idx + len(title)
+        return starts
+
+    def values(self, line):
+        m = self.pattern.match(line)
+        if m is None:
+            return None
+        return [v.strip() for v in m.groups()]
+
+    def decode(self, line):
+        m = self.pattern.match(line)
+        if m is None:
+            return None
+        return self.record(*[v.strip() for v in m.groups()])
+
+    def decode_all(self, lines):
+        match = self.pattern.match
+        record = self.record
+        out = []
+        append = out.append
+        for line in lines:
+            m = match(line)
+            if m is not None:
+                append(record(*[v.strip() for v in m.groups()]))
+        return out
+
+
+class SplitDecoder(TableDecoder):
+    """Fallback when a header does not carry the expected titles: whitespace split,
+    the last column takes whatever is left"""
+
+    def __init__(self, columns, record=None):
+        self.record = record
+        self.columns = [title for title, overflow in columns]
+        self.pattern = None
+
+    def values(self, line):
+        values = line[1:].split(None, len(self.columns) - 1)
+        if not values:
+            return None
+        return values + [''] * (len(self.columns) - len(values))
+
+    def decode(self, line):
+        values = self.values(line)
+        return self.record(*values) if values is not None else None
+
+    def decode_all(self, lines):
+        out = []
+        for line in lines:
+            values = self.values(line)
+            if values is not None:
+                out.append(self.record(*values))
+        return out
+
+
+_decoders = {}
+
+def decoder_for(list_type, header):
+    """Compiled decoder for a listing, cached per (list type, header)"""
+    key = (list_type, header)
+    decoder = _decoders.get(key)
+    if decoder is None:
+        record, columns = LISTINGS[list_type]
+        try:
+            decoder = TableDecoder(header, columns, record)
+        except ValueError:
+            decoder = SplitDecoder(columns, record)
+        _decoders[key] = decoder
+    return decoder
+
+
+def _text_lines(response):
+    if response is None:
+        return []
+    if isinstance(response, (bytes, bytearray, memoryview)):
+        response = str(response, 'ascii', 'replace')    # no intermediate copy of a memoryview
+    if isinstance(response, str):
+        return response.replace('\r', '').split('\n')
+    return response
+
+
+def split_table(response):
+    """(header, data rows) of a listing: the first '#' line and the '#' lines after it"""
+    header = None
+    rows = []
+    for line in _text_lines(response):
+        if line.startswith('#'):
+            if header is None:
+                header = line
+            else:
+                rows.append(line)
+    return header, rows
+
+
+SNAPSHOT_KINDS = ('users', 'smppcs', 'smppsapi', 'httpapi')
+
+
+class StatsSnapshot(object):
+    """Every stats type read at one time, see Jptelnet.stats_snapshot"""
+    __slots__ = ('taken_at', 'users', 'smppcs', 'smppsapi', 'httpapi', 'sessions', 'connectors', 'elapsed')
+
+    def __init__(self, taken_at, responses):
+        self.taken_at = taken_at
+        self.users = parse_listing('stats_users', responses.get('users'))
+        self.smppcs = parse_listing('stats_smppcs', responses.get('smppcs'))
+        self.smppsapi = parse_items(responses.get('smppsapi'))
+        self.httpapi = parse_items(responses.get('httpapi'))
+        # cid -> Connector (status, session) from 'smppccm -l'
+        self.sessions = dict((c.cid, c) for c in parse_listing('smppcs', responses.get('sessions')))
+        self.connectors = {}    # cid -> stats --smppc items, when taken with details
+        self.elapsed = None
+
+    def values(self):
+        """Numeric counters as {(source, id, counter): value}"""
+        values = {}
+        for c in self.smppcs:
+            for counter in ('submit_sm_request', 'submit_sm', 'deliver_sm', 'data_sm', 'qos_errors', 'other_errors'):
+                values[('smppc', c.cid, counter)] = getattr(c, counter)
+        for u in self.users:
+            for counter in ('smpp_bound', 'http_requests'):
+                values[('user', u.uid, counter)] = getattr(u, counter)
+        for source in ('smppsapi', 'httpapi'):
+            for item, value in getattr(self, source).items():
+                if isinstance(value, (int, float)):
+                    values[(source, '', item)] = value
+        return values
+
+    def as_dict(self):
+        return dict(taken_at=self.taken_at, elapsed=self.elapsed,
+                    users=[_record(u) for u in self.users], smppcs=[_record(c) for c in self.smppcs],
+                    smppsapi=self.smppsapi, httpapi=self.httpapi,
+                    sessions=[_record(c) for c in self.sessions.values()], connectors=self.connectors)
+
+
+def _record(record):
+    return dict((name, getattr(record, name)) for name in record.__slots__)
+
+
+# jCli command family behind each list type, for timing
+LIST_FAMILY = {'users': 'user', 'groups': 'group', 'smppcs': 'smppccm', 'httpcs': 'httpccm',
+               'mtrouter': 'mtrouter', 'morouter': 'morouter', 'filters': 'filter',
+               'imts': 'mtinterceptor', 'imos': 'mointerceptor', 'stats_smppcs': 'stats', 'stats_users': 'stats',
+               'stats_user': 'stats', 'stats_items': 'stats'}
+on_parsed = None    # callback(family, seconds), set by jtel to feed the command metrics
+
+
+def parse_listing(list_type, response):
+    """Records for a jCli listing
+
+    'response' is what Jptelnet.list_it returns (a list of lines) or the raw
+    response as str/bytes/memoryview.
+    """
+    started = time.perf_counter()
+    header, rows = split_table(response)
+    if header is None:
+        return []
+    records = decoder_for(list_type, header).decode_all(rows)
+    if on_parsed is not None:
+        on_parsed(LIST_FAMILY.get(list_type, list_type), time.perf_counter() - started)
+    return records
+
+
+def parse_items(response):
+    """{item: value} for the two column '#Item Value' outputs (stats --smppc=<cid>, --smppsapi, --httpapi)"""
+    return dict((s.item, s.value) for s in parse_listing('stats_items', response))
+
+
+# 'stats --user=<uid>' as jCli prints it, for benchmark()
+SAMPLE_USER_STATS = """#Item                    Type         Value
+#bind_count              SMPP Server  12
+#submit_sm_count         SMPP Server  10453
+#last_activity_at        SMPP Server  2019-06-02 15:35:01
+#unbind_count            SMPP Server  11
+#qos_last_submit_sm_at   SMPP Server  ND
+#submit_sm_request_count SMPP Server  10460
+#deliver_sm_count        SMPP Server  2210
+#data_sm_count           SMPP Server  0
+#bound_connections_count SMPP Server  {'bind_transmitter': 0, 'bind_receiver': 1, 'bind_transceiver': 0}
+#last_activity_at        HTTP Api     2019-06-02 15:35:02.120443
+#balance_request_count   HTTP Api     3
+#rate_request_count      HTTP Api     0
+#qos_last_submit_sm_at   HTTP Api     None
+#connects_count          HTTP Api     120
+#submit_sm_request_count HTTP Api     98117
+"""
+
+
+def _split_style(lines):
+    # what stats.users_stats used to do: guess the value from the number of tokens
+    out = []
+    for t in lines:
+        r = t.split()
+        if len(r) == 4:
+            val = r[3]
+        elif r[0][1:4] == 'bou':
+            val = ' '.join(r[3:9])
+        else:
+            val = r[3] + ' ' + r[4]
+        out.append([r[0][1:], r[1] + r[2], val])
+    return out
+
+
+def benchmark(rounds = 20000):
+    """Per row cost of decoding 'stats --user=<uid>' rows to typed StatItems"""
+    header, rows = split_table(SAMPLE_USER_STATS)
+    decoder = decoder_for('stats_user', header)
+    for s in decoder.decode_all(rows):
+        print('%-24s %-12s %-28r' % (s.item, s.type, s.value))
+    print()
+    for name, run in (('header decoder, typed', lambda: decoder.decode_all(rows)),
+                      ('split on len(), strings', lambda: _split_style(rows))):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            run()
+        elapsed = time.perf_counter() - started
+        print('%-24s %8.3f us/row' % (name, elapsed * 1e6 / (rounds * len(rows))))
+
+
+if __name__ == '__main__':
+    benchmark()
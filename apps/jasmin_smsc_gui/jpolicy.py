@@ -0,0 +1,116 @@
+"""
+Connection policy for jCli: learned timeouts and a circuit breaker
+
+Timeouts are taken per command family from the latency jmetrics has seen
+(p99 of time to prompt times a safety factor, within bounds) instead of a
+fixed 20s, so a stuck Jasmin is noticed as soon as it is slower than it
+usually is.
+
+After 'threshold' consecutive failures the breaker opens and calls fail
+at once instead of tying up a worker. Once 'reset_timeout' has passed a
+single call is let through as a probe (half open): if it succeeds the
+breaker closes, if not it opens again for twice as long, up to
+'max_reset_timeout'.
+"""
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker(object):
+
+    def __init__(self, threshold = 3, reset_timeout = 10, max_reset_timeout = 120):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.backoff = reset_timeout
+        self.probe_started = None
+        self.counters = dict(opened=0, rejected=0, probes=0)
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True if a call may go ahead, False to fail fast"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == OPEN and now - self.opened_at >= self.backoff:
+                self.state = HALF_OPEN
+                self.probe_started = None
+            if self.state == HALF_OPEN:
+                # one probe at a time, a probe that never reported back is replaced
+                if self.probe_started is None or now - self.probe_started >= self.backoff:
+                    self.probe_started = now
+                    self.counters['probes'] += 1
+                    return True
+            self.counters['rejected'] += 1
+            return False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            if self.state != CLOSED:
+                self.state = CLOSED
+                self.backoff = self.reset_timeout
+                self.probe_started = None
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN:
+                self.backoff = min(self.backoff * 2, self.max_reset_timeout)
+                self._open()
+            elif self.state == CLOSED and self.failures >= self.threshold:
+                self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.probe_started = None
+        self.counters['opened'] += 1
+
+    def retry_in(self):
+        """Seconds until the next probe is allowed, 0 when closed"""
+        with self._lock:
+            if self.state == CLOSED:
+                return 0.0
+            return max(0.0, self.opened_at + self.backoff - time.monotonic())
+
+    def metrics(self):
+        retry_in = self.retry_in()
+        with self._lock:
+            m = dict(self.counters)
+            m.update(state=self.state, failures=self.failures, backoff=self.backoff, retry_in=round(retry_in, 3))
+        return m
+
+
+class ConnectionPolicy(object):
+    """Timeouts per command family from observed latency, plus the breaker"""
+
+    def __init__(self, metrics, default = 10, minimum = 2, maximum = 30, factor = 4, min_samples = 20,
+                 breaker = None):
+        self.metrics = metrics
+        self.default = default
+        self.minimum = minimum
+        self.maximum = maximum
+        self.factor = factor
+        self.min_samples = min_samples
+        self.breaker = breaker or CircuitBreaker()
+
+    def timeout(self, family, phase = 'prompt'):
+        if self.metrics.count(family, phase) < self.min_samples:
+            return self.default
+        p99 = self.metrics.quantile(family, phase, 0.99)
+        if p99 is None or p99 == float('inf'):
+            return self.maximum
+        return min(self.maximum, max(self.minimum, p99 * self.factor))
+
+    def snapshot(self):
+        timeouts = dict((f, round(self.timeout(f), 3)) for f in self.metrics.families('prompt'))
+        return dict(breaker=self.breaker.metrics(), timeouts=timeouts, default_timeout=self.default)
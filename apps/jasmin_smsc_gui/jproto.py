@@ -0,0 +1,127 @@
+"""
+Telnet protocol handling for jCli that does not depend on telnetlib
+
+TelnetCodec does no I/O: feed it raw bytes from the socket and it hands back
+the cooked text and whatever negotiation replies have to be written back.
+This way the same code serves the asyncio client and any blocking socket.
+The jCli exceptions live here too, so ajtel never has to import jtel (and
+telnetlib, gone from Python 3.13).
+"""
+
+IAC = bytes([255])  # Interpret As Command
+DONT = bytes([254])
+DO = bytes([253])
+WONT = bytes([252])
+WILL = bytes([251])
+SB = bytes([250])  # Subnegotiation Begin
+SE = bytes([240])  # Subnegotiation End
+TTYPE = bytes([24])  # Terminal type
+TTYPE_IS = bytes([0])
+TTYPE_SEND = bytes([1])
+NULL = bytes([0])
+
+TERMINAL_TYPE = b'mypython'
+
+# parser states
+_DATA, _IAC, _OPTION, _SB, _SB_IAC = range(5)
+
+
+class jCliSessionError(Exception):
+    pass
+
+
+class jCliKeyError(Exception):
+    pass
+
+
+class TelnetCodec(object):
+    """Strip and answer telnet option negotiation
+
+    Same policy as the old Jptelnet.process_option: agree to every option the
+    server asks for or offers and report 'mypython' as terminal type. Each
+    option is only answered when its state changes so we never loop.
+    """
+
+    def __init__(self, terminal_type=TERMINAL_TYPE):
+        self.terminal_type = terminal_type
+        self.state = _DATA
+        self.command = None
+        self.sb = bytearray()
+        self.local = set()    # options we agreed to perform (WILL)
+        self.remote = set()   # options we asked the server to perform (DO)
+
+    def feed(self, data):
+        """Returns (cooked data, replies to send)"""
+        if self.state == _DATA and 255 not in data:
+            # fast path, nearly all jCli output is plain text
+            return bytes(data).replace(NULL, b''), b''
+        cooked = bytearray()
+        replies = bytearray()
+        for byte in data:
+            c = bytes([byte])
+            if self.state == _DATA:
+                if c == IAC:
+                    self.state = _IAC
+                elif c != NULL:
+                    cooked += c
+            elif self.state == _IAC:
+                if c == IAC:
+                    cooked += c    # escaped 0xff
+                    self.state = _DATA
+                elif c in (DO, DONT, WILL, WONT):
+                    self.command = c
+                    self.state = _OPTION
+                elif c == SB:
+                    del self.sb[:]
+                    self.state = _SB
+                else:
+                    self.state = _DATA    # NOP, GA and friends carry no option
+            elif self.state == _OPTION:
+                replies += self.negotiate(self.command, c)
+                self.state = _DATA
+            elif self.state == _SB:
+                if c == IAC:
+                    self.state = _SB_IAC
+                else:
+                    self.sb += c
+            elif self.state == _SB_IAC:
+                if c == SE:
+                    replies += self.subnegotiate(bytes(self.sb))
+                    self.state = _DATA
+                else:
+                    self.sb += c
+                    self.state = _SB
+        return bytes(cooked), bytes(replies)
+
+    def negotiate(self, command, option):
+        if command == DO:
+            if option in self.local:
+                return b''
+            self.local.add(option)
+            return IAC + WILL + option
+        if command == DONT:
+            if option not in self.local:
+                return b''
+            self.local.discard(option)
+            return IAC + WONT + option
+        if command == WILL:
+            if option in self.remote:
+                return b''
+            self.remote.add(option)
+            return IAC + DO + option
+        if command == WONT:
+            if option not in self.remote:
+                return b''
+            self.remote.discard(option)
+            return IAC + DONT + option
+        return b''
+
+    def subnegotiate(self, payload):
+        if payload[:2] == TTYPE + TTYPE_SEND:
+            return IAC + SB + TTYPE + TTYPE_IS + self.terminal_type + IAC + SE
+        return b''
+
+
+def escape(data):
+    """Double any 0xff so it is not taken for IAC by the server"""
+    return data.replace(IAC, IAC + IAC)
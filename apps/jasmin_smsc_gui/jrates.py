@@ -0,0 +1,99 @@
+"""
+Per second rates from jCli stats counters
+
+Jasmin only reports cumulative counters. RateEngine is fed consecutive
+snapshots ({(source, id, counter): value} at a timestamp, e.g. from the
+StatsSampler) and keeps for every counter the last per second rate and an
+EWMA of it. The EWMA weight follows the time between samples (time
+constant 'tau' seconds), so irregular samples smooth the same way.
+
+A counter going down means the connector, or Jasmin, restarted: the new
+value is then taken as the increase since the restart instead of a
+negative rate. Gauges (jexport.is_gauge: bound sessions, connections) are
+not counters and get no rate.
+
+    rates.feed(time.time(), {('smppc', 'demo', 'submit_sm_request'): 1200})
+    rates.get('smppc', 'demo')    # {'submit_sm_request': {'rate': 9.5, 'ewma': 10.1, 'resets': 0}}
+    utilisation(10.1, '20')       # 50.5
+"""
+import math
+import threading
+
+from .jexport import is_gauge
+
+
+class Rate(object):
+    __slots__ = ('value', 'time', 'rate', 'ewma', 'resets')
+
+    def __init__(self, value, time):
+        self.value = value
+        self.time = time
+        self.rate = None
+        self.ewma = None
+        self.resets = 0
+
+    def as_dict(self):
+        return dict(rate=_round(self.rate), ewma=_round(self.ewma), resets=self.resets)
+
+
+def _round(value):
+    return round(value, 4) if value is not None else None
+
+
+class RateEngine(object):
+
+    def __init__(self, tau = 60):
+        self.tau = tau
+        self._rates = {}    # (source, id, counter) -> Rate
+        self._lock = threading.Lock()
+
+    def feed(self, timestamp, values):
+        """One snapshot of counters, None values are skipped"""
+        with self._lock:
+            for key, value in values.items():
+                if value is None or (isinstance(value, float) and math.isnan(value)) or is_gauge(key[2]):
+                    continue
+                r = self._rates.get(key)
+                if r is None:
+                    self._rates[key] = Rate(value, timestamp)
+                    continue
+                elapsed = timestamp - r.time
+                if elapsed <= 0:
+                    continue
+                increase = value - r.value
+                if increase < 0:
+                    r.resets += 1
+                    increase = value    # counted from zero again since the restart
+                r.rate = increase / elapsed
+                if r.ewma is None:
+                    r.ewma = r.rate
+                else:
+                    r.ewma += (1 - math.exp(-elapsed / self.tau)) * (r.rate - r.ewma)
+                r.value, r.time = value, timestamp
+
+    def get(self, source, id = ''):
+        """{counter: {'rate', 'ewma', 'resets'}} of one connector, user or API"""
+        with self._lock:
+            return dict((counter, r.as_dict()) for (s, rid, counter), r in self._rates.items()
+                        if s == source and rid == id)
+
+    def ewma(self, source, id, counter):
+        with self._lock:
+            r = self._rates.get((source, id, counter))
+            return r.ewma if r is not None else None
+
+    def forget(self, source, id):
+        with self._lock:
+            for key in [k for k in self._rates if k[0] == source and k[1] == id]:
+                del self._rates[key]
+
+
+def utilisation(rate, limit):
+    """Rate as a percentage of a configured throughput, None when unlimited (ND, 0) or unknown"""
+    try:
+        limit = float(limit)
+    except (TypeError, ValueError):
+        return None
+    if rate is None or limit <= 0:
+        return None
+    return round(100.0 * rate / limit, 2)
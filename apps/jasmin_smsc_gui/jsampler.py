@@ -0,0 +1,167 @@
+"""
+Background sampler for jCli stats
+
+A daemon thread takes a stats snapshot ('stats --smppcs', '--users',
+'--smppsapi' and '--httpapi' in one pipeline) every 'interval' seconds
+over one session of its own (outside the pool) and keeps every counter in an array('d') ring of 'points'
+samples, so memory stays at 8 bytes per counter per point whatever the
+uptime. All rings share one timestamp ring and one cursor; a counter that
+was not reported in a sample holds NaN there.
+
+    sampler = StatsSampler(jasmin, interval=10, points=360)   # one hour
+    sampler.start()
+    sampler.history('smppc', 'demo')    # {'times': [...], 'series': {'submit_sm': [...], ...}}
+"""
+import logging
+import math
+import threading
+import time
+from array import array
+
+from .jproto import jCliSessionError
+
+NAN = float('nan')
+
+
+class StatsSampler(object):
+
+    def __init__(self, jcli, interval = 10, points = 360, logger = None):
+        self.jcli = jcli
+        self.interval = interval
+        self.points = points
+        self.logger = logger or logging.getLogger(__name__)
+        self.times = array('d', [NAN] * points)
+        self.rings = {}         # (source, id, counter) -> array('d')
+        self.cursor = 0         # next slot to write
+        self.filled = 0
+        self.latest = None      # jparse.StatsSnapshot of the last sample
+        self.listeners = []     # callables(timestamp, {(source, id, counter): value}) run after each sample
+        self.counters = dict(samples=0, errors=0, reconnects=0, last_duration=0.0)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, name='jcli-stats-sampler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self._run_session()
+            except Exception:
+                # never let the thread die: history, /metrics, the streams and alerts all hang off it
+                self.counters['errors'] += 1
+                self.logger.exception('stats sampler failed, restarting')
+                self._stop.wait(self.interval)
+
+    def _run_session(self):
+        jcli = self.jcli
+        while not self._stop.is_set():
+            if not jcli.policy.breaker.allow():
+                self._stop.wait(self.interval)
+                continue
+            tn = jcli.open_session()
+            if not tn:
+                self.counters['errors'] += 1
+                self._stop.wait(self.interval)
+                continue
+            # the session state of Jptelnet is per thread, hold this one for every call made here
+            jcli.tn, jcli.held = tn, True
+            try:
+                while not self._stop.is_set():
+                    started = time.monotonic()
+                    self.sample_once()
+                    self.counters['last_duration'] = round(time.monotonic() - started, 4)
+                    self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+            except (jCliSessionError, OSError, EOFError) as e:
+                self.counters['errors'] += 1
+                self.counters['reconnects'] += 1
+                self.logger.warning('stats sampler: %s, reconnecting', e)
+            except Exception:
+                # a stats output we could not parse: drop the session, it may be out of step
+                self.counters['errors'] += 1
+                self.counters['reconnects'] += 1
+                self.logger.exception('stats sampler: sample failed, reconnecting')
+                self._stop.wait(self.interval)
+            finally:
+                jcli.tn, jcli.held = None, False
+                tn.close()
+
+    def sample_once(self):
+        """Take a stats snapshot on the current session and store it as one sample"""
+        snapshot = self.jcli.stats_snapshot(details = False)
+        if snapshot is None:
+            raise jCliSessionError('No stats from jCli')
+        values = snapshot.values()
+        self.record(snapshot.taken_at, dict(values))
+        self.latest = snapshot
+        for listener in self.listeners:
+            try:
+                listener(snapshot.taken_at, values)
+            except Exception:
+                self.counters['errors'] += 1
+                self.logger.exception('stats sampler: listener %r failed', listener)
+
+    def record(self, timestamp, values):
+        with self._lock:
+            pos = self.cursor
+            self.times[pos] = timestamp
+            for key, ring in self.rings.items():
+                value = values.pop(key, None)
+                ring[pos] = NAN if value is None else value
+            for key, value in values.items():
+                ring = self.rings[key] = array('d', [NAN] * self.points)
+                ring[pos] = NAN if value is None else value
+            self.cursor = (pos + 1) % self.points
+            self.filled = min(self.filled + 1, self.points)
+            self.counters['samples'] += 1
+            if self.cursor == 0:
+                # a connector or user gone for a whole lap takes no memory any more
+                for key in [k for k, ring in self.rings.items() if all(math.isnan(v) for v in ring)]:
+                    del self.rings[key]
+
+    def _order(self):
+        start = (self.cursor - self.filled) % self.points
+        return [(start + i) % self.points for i in range(self.filled)]
+
+    def history(self, source, id = '', since = None):
+        """Times and per counter values of one source, oldest first, None for missing samples"""
+        with self._lock:
+            order = self._order()
+            if since is not None:
+                order = [i for i in order if self.times[i] > since]
+            series = dict((counter, [None if math.isnan(ring[i]) else ring[i] for i in order])
+                          for (s, rid, counter), ring in self.rings.items() if s == source and rid == id)
+            return dict(times=[self.times[i] for i in order], series=series)
+
+    def delta(self, source, id, counter):
+        """Increase of a counter over the kept history, None with fewer than two samples"""
+        with self._lock:
+            ring = self.rings.get((source, id, counter))
+            if ring is None:
+                return None
+            values = [ring[i] for i in self._order() if not math.isnan(ring[i])]
+        if len(values) < 2:
+            return None
+        # a restart of Jasmin resets the counters, only count increases
+        return sum(max(0.0, b - a) for a, b in zip(values, values[1:]))
+
+    def span(self):
+        """Seconds covered by the kept history"""
+        with self._lock:
+            order = self._order()
+            return self.times[order[-1]] - self.times[order[0]] if len(order) > 1 else 0.0
+
+    def metrics(self):
+        with self._lock:
+            m = dict(self.counters)
+            m.update(interval=self.interval, points=self.points, filled=self.filled, series=len(self.rings),
+                     bytes=(len(self.rings) + 1) * self.points * self.times.itemsize,
+                     running=self._thread is not None and self._thread.is_alive())
+        return m
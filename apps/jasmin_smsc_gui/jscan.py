@@ -0,0 +1,108 @@
+"""
+Incremental prompt scanner for jCli responses
+
+Telnet.expect() runs its regex over the whole cooked buffer every time a
+chunk arrives, and telnetlib grows that buffer with bytes concatenation, so
+reading an N byte listing costs O(N^2). PromptScanner appends chunks to a
+bytearray and only searches the bytes received since the last pass (plus
+enough overlap for a prompt split across two chunks). The response is handed
+out as a memoryview on the buffer it was read into, without copying it.
+
+Run this file to benchmark it against the expect() approach:
+
+    python apps/jasmin_smsc_gui/jscan.py
+"""
+import re
+import time
+
+STANDARD_PROMPT = b'jcli :'
+INTERACTIVE_PROMPT = b'> '
+
+
+class PromptScanner(object):
+
+    def __init__(self, markers = (STANDARD_PROMPT,)):
+        self.markers = tuple(markers)
+        self.overlap = max(len(m) for m in self.markers) - 1
+        self.buffer = bytearray()
+        self.scanned = 0
+
+    def feed(self, data):
+        """Append a chunk, returns (marker index, end offset) of the first prompt or None"""
+        self.buffer += data
+        return self.scan()
+
+    def scan(self):
+        start = max(0, self.scanned - self.overlap)
+        found = None
+        first = -1
+        for i, marker in enumerate(self.markers):
+            idx = self.buffer.find(marker, start)
+            if idx != -1 and (first == -1 or idx < first):
+                first = idx
+                found = (i, idx + len(marker))
+        self.scanned = len(self.buffer)
+        return found
+
+    def take(self, end):
+        """Response up to 'end' as a memoryview, what follows it stays buffered for the next read"""
+        data = self.buffer
+        self.buffer = bytearray(data[end:])
+        self.scanned = 0
+        return memoryview(data)[:end]
+
+    def pending(self):
+        """Unread bytes, emptying the scanner"""
+        data = bytes(self.buffer)
+        self.buffer = bytearray()
+        self.scanned = 0
+        return data
+
+
+def _chunks(size, chunk = 4096):
+    row = b'#sandra_%06d          grp1             sandra           ND      ND      ND/ND\r\n'
+    body = row * (size // len(row) + 1)
+    body = body[:max(0, size - len(STANDARD_PROMPT) - 1)] + STANDARD_PROMPT + b' '
+    view = memoryview(body)
+    return [view[i:i + chunk] for i in range(0, len(body), chunk)]
+
+
+def _expect_style(chunks):
+    # what Telnet.expect does: grow bytes, re-run the regex over all of it
+    prompt = re.compile(STANDARD_PROMPT)
+    cooked = b''
+    for chunk in chunks:
+        cooked = cooked + chunk
+        m = prompt.search(cooked)
+        if m:
+            return cooked[:m.end()]
+
+def _scanner(chunks):
+    scanner = PromptScanner((STANDARD_PROMPT, INTERACTIVE_PROMPT))
+    for chunk in chunks:
+        found = scanner.feed(chunk)
+        if found:
+            return scanner.take(found[1])
+
+
+def benchmark(sizes = (1 << 10, 10 << 10, 100 << 10, 1 << 20, 10 << 20, 50 << 20), expect_limit = 10 << 20):
+    print('%12s %14s %10s %14s %10s' % ('bytes', 'scanner s', 'ns/byte', 'expect() s', 'ns/byte'))
+    for size in sizes:
+        chunks = _chunks(size)
+        started = time.perf_counter()
+        response = _scanner(chunks)
+        scan = time.perf_counter() - started
+        assert len(response) == size - 1    # the space after the prompt stays buffered
+        line = '%12d %14.6f %10.2f' % (size, scan, scan * 1e9 / size)
+        if size <= expect_limit:
+            started = time.perf_counter()
+            _expect_style(chunks)
+            naive = time.perf_counter() - started
+            line += ' %14.6f %10.2f' % (naive, naive * 1e9 / size)
+        else:
+            line += ' %14s %10s' % ('skipped', '-')
+        print(line)
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,100 @@
+"""
+Server-sent events for the stats pages
+
+StatsBroadcaster listens to the StatsSampler, so however many dashboards
+are open the stats are still read from jCli once per interval. Each
+sample is flattened to {metric: value} (metric names as in jtsdb, plus
+'rate.<metric>' for the smoothed rates the pages show) and only what
+changed since the previous sample is pushed:
+
+    event: snapshot     everything, on connect and for a client that fell behind
+    event: delta        {"seq": 12, "t": 1700000000.0, "values": {"smppc.demo.submit_sm": 1204}}
+
+A key whose connector or user went away is sent with a null value.
+"""
+import json
+import threading
+import time
+
+from .jtsdb import metric_name
+
+# counters whose smoothed rate is streamed too
+RATE_COUNTERS = (('smppc', 'submit_sm_request'), ('user', 'http_requests'))
+
+
+class TooManyClients(Exception):
+    pass
+
+
+class StatsBroadcaster(object):
+
+    def __init__(self, sampler, rates = None, keepalive = 15, max_clients = 50):
+        self.sampler = sampler
+        self.rates = rates
+        self.keepalive = keepalive
+        self.max_clients = max_clients
+        self.seq = 0
+        self.sampled_at = None
+        self.state = {}
+        self.delta = {}
+        self.clients = 0
+        self.counters = dict(connects=0, refused=0, events=0)
+        self._cond = threading.Condition()
+        sampler.listeners.append(self.publish)
+
+    def publish(self, timestamp, values):
+        state = {}
+        for (source, id, counter), value in values.items():
+            name = metric_name(source, id, counter)
+            state[name] = value
+            if self.rates is not None and (source, counter) in RATE_COUNTERS:
+                rate = self.rates.ewma(source, id, counter)
+                state['rate.' + name] = round(rate, 3) if rate is not None else None
+        with self._cond:
+            delta = dict((k, v) for k, v in state.items() if k not in self.state or self.state[k] != v)
+            delta.update((k, None) for k in self.state if k not in state)
+            self.state, self.delta = state, delta
+            self.sampled_at = timestamp
+            self.seq += 1
+            self._cond.notify_all()
+
+    def _event(self, kind, seq, values):
+        self.counters['events'] += 1
+        data = json.dumps(dict(seq=seq, t=self.sampled_at, values=values), separators=(',', ':'))
+        return 'id: %d\nevent: %s\ndata: %s\n\n' % (seq, kind, data)
+
+    def stream(self):
+        """SSE text chunks for one client, raises TooManyClients when full"""
+        with self._cond:
+            if self.clients >= self.max_clients:
+                self.counters['refused'] += 1
+                raise TooManyClients('%d stats streams open' % self.clients)
+            self.clients += 1
+            self.counters['connects'] += 1
+        return self._stream()
+
+    def _stream(self):
+        try:
+            yield 'retry: 5000\n\n'
+            seen = None
+            while True:
+                with self._cond:
+                    if self.seq == seen:
+                        self._cond.wait(self.keepalive)
+                    seq, state, delta = self.seq, self.state, self.delta
+                if seq == seen:
+                    yield ': keepalive %d\n\n' % int(time.time())
+                elif seen is not None and seq == seen + 1:
+                    yield self._event('delta', seq, delta)
+                elif state:
+                    yield self._event('snapshot', seq, state)
+                seen = seq
+        finally:
+            with self._cond:
+                self.clients -= 1
+
+    def metrics(self):
+        with self._cond:
+            m = dict(self.counters)
+            m.update(clients=self.clients, max_clients=self.max_clients, seq=self.seq, keys=len(self.state))
+        return m
@@ -1,60 +1,514 @@
-import json, struct, time, argparse, re, socket, sys
+import json, struct, time, argparse, re, socket, sys, threading, functools, selectors, logging, contextlib
+from collections import deque
 from telnetlib import Telnet, IAC, DO, DONT, WILL, WONT, SB, SE, TTYPE
 from . import settings
+from .jcache import ListingCache
+from .jscan import PromptScanner
+from .jproto import TelnetCodec, jCliSessionError, jCliKeyError
+from .jmetrics import CommandMetrics, family_of
+from .jpolicy import ConnectionPolicy, CircuitBreaker
+from . import jparse
 
 
 # Configuration
-TELNET_TIMEOUT = 5  # reasonable value for intranet.
+TELNET_TIMEOUT = 5  # reasonable value for intranet, used to connect
 ###############################################################################
 #                            Other settings                                    #
 ################################################################################
 STANDARD_PROMPT = 'jcli : '  # There should be no need to change this
 INTERACTIVE_PROMPT ='> '  # Prompt for interactive commands
+CACHED_LISTINGS = ('smppcs', 'imos', 'imts', 'httpcs', 'mtrouter', 'morouter', 'filters', 'users', 'groups')
 
-class jCliSessionError(Exception):
-    pass
+def lines(response):
+    """Lines of a jCli response, decoded straight from a bytes object or memoryview"""
+    return str(response, 'ascii').strip().replace("\r", '').split("\n")
 
-class jCliKeyError(Exception):
+class jCliUnavailable(jCliSessionError):
+    """jCli could not be reached, or the circuit breaker is open"""
     pass
 
+class JcliSession(Telnet):
+    """An authenticated jCli telnet connection that can be handed back to a JcliPool
+
+    'dirty' is set on every write and cleared once the standard prompt has been
+    read back, so a session is only reused when nothing is left unread on it.
+    """
+
+    def __init__(self, host, port, timeout = TELNET_TIMEOUT):
+        Telnet.__init__(self, host, port, timeout)
+        self.created = self.last_used = time.monotonic()
+        self.dirty = False
+        self.codec = None   # negotiation after login, when reads bypass telnetlib
+        self.command = None
+        self.command_started = self.write_time = 0.0
+        self.received = 0
+
+    def write(self, buffer):
+        started = time.perf_counter()
+        if not self.dirty:
+            # at the prompt, this starts a new command
+            self.command = buffer.split(b"\r", 1)[0].decode('ascii', 'replace')
+            self.command_started = started
+            self.write_time = 0.0
+            self.received = 0
+        self.dirty = True
+        Telnet.write(self, buffer)
+        self.write_time += time.perf_counter() - started
+
+    def finish_command(self):
+        """(command, seconds writing, seconds until now, bytes read) of the command in progress"""
+        timing = (self.command or '', self.write_time,
+                  time.perf_counter() - self.command_started, self.received)
+        self.command = None
+        return timing
+
+    def read_prompt(self, markers, to = 20):
+        """Read until one of the literal 'markers' shows up
+
+        Returns (marker index, memoryview of the response up to and including
+        it) or (-1, None) on timeout. Unlike expect() this reads the socket
+        directly and only scans each new chunk once, see jscan.
+        """
+        if self.codec is None:
+            self.codec = TelnetCodec()
+        scanner = PromptScanner(markers)
+        # whatever telnetlib already read in goes first
+        self.process_rawq()
+        found = scanner.feed(self.cookedq)
+        self.cookedq = b''
+        deadline = time.monotonic() + to
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.sock, selectors.EVENT_READ)
+            while found is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not selector.select(remaining):
+                    self.cookedq = scanner.pending()
+                    return -1, None
+                chunk = self.sock.recv(65536)
+                if not chunk:
+                    self.eof = 1
+                    self.cookedq = scanner.pending()
+                    raise EOFError('jCli closed the connection')
+                cooked, replies = self.codec.feed(chunk)
+                if replies:
+                    self.sock.sendall(replies)
+                found = scanner.feed(cooked)
+        idx, end = found
+        view = scanner.take(end)
+        self.received += len(view)
+        self.cookedq = scanner.pending()
+        return idx, view
+
+    def login(self, username, password, to = 16):
+        self.read_until(b"Authentication required.", to)
+        self.write(b"\r\n")
+        self.read_until(b"Username:", to)
+        self.write(username.encode('ascii') +b"\r\n")
+        self.read_until(b"Password:", to)
+        self.write(password.encode('ascii') +b"\r\n")
+        idx, obj, response = self.expect([rb'Welcome to Jasmin ([0-9a-z\.]+) console'], to)
+        if idx == -1:
+            return False
+        idx, obj, response = self.expect([rb'jcli :'], to)
+        if idx == -1:
+            return False
+        self.dirty = False
+        return True
+
+    def is_alive(self):
+        """True if the socket is still open and nothing unsolicited is waiting on it"""
+        if self.get_socket() is None:
+            return False
+        try:
+            stray = self.read_very_eager()
+        except (EOFError, OSError):
+            return False
+        # the prompt pattern leaves the trailing space of 'jcli : ' behind
+        return not stray.strip()
+
+    def ping(self, to = 2):
+        self.write(b"\r\n")
+        idx, obj, response = self.expect([rb'jcli :'], to)
+        if idx == -1:
+            return False
+        self.dirty = False
+        return True
+
+
+class JcliPool(object):
+    """Keeps up to 'size' authenticated jCli sessions warm between requests
+
+    Sessions are checked on checkout: closed sockets, sessions with unread
+    output and sessions that were left mid-command are thrown away and
+    replaced, sessions idle longer than 'max_idle' seconds are pinged first.
+    """
+
+    def __init__(self, factory, size = 4, max_idle = 60, wait = 16):
+        self.factory = factory
+        self.size = size
+        self.max_idle = max_idle
+        self.wait = wait
+        self._idle = deque()
+        self._busy = 0
+        self._cond = threading.Condition()
+        self.counters = dict(checkouts=0, hits=0, misses=0, reconnects=0,
+                             discarded=0, waits=0, wait_time=0.0, failures=0)
+
+    def _healthy(self, tn):
+        if tn.dirty or not tn.is_alive():
+            return False
+        if time.monotonic() - tn.last_used > self.max_idle:
+            try:
+                return tn.ping()
+            except (OSError, EOFError):
+                return False
+        return True
+
+    def _discard(self, tn):
+        self.counters['discarded'] += 1
+        try:
+            tn.close()
+        except OSError:
+            pass
+
+    def acquire(self):
+        started = time.monotonic()
+        stale = 0
+        with self._cond:
+            self.counters['checkouts'] += 1
+        while True:
+            with self._cond:
+                while not self._idle and self._busy >= self.size:
+                    remaining = self.wait - (time.monotonic() - started)
+                    if remaining <= 0 or not self._cond.wait(remaining):
+                        self._waited(started)
+                        raise jCliSessionError('No jCli session available after %ss (pool size %s)' % (self.wait, self.size))
+                self._busy += 1
+                tn = self._idle.pop() if self._idle else None
+            if tn is None:
+                break
+            # checked outside the lock, a ping can take seconds and must not hold up other threads
+            if self._healthy(tn):
+                with self._cond:
+                    self.counters['hits'] += 1
+                    self._waited(started)
+                return tn
+            with self._cond:
+                self._busy -= 1
+                self._discard(tn)
+                self._cond.notify()
+            stale += 1
+        with self._cond:
+            self.counters['misses'] += 1
+            self.counters['reconnects'] += stale
+            self._waited(started)
+        # log in outside the lock, other threads can still use idle sessions
+        try:
+            tn = self.factory()
+        except Exception:
+            tn = None
+        if not tn:
+            with self._cond:
+                self._busy -= 1
+                self.counters['failures'] += 1
+                self._cond.notify()
+        return tn
+
+    def _waited(self, started):
+        waited = time.monotonic() - started
+        if waited > 0.001:
+            self.counters['waits'] += 1
+        self.counters['wait_time'] += waited
+
+    def release(self, tn):
+        with self._cond:
+            self._busy -= 1
+            if tn.dirty or len(self._idle) >= self.size:
+                self._discard(tn)
+            else:
+                tn.last_used = time.monotonic()
+                self._idle.append(tn)
+            self._cond.notify()
+
+    def close_all(self):
+        with self._cond:
+            while self._idle:
+                self._discard(self._idle.pop())
+
+    def metrics(self):
+        with self._cond:
+            m = dict(self.counters)
+            m.update(size=self.size, idle=len(self._idle), busy=self._busy)
+        m['hit_rate'] = round(m['hits'] / m['checkouts'], 4) if m['checkouts'] else 0.0
+        m['avg_wait'] = round(m['wait_time'] / m['checkouts'], 6) if m['checkouts'] else 0.0
+        return m
+
+
+class JcliBatch(object):
+    """Queue Jptelnet mutations and apply them over one session with a single persist
+
+        with jasmin.batch() as batch:
+            batch.filters(['create', 'f1', 'UserFilter', 'sandra'])
+            batch.mtrouter(['StaticMTRoute', '10', 'smppc(demo)', 'f1;', '0'])
+        batch.result
+
+    Operations run in order and stop at the first one Jasmin refuses; what
+    was applied before it is still persisted.
+    """
+    MUTATIONS = ('interceptor', 'morouter', 'mtrouter', 'filters', 'users', 'connector', 'http_cons')
+
+    def __init__(self, jcli):
+        self.jcli = jcli
+        self.ops = []
+        self.result = None
+
+    def __getattr__(self, name):
+        if name not in self.MUTATIONS:
+            raise AttributeError(name)
+        return lambda data: self.add(name, data)
+
+    def add(self, method, data):
+        if method not in self.MUTATIONS:
+            raise jCliKeyError('Cannot batch %s' % method)
+        self.ops.append((method, data))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        return False
+
+    def commit(self):
+        self.result = self.jcli.apply_batch(self.ops)
+        self.ops = []
+        return self.result
+
+
+READ_ACTIONS = ('show', 'get_creds')
+
+def releases_session(method):
+    """Hand the session back to the pool however the jCli call ends
+
+    When jCli is unavailable reads answer None and mutations the error
+    message, like a command Jasmin refused.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        except jCliUnavailable as e:
+            self.outcome = str(e)
+            if method.__name__ in ('fetch_list', 'stats', 'stats_snapshot') or (args and args[0] and args[0][0] in READ_ACTIONS):
+                return None
+            return str(e)
+        finally:
+            self.close_connection()
+    return wrapper
+
+
+def invalidates(*list_types, unless = ()):
+    """Drop the cached listings a mutation touches, 'unless' names read only actions"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, data, *args, **kwargs):
+            try:
+                return method(self, data, *args, **kwargs)
+            finally:
+                if not (data and data[0] in unless):
+                    self.list_cache.invalidate(*list_types)
+        return wrapper
+    return decorator
+
+
+def per_thread(name, default = None):
+    """Attribute kept per calling thread, so one Jptelnet can serve every worker"""
+    def get(self):
+        return getattr(self._local, name, default)
+    def set(self, value):
+        setattr(self._local, name, value)
+    return property(get, set)
+
+
+logger = logging.getLogger("py4web:" + settings.APP_NAME)
+metrics = CommandMetrics(slow_threshold = settings.JCLI_SLOW_COMMAND,
+                         slow_log_size = settings.JCLI_SLOW_LOG_SIZE,
+                         logger = logger)
+jparse.on_parsed = lambda family, seconds: metrics.observe(family, 'parse', seconds)
+
+
 class Jptelnet(object):
+    """jCli client shared by all requests
+
+    Pool, listing cache, metrics and policy are thread safe; the session a
+    call is using (tn) and the batch/lease state live per thread, so
+    concurrent py4web workers each lease their own session.
+    """
+    tn = per_thread('tn')
+    held = per_thread('held', False)
+    persist_pending = per_thread('persist_pending', False)
+    outcome = per_thread('outcome')
 
     def __init__(self):
         self.host = settings.JASMIN_HOST
         self.port = settings.JASMIN_PORT
         self.username = settings.JASMIN_USER
         self.password = settings.JASMIN_PWD
-        self.tn = None
-        
-    def got_connection(self):
-        self.jcli = {'host': self.host,
-                    'port': self.port,
-                    'username': self.username,
-                    'password': self.password}
+        self._local = threading.local()
+        self.pool = JcliPool(self.open_session,
+                             size = settings.JCLI_POOL_SIZE,
+                             max_idle = settings.JCLI_POOL_MAX_IDLE,
+                             wait = settings.JCLI_POOL_WAIT)
+        self.list_cache = ListingCache(ttl = settings.JCLI_LIST_CACHE_TTL)
+        self.metrics = metrics
+        self.policy = ConnectionPolicy(metrics,
+                                       default = settings.JCLI_TIMEOUT_DEFAULT,
+                                       minimum = settings.JCLI_TIMEOUT_MIN,
+                                       maximum = settings.JCLI_TIMEOUT_MAX,
+                                       factor = settings.JCLI_TIMEOUT_FACTOR,
+                                       min_samples = settings.JCLI_TIMEOUT_MIN_SAMPLES,
+                                       breaker = CircuitBreaker(threshold = settings.JCLI_BREAKER_FAILURES,
+                                                                reset_timeout = settings.JCLI_BREAKER_RESET,
+                                                                max_reset_timeout = settings.JCLI_BREAKER_MAX_RESET))
 
+    def open_session(self):
+        """Open and authenticate a new jCli session, used by the pool"""
+        started = time.perf_counter()
+        try:
+            tn = JcliSession(self.host, self.port)
+        except OSError as e:
+            logger.warning('jCli connect to %s:%s failed: %s', self.host, self.port, e)
+            self.policy.breaker.failure()
+            return(0)
+        connected = time.perf_counter()
+        self.metrics.observe('session', 'connect', connected - started)
+        tn.set_option_negotiation_callback(self.process_option)
+        try:
+            if tn.login(self.username, self.password, to = self.policy.timeout('session', 'auth')):
+                self.metrics.observe('session', 'auth', time.perf_counter() - connected)
+                self.policy.breaker.success()
+                return tn
+        except (OSError, EOFError) as e:
+            logger.warning('jCli login at %s:%s failed: %s', self.host, self.port, e)
+        self.policy.breaker.failure()
+        tn.close()
+        return(0)
+
+    def got_connection(self):
+        """Session for the next command, raises jCliUnavailable instead of waiting on a dead jCli"""
         self.outcome = None
+        if self.held:
+            if self.tn.dirty:
+                # an earlier call of the batch or lease was left mid-dialog, do not type into it
+                raise jCliSessionError('jCli session left mid-command by an earlier call')
+            return(self.tn)   # inside a batch every call shares the held session
+        breaker = self.policy.breaker
+        if not breaker.allow():
+            raise jCliUnavailable('jCli unavailable, circuit open (next try in %.0fs)' % breaker.retry_in())
         try:
-            self.tn = Telnet(self.jcli['host'], self.jcli['port'])
-            self.tn.set_option_negotiation_callback(self.process_option)
-            self.tn.read_until(b"Authentication required.", 16)
-            self.tn.write(b"\r\n")
-            self.tn.read_until(b"Username:", 16)
-            self.tn.write(self.jcli['username'].encode('ascii') +b"\r\n")
-            self.tn.read_until(b"Password:", 16)
-            self.tn.write(self.jcli['password'].encode('ascii') +b"\r\n")
-                
-        # We must be connected
-            
-            idx, obj, response = self.tn.expect([rb'Welcome to Jasmin ([0-9a-z\.]+) console'], 16)
-            if idx == -1:
-                return (0)
-            else:
-            # Wait for prompt
-                self.wait_for_prompt()
+            self.tn = self.pool.acquire()
         except jCliSessionError as e:
-            print('Exception in got connection', e)
-            return(0)
+            self.tn = None
+            raise jCliUnavailable(str(e))
+        if not self.tn:
+            self.tn = None
+            raise jCliUnavailable('Unable to connect to jCli at %s:%s' % (self.host, self.port))
         return(self.tn)
+
+    def close_connection(self):
+        if self.held:
+            return
+        if self.tn:
+            self.pool.release(self.tn)
+        self.tn = None
+
+    def persist(self):
+        """Persist the running configuration, returns None on success like the callers expect"""
+        if self.held:
+            self.persist_pending = True
+            return None
+        self.wait_for_prompt(command = b"persist a\r\n")
+        return None
+
+    def batch(self):
+        return JcliBatch(self)
+
+    @contextlib.contextmanager
+    def lease(self):
+        """Run every call in the block over one pooled session of this thread
+
+            with jasmin.lease():
+                jasmin.filters(['create', 'f1', 'UserFilter', 'sandra'])
+                jasmin.mtrouter(['StaticMTRoute', '10', 'smppc(demo)', 'f1;', '0'])
+
+        Mutations persist once when the block ends. Nested leases share the
+        outer one. Once a call leaves the session mid-dialog the following ones
+        raise jCliSessionError.
+        """
+        if self.held:
+            yield self
+            return
+        self.got_connection()
+        self.held = True
+        self.persist_pending = False
+        try:
+            yield self
+        finally:
+            self.held = False
+            try:
+                if self.persist_pending:
+                    if self.tn.dirty:
+                        # left mid-dialog, persist from a clean session
+                        self.close_connection()
+                        self.got_connection()
+                    self.persist()
+            finally:
+                self.persist_pending = False
+                self.close_connection()
+
+    def apply_batch(self, ops):
+        """Run (method, data) mutations on one session, stop at the first failure, persist once"""
+        started = time.monotonic()
+        result = dict(total=len(ops), applied=0, failed=None, persisted=False)
+        if not ops:
+            return result
+        try:
+            self.got_connection()
+        except jCliUnavailable as e:
+            result['failed'] = dict(index=0, method=ops[0][0], data=ops[0][1], error=str(e))
+            return result
+        self.held = True
+        self.persist_pending = False
+        try:
+            for index, (method, data) in enumerate(ops):
+                try:
+                    response = getattr(self, method)(data)
+                except Exception as e:
+                    response = 'Exception: %s' % e
+                if response:
+                    result['failed'] = dict(index=index, method=method, data=data, error=response)
+                    break
+                result['applied'] += 1
+        finally:
+            self.held = False
+        if self.persist_pending:
+            if self.tn.dirty:
+                # the failed command left the session mid-dialog, persist from a clean one
+                self.close_connection()
+                try:
+                    self.got_connection()
+                except jCliUnavailable as e:
+                    result['persist_error'] = str(e)
+            if self.tn:
+                try:
+                    self.persist()
+                    result['persisted'] = True
+                except jCliSessionError as e:
+                    result['persist_error'] = str(e)
+        self.close_connection()
+        result['elapsed'] = round(time.monotonic() - started, 3)
+        return result
     
     def process_option(self, tn, command, option):
         if command == DO and option == TTYPE:
@@ -68,23 +522,93 @@ class Jptelnet(object):
             #print ('Do', ord(option))
             tn.sendall(IAC + DO + option)
     
-    def wait_for_prompt(self, command = None, prompt = rb'jcli :', to = 20):
+    def wait_for_prompt(self, command = None, prompt = rb'jcli :', to = None, view = False):
         """Will  send 'command' (if set) and wait for prompt
-        Will raise an exception if 'prompt' is not obtained after 'to' seconds
+        Will raise an exception if 'prompt' is not obtained after 'to' seconds,
+        by default the timeout learned for the command's family
+        With view=True the response is a memoryview instead of a bytes copy
         """
 
         if command is not None:
             self.tn.write(command)
+        if to is None:
+            to = self.policy.timeout(family_of(self.tn.command or ''))
 
-        idx, obj, response = self.tn.expect([prompt], to)
+        try:
+            idx, response = self.tn.read_prompt((prompt,), to)
+        except (OSError, EOFError):
+            self.policy.breaker.failure()
+            raise
+        if idx == -1 or prompt == rb'jcli :':
+            self.record_command(None if idx != -1 else 'timeout after %.3gs' % to)
         if idx == -1:
+            # jCli answered but stayed elsewhere, e.g. at '> ' after a refused 'ok':
+            # not a connectivity failure, leave the dialog and keep the session out of the pool
+            try:
+                self.tn.write(b"ko\r\n")
+            except OSError:
+                pass
+            self.tn.dirty = True
             if command is None:
                 raise jCliSessionError('Did not get prompt (%s)' % prompt)
             else:
                 raise jCliSessionError('Did not get prompt (%s) for command (%s)' % (prompt, command))
         else:
-            return response
+            if prompt == rb'jcli :':
+                self.tn.dirty = False
+                self.policy.breaker.success()
+            return response if view else response.tobytes()
     
+    def record_command(self, error = None):
+        command, write, elapsed, received = self.tn.finish_command()
+        self.metrics.command(family_of(command), command, write, elapsed, received, error)
+
+    def pipeline(self, commands):
+        """Send all 'commands' in one write and read their responses back in order
+
+        jCli runs input lines one after the other, so this saves a round trip
+        per command. Each command is timed from the previous prompt. The
+        session stays dirty until the last prompt, so a failure halfway
+        never hands a session with unread output back to the pool.
+        """
+        if not commands:
+            return []
+        tn = self.tn
+        tn.write(b"".join(c + b"\r\n" for c in commands))
+        responses = []
+        for i, command in enumerate(commands):
+            if i:
+                tn.command = command.decode('ascii', 'replace')
+                tn.command_started = time.perf_counter()
+                tn.write_time = 0.0
+                tn.received = 0
+            responses.append(lines(self.wait_for_prompt(view = True)))
+            if i < len(commands) - 1:
+                tn.dirty = True
+        return responses
+
+    @releases_session
+    def stats_snapshot(self, details = True):
+        """All stats types over one session as a jparse.StatsSnapshot
+
+        stats --users, --smppcs, --smppsapi, --httpapi and smppccm -l (for the
+        session states) go in one pipeline, with details the stats --smppc of
+        every connector in a second one.
+        """
+        self.tn = self.got_connection()
+        taken_at = time.time()
+        started = time.perf_counter()
+        responses = self.pipeline([b"stats --" + kind.encode() for kind in jparse.SNAPSHOT_KINDS] + [b"smppccm -l"])
+        snapshot = jparse.StatsSnapshot(taken_at, dict(zip(jparse.SNAPSHOT_KINDS + ('sessions',), responses)))
+        if details:
+            cids = [c.cid for c in snapshot.smppcs]
+            responses = self.pipeline([b"stats --smppc=" + cid.encode() for cid in cids])
+            snapshot.connectors = dict((cid, jparse.parse_items(r)) for cid, r in zip(cids, responses))
+        snapshot.elapsed = time.perf_counter() - started
+        return snapshot
+
+    @invalidates('imts', 'imos')
+    @releases_session
     def interceptor(self,data):
         response=None
         try:
@@ -95,8 +619,8 @@ class Jptelnet(object):
             filters = data[4]
             self.tn = self.got_connection()
 
-        except Exception:
-            raise MissingKeyError('Missing parameter: Action required')
+        except (IndexError, TypeError):
+            raise jCliKeyError('Missing parameter: Action required')
         
         if direction == 'mt': #its an mt interceptor
             if i_type == 'StaticMTInterceptor':
@@ -107,7 +631,7 @@ class Jptelnet(object):
                 self.tn.write(b"filters "+ filters.encode() +b"\r\n")
                 resp = self.wait_for_prompt(command = b"ok\r\n")
                 if b'Successfully' in resp:
-                    response= self.tn.write(b"persist a\r\n")
+                    response = self.persist()
                 else:
                     self.tn.write(b"ko\r\n")
                     response = resp.decode('ascii')    
@@ -115,7 +639,7 @@ class Jptelnet(object):
             elif i_type == 'remove':
                 resp = self.wait_for_prompt(command=b"mtinterceptor -r "+ order.encode() +b"\r\n")
                 if b'Successfully' in resp:
-                    response= self.tn.write(b"persist a\r\n")
+                    response = self.persist()
                 else:
                     self.tn.write(b"ko\r\n")
                     response = resp.decode('ascii')    
@@ -123,7 +647,7 @@ class Jptelnet(object):
             elif i_type == 'flush':
                 resp = self.wait_for_prompt(command=b"mtinterceptor -f\r\n")
                 if b'Successfully' in resp:
-                    response= self.tn.write(b"persist a\r\n")
+                    response = self.persist()
                 else:
                     self.tn.write(b"ko\r\n")
                     response = resp.decode('ascii')    
@@ -133,12 +657,10 @@ class Jptelnet(object):
                 self.tn.write(b"script "+ script.encode() +b"\r\n")
                 resp = self.wait_for_prompt(command=b"ok\r\n")
                 if b'Successfully' in resp:
-                    response= self.tn.write(b"persist a\r\n")
+                    response = self.persist()
                 else:
                     self.tn.write(b"ko\r\n")
                     response = resp.decode('ascii')    
-            if self.tn is not None and self.tn.get_socket():
-                self.tn.close()
             return response
         else:   #its an mo interceptor
             if i_type == 'StaticMOInterceptor':
@@ -149,7 +671,7 @@ class Jptelnet(object):
                 self.tn.write(b"filters "+ filters.encode() +b"\r\n")
                 resp = self.wait_for_prompt(command=b"ok\r\n")
                 if b'Successfully' in resp:
-                    response= self.tn.write(b"persist a\r\n")
+                    response = self.persist()
                 else:
                     self.tn.write(b"ko\r\n")
                     response = resp.decode('ascii')    
@@ -157,7 +679,7 @@ class Jptelnet(object):
             elif i_type == 'remove':
                 resp = self.wait_for_prompt(command=b"mointerceptor -r "+ order.encode()  +b"\r\n")
                 if b'Successfully' in resp:
-                    response= self.tn.write(b"persist a\r\n")
+                    response = self.persist()
                 else:
                     self.tn.write(b"ko\r\n")
                     response = resp.decode('ascii')    
@@ -165,7 +687,7 @@ class Jptelnet(object):
             elif i_type == 'flush':
                 resp = self.wait_for_prompt(command=b"mointerceptor -f\r\n")
                 if b'Successfully' in resp:
-                    response= self.tn.write(b"persist a\r\n")
+                    response = self.persist()
                 else:
                     self.tn.write(b"ko\r\n")
                     response = resp.decode('ascii')    
@@ -177,65 +699,64 @@ class Jptelnet(object):
 
                 resp = self.wait_for_prompt(command=b"ok\r\n")
                 if b'Successfully' in resp:
-                    response= self.tn.write(b"persist a\r\n")
+                    response = self.persist()
                 else:
                     self.tn.write(b"ko\r\n")
                     response = resp.decode('ascii')    
             
-            if self.tn is not None and self.tn.get_socket():
-                self.tn.close()
             return response
     
+    @releases_session
     def stats(self,data):
         result = None
         try:
             action = data[0]
             self.tn = self.got_connection()
 
-        except Exception:
-            raise MissingKeyError('Missing parameter: Action required')
+        except (IndexError, TypeError):
+            raise jCliKeyError('Missing parameter: Action required')
 
         if action == 'user':    # Show user stats using it’s UID
             usr = data[1]
-            response = self.wait_for_prompt(command = b"stats --user=" + usr.encode() +b"\r\n")
-            result = response.decode('ascii').strip().replace("\r", '').split("\n") #splitlines()
+            response = self.wait_for_prompt(command = b"stats --user=" + usr.encode() +b"\r\n", view = True)
+            result = lines(response)
             
         elif action == 'users':    #Show stats for all users
-            response = self.wait_for_prompt(command = b"stats --users\r\n")
-            result = response.decode('ascii').strip().replace("\r", '').split("\n")
+            response = self.wait_for_prompt(command = b"stats --users\r\n", view = True)
+            result = lines(response)
 
         elif action == 'smppc':    #Show smpp connector stats using it’s CID
             cid = data[1]
-            response = self.wait_for_prompt(command = b"stats --smppc=" + cid.encode() +b"\r\n")
-            result = response.decode('ascii').strip().replace("\r", '').split("\n") #splitlines()
+            response = self.wait_for_prompt(command = b"stats --smppc=" + cid.encode() +b"\r\n", view = True)
+            result = lines(response)
 
         elif action == 'smppcs':    #Show all smpp connectors stats
-            response = self.wait_for_prompt(command = b"stats --smppcs\r\n")
-            result = response.decode('ascii').strip().replace("\r", '').split("\n")
+            response = self.wait_for_prompt(command = b"stats --smppcs\r\n", view = True)
+            result = lines(response)
 
         elif action == 'smppsapi':    #Show SMPP Server API stats
-            response = self.wait_for_prompt(command = b"stats --smppsapi\r\n")
-            result = response.decode('ascii').strip().replace("\r", '').split("\n")
+            response = self.wait_for_prompt(command = b"stats --smppsapi\r\n", view = True)
+            result = lines(response)
 
         elif action == 'httpapi':    #Show HTTP stats
-            response = self.wait_for_prompt(command = b"stats --httpapi\r\n")
-            result = response.decode('ascii').strip().replace("\r", '').split("\n")
+            response = self.wait_for_prompt(command = b"stats --httpapi\r\n", view = True)
+            result = lines(response)
             
         else:
             result = 'Unknown stats type'
         
-        if self.tn is not None and self.tn.get_socket():
-            self.tn.close()
         return result
 
+    @invalidates('morouter')
+    @releases_session
     def morouter(self,data):
         response=None
         try:
             action = data[0]
             self.tn = self.got_connection()
 
-        except Exception:
-            raise MissingKeyError('Missing parameter: Action required')
+        except (IndexError, TypeError):
+            raise jCliKeyError('Missing parameter: Action required')
         if action == 'StaticMORoute':    # 1 connector many filters
             types = action
             order = data[1]
@@ -249,7 +770,7 @@ class Jptelnet(object):
             self.tn.write(b"filters "+ filters.encode() +b"\r\n")
             resp = self.wait_for_prompt(command = b"ok\r\n")
             if b'Successfully' in resp:
-                response=self.tn.write(b"persist a\r\n")
+                response = self.persist()
             else:
                 response = resp.decode('ascii')
             
@@ -266,7 +787,7 @@ class Jptelnet(object):
             self.tn.write(b"filters "+ filters.encode() +b"\r\n")
             resp = self.wait_for_prompt(command = b"ok\r\n")
             if b'Successfully' in resp:
-                response=self.tn.write(b"persist a\r\n")
+                response = self.persist()
             else:
                 response = resp.decode('ascii')
             
@@ -283,7 +804,7 @@ class Jptelnet(object):
             self.tn.write(b"filters "+ filters.encode() +b"\r\n")
             resp = self.wait_for_prompt(command = b"ok\r\n")
             if b'Successfully' in resp:
-                response=self.tn.write(b"persist a\r\n")
+                response = self.persist()
             else:
                 response = resp.decode('ascii')
             
@@ -295,7 +816,7 @@ class Jptelnet(object):
             self.tn.write(b"connector "+ connector.encode() +b"\r\n")
             resp = self.wait_for_prompt(command = b"ok\r\n")
             if b'Successfully' in resp:
-                response=self.tn.write(b"persist a\r\n")
+                response = self.persist()
             else:
                 response = resp.decode('ascii')
             
@@ -303,29 +824,29 @@ class Jptelnet(object):
             route = data[1]
             resp = self.wait_for_prompt(command=b"morouter -r " + route.encode() +b"\r\n")
             if b'Successfully' in resp:
-                response=self.tn.write(b"persist a\r\n")
+                response = self.persist()
             else:
                 response = resp.decode('ascii')
         
         elif action == 'flush':
             resp = self.wait_for_prompt(command=b"morouter -f \r\n")
             if b'Successfully' in resp:
-                response=self.tn.write(b"persist a\r\n")
+                response = self.persist()
             else:
                 response = resp.decode('ascii')
         else:
             response = 'Invalid MO router optoin'
-        if self.tn is not None and self.tn.get_socket():
-            self.tn.close()
         return response
 
+    @invalidates('mtrouter')
+    @releases_session
     def mtrouter(self,data):
         response=None
         try:
             action = data[0]
             self.tn = self.got_connection()
-        except Exception:
-            raise MissingKeyError('Missing parameter: Action required')
+        except (IndexError, TypeError):
+            raise jCliKeyError('Missing parameter: Action required')
         if action == 'StaticMTRoute':    # 1 connector many filters
             types = action
             order = data[1]
@@ -341,7 +862,7 @@ class Jptelnet(object):
             self.tn.write(b"rate "+ rate.encode() +b"\r\n")
             resp = self.wait_for_prompt(command = b"ok\r\n")
             if b'Successfully' in resp:
-                response=self.tn.write(b"persist a\r\n")
+                response = self.persist()
             else:
                 response = resp.decode('ascii')
             
@@ -361,7 +882,7 @@ class Jptelnet(object):
             self.tn.write(b"rate "+ rate.encode() +b"\r\n")
             resp = self.wait_for_prompt(command = b"ok\r\n")
             if b'Successfully' in resp:
-                response=self.tn.write(b"persist a\r\n")
+                response = self.persist()
             else:
                 response = resp.decode('ascii')
             
@@ -380,7 +901,7 @@ class Jptelnet(object):
             self.tn.write(b"rate "+ rate.encode() +b"\r\n")
             resp = self.wait_for_prompt(command = b"ok\r\n")
             if b'Successfully' in resp:
-                response=self.tn.write(b"persist a\r\n")
+                response = self.persist()
             else:
                 response = resp.decode('ascii')
             
@@ -394,7 +915,7 @@ class Jptelnet(object):
             self.tn.write(b"rate "+ rate.encode() + b"\r\n")
             resp = self.wait_for_prompt(command = b"ok\r\n")
             if b'Successfully' in resp:
-                response=self.tn.write(b"persist a\r\n")
+                response = self.persist()
             else:
                 response = resp.decode('ascii')
 
@@ -402,35 +923,35 @@ class Jptelnet(object):
             route = data[1]
             resp = self.wait_for_prompt(command = b"mtrouter -r " + route.encode() +b"\r\n")
             if b'Successfully' in resp:
-                response=self.tn.write(b"persist a\r\n")
+                response = self.persist()
             else:
                 response = resp.decode('ascii')
            
         elif action == 'flush':
             resp = self.wait_for_prompt(command=b"mtrouter -f\r\n")
             if b'Successfully' in resp:
-                response=self.tn.write(b"persist a\r\n")
+                response = self.persist()
             else:
                 response = resp.decode('ascii')
         else:
             response = 'Invalid action for router'
-        if self.tn is not None and self.tn.get_socket():
-            self.tn.close()
         return response
 
+    @invalidates('filters')
+    @releases_session
     def filters(self,data):
         response=None
         try:
             action = data[0]
             self.tn = self.got_connection()
-        except Excebption:
-            raise MissingKeyError('Missing parameter: Action required')
+        except (IndexError, TypeError):
+            raise jCliKeyError('Missing parameter: Action required')
 
         if action == 'delete':
             filter = data[1]
             resp = self.wait_for_prompt(command=b"filter -r" + filter.encode() +b"\r\n")
             if b'Successfully' in resp:
-                response=self.tn.write(b"persist a\r\n")
+                response = self.persist()
             else:
                 response = resp.decode('ascii')
 
@@ -445,7 +966,7 @@ class Jptelnet(object):
                 self.tn.write(b"type " + ftype +b"\r\n")
                 resp = self.wait_for_prompt(command = b"ok\r\n")
                 if b'Successfully' in resp:
-                    response=self.tn.write(b"persist a\r\n")
+                    response = self.persist()
                 else:
                     response = resp.decode('ascii')
 
@@ -456,7 +977,7 @@ class Jptelnet(object):
                 self.tn.write(b"short_message " + fval +b"\r\n")
                 resp = self.wait_for_prompt(command = b"ok\r\n")
                 if b'Successfully' in resp:
-                    response=self.tn.write(b"persist a\r\n")
+                    response = self.persist()
                 else:
                     response = resp.decode('ascii')
 
@@ -467,7 +988,7 @@ class Jptelnet(object):
                 self.tn.write(b"dateInterval " + fval+ b"\r\n")
                 resp = self.wait_for_prompt(command = b"ok\r\n")
                 if b'Successfully' in resp:
-                    response=self.tn.write(b"persist a\r\n")
+                    response = self.persist()
                 else:
                     response = resp.decode('ascii')
 
@@ -478,7 +999,7 @@ class Jptelnet(object):
                 self.tn.write(b"timeInterval " + fval +b"\r\n")
                 resp = self.wait_for_prompt(command = b"ok\r\n")
                 if b'Successfully' in resp:
-                    response=self.tn.write(b"persist a\r\n")
+                    response = self.persist()
                 else:
                     response = resp.decode('ascii')
 
@@ -489,7 +1010,7 @@ class Jptelnet(object):
                 self.tn.write(b"tag " + fval +b"\r\n")
                 resp = self.wait_for_prompt(command = b"ok\r\n")
                 if b'Successfully' in resp:
-                    response=self.tn.write(b"persist a\r\n")
+                    response = self.persist()
                 else:
                     response = resp.decode('ascii')
 
@@ -500,7 +1021,7 @@ class Jptelnet(object):
                 self.tn.write(b"uid " + fval+ b"\r\n")
                 resp = self.wait_for_prompt(command = b"ok\r\n")
                 if b'Successfully' in resp:
-                    response=self.tn.write(b"persist a\r\n")
+                    response = self.persist()
                 else:
                     response = resp.decode('ascii')
             elif ft == 'UserFilter':
@@ -510,7 +1031,7 @@ class Jptelnet(object):
                 self.tn.write(b"uid " + fval+ b"\r\n")
                 resp = self.wait_for_prompt(command = b"ok\r\n")
                 if b'Successfully' in resp:
-                    response=self.tn.write(b"persist a\r\n")
+                    response = self.persist()
                 else:
                     response = resp.decode('ascii')
 
@@ -521,7 +1042,7 @@ class Jptelnet(object):
                 self.tn.write(b"destination_addr "+ fval +b"\r\n")
                 resp = self.wait_for_prompt(command = b"ok\r\n")
                 if b'Successfully' in resp:
-                    response=self.tn.write(b"persist a\r\n")
+                    response = self.persist()
                 else:
                     response = resp.decode('ascii')
 
@@ -530,10 +1051,9 @@ class Jptelnet(object):
                 self.tn.write(b"fid "+ fid +b"\r\n")
                 self.tn.write(b"type "+ ftype +b"\r\n")
                 self.tn.write(b"gid "+ fval +b"\r\n")
-                self.tn.write(b"ok\r\n")
                 resp = self.wait_for_prompt(command = b"ok\r\n")
                 if b'Successfully' in resp:
-                    response=self.tn.write(b"persist a\r\n")
+                    response = self.persist()
                 else:
                     response = resp.decode('ascii')
 
@@ -544,22 +1064,20 @@ class Jptelnet(object):
                 self.tn.write(b"source_addr "+ fval +b"\r\n")
                 resp = self.wait_for_prompt(command = b"ok\r\n")
                 if b'Successfully' in resp:
-                    response=self.tn.write(b"persist a\r\n")
+                    response = self.persist()
                 else:
                     response = resp.decode('ascii')
-        else:
-            if self.tn is not None and self.tn.get_socket():
-                self.tn.close()
-                return response
-        return()
+        return response
 
+    @invalidates('httpcs')
+    @releases_session
     def http_cons(self,data):
         response=None
         try:
             action = data[0]
             self.tn = self.got_connection()
-        except Exception:
-            raise MissingKeyError('Missing parameter: Action required')
+        except (IndexError, TypeError):
+            raise jCliKeyError('Missing parameter: Action required')
         if action == 'create':
             cid = data[1]
             method = data[2]
@@ -570,7 +1088,7 @@ class Jptelnet(object):
             self.tn.write(b"url " + base_url.encode()+b"\r\n")
             resp = self.wait_for_prompt(command = b"ok\r\n")
             if b'Successfully' in resp:
-                response=self.tn.write(b"persist a\r\n")
+                response = self.persist()
             else:
                 response = resp.decode('ascii')
             
@@ -578,7 +1096,7 @@ class Jptelnet(object):
             cid = data[1]
             resp = self.wait_for_prompt(command = b"httpccm -r " + cid.encode() +b"\r\n")
             if b'Successfully' in resp:
-                response=self.tn.write(b"persist a\r\n")
+                response = self.persist()
             else:
                 response = resp.decode('ascii')
 
@@ -587,49 +1105,57 @@ class Jptelnet(object):
         else:
             reponse = 'Invalid option for HTTP connectors'
         
-        if self.tn is not None and self.tn.get_socket():
-            self.tn.close()
         return response
     
-    def list_it(self, list_type=None):  
+    def list_it(self, list_type=None):
+        """Listing lines for list_type, served from the listing cache while fresh"""
+        if list_type not in CACHED_LISTINGS or self.held:
+            return self.fetch_list(list_type)
+        result = self.list_cache.get(list_type, lambda: self.fetch_list(list_type))
+        if result is None and settings.JCLI_SERVE_STALE:
+            result = self.list_cache.stale(list_type)   # jCli is down, the last listing beats none
+        return list(result) if result is not None else None
+
+    @releases_session
+    def fetch_list(self, list_type=None):
         result = None
         self.tn = self.got_connection()
         try:
             if list_type == 'smppcs':
-                response = self.wait_for_prompt(command = b"smppccm -l\r\n")
-                result = response.decode('ascii').strip().replace("\r", '').split("\n") #splitlines()
+                response = self.wait_for_prompt(command = b"smppccm -l\r\n", view = True)
+                result = lines(response)
                 
             elif list_type == 'imos':
-                response = self.wait_for_prompt(self.tn, command = "mointerceptor -l\r\n")
-                result = response.strip().replace("\r", '').split("\n") #splitlines()
+                response = self.wait_for_prompt(command = b"mointerceptor -l\r\n", view = True)
+                result = lines(response)
                 
             elif list_type == 'imts':
-                response = self.wait_for_prompt(command = b"mtinterceptor -l\r\n")
-                result = response.decode('ascii').strip().replace("\r", '').split("\n") #splitlines()
+                response = self.wait_for_prompt(command = b"mtinterceptor -l\r\n", view = True)
+                result = lines(response)
                 
             elif list_type == 'httpcs':
-                response = self.wait_for_prompt(command = b"httpccm -l\r\n")
-                result = response.decode('ascii').strip().replace("\r", '').split("\n") #splitlines()
+                response = self.wait_for_prompt(command = b"httpccm -l\r\n", view = True)
+                result = lines(response)
                 
             elif list_type == 'mtrouter':
-                response = self.wait_for_prompt(command = b"mtrouter -l\r\n")
-                result = response.decode('ascii').strip().replace("\r", '').split("\n") #splitlines()
+                response = self.wait_for_prompt(command = b"mtrouter -l\r\n", view = True)
+                result = lines(response)
                 
             elif list_type == 'morouter':
-                response = self.wait_for_prompt(command = b"morouter -l\r\n")
-                result = response.decode('ascii').strip().replace("\r", '').split("\n") #splitlines()
+                response = self.wait_for_prompt(command = b"morouter -l\r\n", view = True)
+                result = lines(response)
                 
             elif list_type == 'filters':
-                response = self.wait_for_prompt(command = b"filter -l\r\n")
-                result = response.decode('ascii').strip().replace("\r", '').split("\n") #splitlines()
+                response = self.wait_for_prompt(command = b"filter -l\r\n", view = True)
+                result = lines(response)
                 
             elif list_type == 'users':
-                response = self.wait_for_prompt(command =  b"user -l\r\n")
-                result = response.decode('ascii').strip().replace("\r", '').split("\n") #splitlines()
+                response = self.wait_for_prompt(command =  b"user -l\r\n", view = True)
+                result = lines(response)
                 
             elif list_type == 'groups':
-                response = self.wait_for_prompt(command = b"group -l\r\n")
-                result = response.decode('ascii').strip().replace("\r", '').split("\n") #splitlines()
+                response = self.wait_for_prompt(command = b"group -l\r\n", view = True)
+                result = lines(response)
                 
             elif list_type == 'httpapi':
                 result  = self.get_list_ids(response)
@@ -641,28 +1167,25 @@ class Jptelnet(object):
         except Exception as e:
             if result is not None:
                 print (e)
-            if self.tn is not None and self.tn.get_socket():
-                self.tn.close()
-                return result
             
-        if self.tn is not None and self.tn.get_socket():
-            self.tn.close()
         return result
  
+    @invalidates('smppcs', unless = ('show',))
+    @releases_session
     def connector(self,data):
         response=None
         try:
             action = data[0]
             self.tn = self.got_connection()
 
-        except Exception:
-            raise MissingKeyError('Missing parameter: Action required')
+        except (IndexError, TypeError):
+            raise jCliKeyError('Missing parameter: Action required')
 
         if action == 'start':
             cid = data[1]
             resp = self.wait_for_prompt(command=b"smppccm -1 " + cid.encode() +b"\r\n")
             if b'Successfully' in resp:
-                response = self.tn.write(b"persist a\r\n")
+                response = self.persist()
             else:
                 response = resp.decode('ascii')
             
@@ -670,7 +1193,7 @@ class Jptelnet(object):
             cid = data[1]
             resp = self.wait_for_prompt(b"smppccm -0 " + cid.encode() +b"\r\n")
             if b'Successfully' in resp:
-                response = self.tn.write(b"persist a\r\n")
+                response = self.persist()
             else:
                 response = resp.decode('ascii')
             
@@ -678,7 +1201,7 @@ class Jptelnet(object):
             cid = data[1]
             resp =self.wait_for_prompt(command=b"smppccm -r " + cid.encode() +b"\r\n")
             if b'Successfully' in resp:
-                response = self.tn.write(b"persist a\r\n")
+                response = self.persist()
             else:
                 response = resp.decode('ascii')
             
@@ -770,7 +1293,7 @@ class Jptelnet(object):
             self.tn.write(b"src_ton " + src_ton.encode() +b"\r\n")
             resp = self.wait_for_prompt(command=b"ok\r\n")
             if b'Successfully' in resp:
-                response = self.tn.write(b"persist a\r\n")
+                response = self.persist()
             else:
                 response = resp.decode('ascii')    
             
@@ -790,22 +1313,22 @@ class Jptelnet(object):
             self.tn.write(b"submit_throughput " + submit_throughput.encode() +b"\r\n")
             resp = self.wait_for_prompt(command=b"ok\r\n")
             if b'Successfully' in resp:
-                response = self.tn.write(b"persist a\r\n")
+                response = self.persist()
             else:
                 response = resp.decode('ascii')    
         else:
             response = 'Invalid fucntion for connectors'
-        if self.tn is not None and self.tn.get_socket():
-                self.tn.close()
         return response
 
+    @invalidates('users', 'groups', unless = ('unbind',))
+    @releases_session
     def users (self,data): #User and Group Management
         response=None
         try:
             action = data[0]
             self.tn = self.got_connection()
-        except Exception:
-            raise MissingKeyError('Missing parameter: Action required')
+        except (IndexError, TypeError):
+            raise jCliKeyError('Missing parameter: Action required')
         
         types = 'users'
         if action == 'update':
@@ -857,7 +1380,7 @@ class Jptelnet(object):
             self.tn.write(b"mt_messaging_cred authorization http_bulk " + author_http_bulk.encode() +b"\r\n")
             resp = self.wait_for_prompt(command = b"ok\r\n")
             if b'Successfully' in resp:
-                response= self.tn.write(b"persist a\r\n")
+                response = self.persist()
             else:
                 response = resp.decode('ascii')    
 
@@ -865,7 +1388,7 @@ class Jptelnet(object):
             uid = data[1]
             resp = self.wait_for_prompt(command=b"user --smpp-unbind=" +uid.encode() +b"\r\n")
             if b'Successfully' in resp:
-                response= self.tn.write(b"persist a\r\n")
+                response = self.persist()
             else:
                 response = resp.decode('ascii')    
 
@@ -874,7 +1397,7 @@ class Jptelnet(object):
             resp = self.wait_for_prompt(command=b"user --smpp-ban=" +uid.encode() +b"\r\n")
             print('RESP in ban', resp)
             if b'Successfully' in resp:
-                response= self.tn.write(b"persist a\r\n")
+                response = self.persist()
             else:
                 response = resp.decode('ascii')    
 
@@ -891,7 +1414,7 @@ class Jptelnet(object):
             self.tn.write(b"password "+ password.encode() +b"\r\n")
             resp = self.wait_for_prompt(command = b"ok\r\n")
             if b'Successfully' in resp:
-                response= self.tn.write(b"persist a\r\n")
+                response = self.persist()
             else:
                 response = resp.decode('ascii')    
 
@@ -907,7 +1430,7 @@ class Jptelnet(object):
             self.tn.write(b"gid "+ str.encode(gid)+b"\r\n")
             resp = self.wait_for_prompt(command = b"ok\r\n")
             if b'Successfully' in resp:
-                response= self.tn.write(b"persist a\r\n")
+                response = self.persist()
             else:
                 response = resp.decode('ascii')    
             
@@ -915,7 +1438,7 @@ class Jptelnet(object):
             user = data[1]
             resp = self.wait_for_prompt(command = b"user -e" + user.encode() +b"\r\n")
             if b'Successfully' in resp:
-                response= self.tn.write(b"persist a\r\n")
+                response = self.persist()
             else:
                 response = resp.decode('ascii')    
            
@@ -923,7 +1446,7 @@ class Jptelnet(object):
             grp = data[1]
             resp = self.wait_for_prompt(command = b"group -e" + grp.encode() +b"\r\n")
             if b'Successfully' in resp:
-                response= self.tn.write(b"persist a\r\n")
+                response = self.persist()
             else:
                 response = resp.decode('ascii')    
            
@@ -931,7 +1454,7 @@ class Jptelnet(object):
             user = data[1]
             resp = self.wait_for_prompt(command = b"user -d" + user.encode()+b"\r\n")
             if b'Successfully' in resp:
-                response= self.tn.write(b"persist a\r\n")
+                response = self.persist()
             else:
                 response = resp.decode('ascii')    
            
@@ -939,7 +1462,7 @@ class Jptelnet(object):
             grp = data[1]
             resp = self.wait_for_prompt(command = b"group -d" + grp.encode()+b"\r\n")
             if b'Successfully' in resp:
-                response= self.tn.write(b"persist a\r\n")
+                response = self.persist()
             else:
                 response = resp.decode('ascii')    
            
@@ -948,7 +1471,7 @@ class Jptelnet(object):
             user = data[1]
             resp = self.wait_for_prompt(command = b"user -r" + user.encode() +b"\r\n")
             if b'Successfully' in resp:
-                response= self.tn.write(b"persist a\r\n")
+                response = self.persist()
             else:
                 response = resp.decode('ascii')    
           
@@ -956,14 +1479,12 @@ class Jptelnet(object):
             grp = data[1]
             resp = self.wait_for_prompt(command = b"group -r" + grp.encode() +b"\r\n")
             if b'Successfully' in resp:
-                response = self.wait_for_prompt(command = b"persist a\r\n")
+                response = self.persist()
             else:
                 response = resp.decode('ascii')
             
         else:
             respone = 'Invalid action for user management'
         
-        if self.tn is not None and self.tn.get_socket():
-                self.tn.close()
         return (response)
     
\ No newline at end of file
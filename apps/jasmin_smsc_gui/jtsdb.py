@@ -0,0 +1,361 @@
+"""
+On-disk time series for the jCli stats counters
+
+Every metric ('smppc.demo.submit_sm_request') has one fixed size segment
+file, memory mapped and viewed as doubles, holding three rings:
+
+    1s  (bucket, value)                           for STATS_DB_RAW_RETENTION
+    1m  (bucket, last, min, max, sum, count)      for STATS_DB_MINUTE_RETENTION
+    1h  (bucket, last, min, max, sum, count)      for STATS_DB_HOUR_RETENTION
+
+A slot is addressed by bucket number modulo ring size and keeps its bucket
+number, so a write is a few stores into the map and a stale slot is simply
+one whose bucket does not match. The rollups are updated with every
+sample, so nothing has to be recomputed when raw data ages out; compact()
+removes the files of metrics that were not written for a whole hour
+retention (deleted connectors and users).
+
+A range query reads the coarsest ring that still has the requested step
+and reaches back far enough, as one or two slices of the map, then folds
+it into 'step' buckets: 30 days at 1h steps is 720 slots.
+
+    store = StatsStore(folder)
+    store.write(time.time(), {('smppc', 'demo', 'submit_sm_request'): 1200})
+    store.query('smppc.demo.submit_sm_request', start, end, step=3600, agg='rate')
+
+Every py4web worker samples, but only one process writes a folder: write()
+takes an exclusive flock on its '.writer.lock' and the other processes
+drop their samples and only read the files the writer maps (the same
+pages, so they see its writes). The lock goes with the process, a reader
+retries it every writer_retry seconds and takes over when the writer is gone.
+"""
+import mmap
+import os
+import threading
+import time
+from array import array
+from collections import Counter, OrderedDict
+from urllib.parse import quote, unquote
+
+try:
+    import fcntl
+except ImportError:     # no flock (Windows): a single process is assumed
+    fcntl = None
+
+MAGIC = 4242.0
+HEADER = 8          # doubles: magic, layout, created, last write, unused
+SUFFIX = '.seg'
+AGGREGATES = ('last', 'min', 'max', 'avg', 'sum', 'count', 'rate')
+COMPACT_EVERY = 3600    # seconds between two compactions run by write()
+LOCK_FILE = '.writer.lock'
+
+
+class Ring(object):
+    __slots__ = ('name', 'step', 'slots', 'fields', 'offset')
+
+    def __init__(self, name, step, retention, fields, offset):
+        self.name = name
+        self.step = step
+        self.slots = max(1, int(retention // step))
+        self.fields = fields
+        self.offset = offset
+
+    @property
+    def retention(self):
+        return self.step * self.slots
+
+    @property
+    def size(self):
+        return self.slots * self.fields
+
+
+class Segment(object):
+    """The mapped file of one metric, create=False only maps a complete file and never changes it"""
+
+    def __init__(self, path, rings, create = True):
+        self.path = path
+        self.rings = rings
+        doubles = HEADER + sum(r.size for r in rings)
+        layout = float(sum(r.step * r.slots * r.fields for r in rings))
+        exists = os.path.exists(path)
+        if not exists and not create:
+            raise FileNotFoundError(path)
+        with open(path, 'a+b' if create else 'r+b') as f:
+            if f.seek(0, os.SEEK_END) != doubles * 8:
+                if not create:
+                    raise FileNotFoundError(path)   # being created, or other retentions
+                exists = False     # new, or written with other retentions: start over
+                f.truncate(0)
+                f.truncate(doubles * 8)
+            self.mm = mmap.mmap(f.fileno(), doubles * 8)
+            self.inode = os.fstat(f.fileno()).st_ino
+        self.d = memoryview(self.mm).cast('d')
+        if not create and (self.d[0] != MAGIC or self.d[1] != layout):
+            self.close()
+            raise FileNotFoundError(path)
+        if not exists or self.d[0] != MAGIC or self.d[1] != layout:
+            self.d[:HEADER] = array('d', [MAGIC, layout, time.time()] + [0.0] * (HEADER - 3))
+            for r in rings:
+                # bucket -1 marks an empty slot
+                self.d[r.offset:r.offset + r.size] = array('d', ([-1.0] + [0.0] * (r.fields - 1)) * r.slots)
+
+    @property
+    def last_write(self):
+        return self.d[3]
+
+    def write(self, t, value):
+        d = self.d
+        for r in self.rings:
+            b = float(t // r.step)
+            i = r.offset + int(b % r.slots) * r.fields
+            if r.fields == 2:
+                d[i] = b
+                d[i + 1] = value
+            elif d[i] != b:
+                d[i:i + 6] = array('d', (b, value, value, value, value, 1.0))
+            else:
+                d[i + 1] = value
+                if value < d[i + 2]:
+                    d[i + 2] = value
+                if value > d[i + 3]:
+                    d[i + 3] = value
+                d[i + 4] += value
+                d[i + 5] += 1.0
+        d[3] = t
+
+    def read(self, ring, first, last):
+        """[(bucket, last, min, max, sum, count)] of 'ring' for buckets first..last, oldest first"""
+        first = max(first, last - ring.slots + 1)
+        if last < first:
+            return []
+        start = int(first % ring.slots)
+        count = int(last - first) + 1
+        base = ring.offset
+        f = ring.fields
+        if start + count <= ring.slots:
+            values = self.d[base + start * f:base + (start + count) * f].tolist()
+        else:
+            values = (self.d[base + start * f:base + ring.size].tolist() +
+                      self.d[base:base + (start + count - ring.slots) * f].tolist())
+        out = []
+        if f == 2:
+            for i in range(0, len(values), 2):
+                b = values[i]
+                if first <= b <= last:
+                    v = values[i + 1]
+                    out.append((b, v, v, v, v, 1.0))
+        else:
+            for i in range(0, len(values), 6):
+                if first <= values[i] <= last:
+                    out.append(tuple(values[i:i + 6]))
+        return out
+
+    def close(self):
+        self.d.release()
+        self.mm.close()
+
+
+class StatsStore(object):
+
+    def __init__(self, folder, raw_retention = 6 * 3600, minute_retention = 30 * 86400,
+                 hour_retention = 365 * 86400, sources = None, max_metrics = None, open_files = None,
+                 writer_retry = 60):
+        self.folder = folder
+        self.sources = sources
+        self.max_metrics = max_metrics      # metric files per source, new metrics over it are not stored
+        if open_files is None:
+            # every metric written is touched on each sample, keep them all mapped
+            open_files = max_metrics * len(sources) + 64 if max_metrics and sources else 256
+        self.open_files = open_files
+        self.writer_retry = writer_retry
+        self.writer = None      # the locked file while this process is the writer
+        self.writer_tried = None
+        self._known = None      # metrics with a file, loaded when becoming the writer
+        self._per_source = Counter()
+        self.rings = []
+        offset = HEADER
+        for name, step, retention, fields in (('1s', 1, raw_retention, 2), ('1m', 60, minute_retention, 6),
+                                              ('1h', 3600, hour_retention, 6)):
+            ring = Ring(name, step, retention, fields, offset)
+            self.rings.append(ring)
+            offset += ring.size
+        self._segments = OrderedDict()   # metric -> Segment, least recently used first
+        self._lock = threading.Lock()
+        self.counters = dict(writes=0, queries=0, opened=0, removed=0, skipped=0, capped=0)
+        self.compacted_at = time.time()
+        os.makedirs(folder, exist_ok=True)
+
+    def path(self, metric):
+        return os.path.join(self.folder, quote(metric, safe='') + SUFFIX)
+
+    def _segment(self, metric, create = True):
+        seg = self._segments.get(metric)
+        if seg is not None:
+            self._segments.move_to_end(metric)
+            return seg
+        try:
+            seg = Segment(self.path(metric), self.rings, create)
+        except FileNotFoundError:
+            return None
+        self.counters['opened'] += 1
+        self._segments[metric] = seg
+        while len(self._segments) > self.open_files:
+            self._segments.popitem(last=False)[1].close()
+        return seg
+
+    def acquire_writer(self, now = None):
+        """True when this process holds the writer lock of the folder, tried again every writer_retry seconds"""
+        if self.writer is not None:
+            return True
+        now = now or time.time()
+        if self.writer_tried is not None and now - self.writer_tried < self.writer_retry:
+            return False
+        self.writer_tried = now
+        f = open(os.path.join(self.folder, LOCK_FILE), 'a')
+        if fcntl is not None:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                return False
+        self.writer = f
+        # segments mapped while reading may be stale copies, the writer starts afresh
+        while self._segments:
+            self._segments.popitem()[1].close()
+        self._known = set(self.metrics())
+        self._per_source = Counter(m.split('.', 1)[0] for m in self._known)
+        return True
+
+    def leader(self):
+        """True when this process is (or just became) the writer, to elect one process for other work too"""
+        with self._lock:
+            return self.acquire_writer()
+
+    def write(self, timestamp, values):
+        """Store a sample {(source, id, counter): value}, as given to StatsSampler listeners,
+        dropped unless this process is the writer"""
+        with self._lock:
+            if not self.acquire_writer(timestamp):
+                self.counters['skipped'] += 1
+                return
+            for (source, id, counter), value in values.items():
+                if value is None or (self.sources and source not in self.sources):
+                    continue
+                metric = metric_name(source, id, counter)
+                if metric not in self._known:
+                    if self.max_metrics and self._per_source[source] >= self.max_metrics:
+                        self.counters['capped'] += 1
+                        continue
+                    self._known.add(metric)
+                    self._per_source[source] += 1
+                self._segment(metric).write(timestamp, float(value))
+                self.counters['writes'] += 1
+        if timestamp - self.compacted_at > COMPACT_EVERY:
+            self.compacted_at = timestamp
+            self.compact(timestamp)
+
+    def metrics(self, prefix = ''):
+        names = [unquote(n[:-len(SUFFIX)]) for n in os.listdir(self.folder) if n.endswith(SUFFIX)]
+        return sorted(n for n in names if n.startswith(prefix))
+
+    def pick(self, start, step, now = None):
+        """Coarsest ring no coarser than 'step' that still reaches back to 'start'"""
+        now = now or time.time()
+        covering = [r for r in self.rings if now - r.retention <= start] or [self.rings[-1]]
+        fine_enough = [r for r in covering if r.step <= step]
+        return fine_enough[-1] if fine_enough else covering[0]
+
+    def query(self, metric, start, end, step = None, agg = 'last'):
+        """[[t, value]] at 'step' seconds between start and end, t is the start of each step"""
+        if agg not in AGGREGATES:
+            raise ValueError('agg must be one of %s' % ', '.join(AGGREGATES))
+        step = step or max(1, (end - start) / 300)
+        ring = self.pick(start, step)
+        step = max(step, ring.step)
+        with self._lock:
+            self.counters['queries'] += 1
+            seg = self._segment(metric, create=False)
+            if seg is not None and self.writer is None and _replaced(seg):
+                # removed or recreated by the writer since it was mapped here
+                self._segments.pop(metric).close()
+                seg = self._segment(metric, create=False)
+            if seg is None:
+                return dict(metric=metric, resolution=None, step=step, points=[])
+            rows = seg.read(ring, start // ring.step, end // ring.step)
+        points = []
+        current = None
+        for b, last, low, high, total, count in rows:
+            t = b * ring.step
+            bucket = t - t % step
+            if current is None or current[0] != bucket:
+                current = [bucket, last, low, high, total, count]
+                points.append(current)
+            else:
+                current[1] = last
+                current[2] = min(current[2], low)
+                current[3] = max(current[3], high)
+                current[4] += total
+                current[5] += count
+        return dict(metric=metric, resolution=ring.name, step=step, points=_aggregate(points, agg))
+
+    def compact(self, now = None):
+        """Remove the files of metrics not written for a whole hour retention, returns how many"""
+        cutoff = (now or time.time()) - self.rings[-1].retention
+        removed = 0
+        with self._lock:
+            if self.writer is None:
+                return 0    # only the writer changes the folder
+            for metric in self.metrics():
+                seg = self._segment(metric, create=False)
+                if seg is not None and seg.last_write < cutoff:
+                    self._segments.pop(metric).close()
+                    os.remove(self.path(metric))
+                    self._known.discard(metric)
+                    self._per_source[metric.split('.', 1)[0]] -= 1
+                    removed += 1
+            self.counters['removed'] += removed
+        return removed
+
+    def close(self):
+        with self._lock:
+            while self._segments:
+                self._segments.popitem()[1].close()
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
+
+    def info(self):
+        with self._lock:
+            m = dict(self.counters)
+            m.update(open=len(self._segments), open_files=self.open_files, folder=self.folder,
+                     writer=self.writer is not None, pid=os.getpid(), max_metrics=self.max_metrics,
+                     rings=[dict(name=r.name, step=r.step, slots=r.slots, retention=r.retention) for r in self.rings],
+                     segment_bytes=8 * (HEADER + sum(r.size for r in self.rings)))
+        return m
+
+
+def metric_name(source, id, counter):
+    return '.'.join(p for p in (source, id, counter) if p)
+
+
+def _replaced(seg):
+    try:
+        return os.stat(seg.path).st_ino != seg.inode
+    except FileNotFoundError:
+        return True
+
+
+def _aggregate(points, agg):
+    if agg == 'rate':
+        out = []
+        for prev, cur in zip(points, points[1:]):
+            increase = cur[1] - prev[1]
+            if increase < 0:
+                increase = cur[1]   # counter reset
+            out.append([cur[0], increase / (cur[0] - prev[0])])
+        return out
+    index = dict(last=1, min=2, max=3, sum=4, count=5)
+    if agg == 'avg':
+        return [[p[0], p[4] / p[5]] for p in points]
+    i = index[agg]
+    return [[p[0], p[i]] for p in points]
@@ -5,7 +5,7 @@ from py4web.utils.form import Form, FormStyleBulma
 from pydal.validators import *
 from .models import MTROUTE_TYPES, MOROUTE_TYPES
 from . common import jasmin
-from .utils import cols_split
+from .jparse import parse_listing
 
 def index():
     response.flash='Welcome to the rotuing manager'
@@ -243,128 +243,14 @@ def manage_mt_routes():
 
 def mt_routes():
     routes = []
-    rows = jasmin.list_it('mtrouter')
-    lines=rows
-    if not rows:
-        return routes
-    tt = cols_split(lines[2:-2])
-    n = len(rows[0])
-    filters = ''
-    connectors= ''
-    for t in tt:
-        route={}
-        if len(t) == 4 or len(t) == 5: # default route
-            if t[2] == '0':
-                route.update(
-                    r_order=t[0][1:],
-                    r_type=t[1],
-                    r_rate=t[2]+t[3],
-                    r_connectors=t[4],
-                    r_filters='',
-                    )
-            else:
-                route.update(
-                    r_order=t[0][1:],
-                    r_type=t[1],
-                    r_rate = t[2],
-                    r_connectors = t[3],
-                    r_filters='',
-                    )
-        elif len(t) >= 7 and t[1][0] == 'R': #Random route can have many connectors and filters
-            if t[2] == '0':
-                i = 4
-            else:
-                i = 3
-            filters=""
-            connectors = ""
-            while i < len(t) and t[i][0] == 's':
-                connectors += t[i]
-                connectors += "   "
-                i +=1
-            while i < len(t):
-                filters+= t[i]
-                filters+="   "
-                i +=1
-            if t[2] == '0':
-                route.update(
-                    r_order=t[0][1:],
-                    r_type=t[1],
-                    r_rate=t[2]+t[3],
-                    r_connectors=connectors,
-                    r_filters=filters,
-                    )
-            else:
-                route.update(
-                    r_order=t[0][1:],
-                    r_type=t[1],
-                    r_rate = t[2],
-                    r_connectors = connectors,
-                    r_filters=filters,
-                    )
-            
-        elif len(t) >= 7 and t[1][0] == 'F': #Failover route can have many connectors and filters
-            if t[2] == '0':
-                i = 4
-            else:
-                i = 3
-            filters=''
-            connectors = ''
-            while i < len(t) and t[i][0] == 's':
-                connectors += t[i]
-                connectors += "   "
-                i +=1
-            while i < len(t):
-                filters+= t[i]
-                filters+= "   "
-                i +=1
-            if t[2] == '0':
-                route.update(
-                    r_order=t[0][1:],
-                    r_type=t[1],
-                    r_rate=t[2]+t[3],
-                    r_connectors=connectors,
-                    r_filters=filters,
-                    )
-            else:
-                route.update(
-                    r_order=t[0][1:],
-                    r_type=t[1],
-                    r_rate = t[2],
-                    r_connectors = connectors,
-                    r_filters=filters,
-                    )
-
-        elif len(t) >= 6 and t[1][0] == 'S': #Static route can have many filters
-            if t[2] == '0':
-                i = 5
-            else:
-                i = 4
-            filters=''
-            while i < len(t):
-                filters += t[i]
-                filters += "   "
-                i +=1
-            if t[2] == '0':
-                route.update(
-                    r_order=t[0][1:],
-                    r_type=t[1],
-                    r_rate=t[2]+t[3],
-                    r_connectors=t[4],
-                    r_filters=filters,
-                    )
-            else:
-                route.update(
-                    r_order=t[0][1:],
-                    r_type=t[1],
-                    r_rate = t[2],
-                    r_connectors = t[3],
-                    r_filters=filters,
-                    )
-        if route:
-            routes.append(route)
-        else:
-            pass
-        test=1
+    for t in parse_listing('mtrouter', jasmin.list_it('mtrouter')):
+        routes.append(dict(
+            r_order=str(t.order),
+            r_type=t.type,
+            r_rate=t.rate,
+            r_connectors=', '.join(t.connectors),
+            r_filters=', '.join(t.filters),
+            ))
     return routes
 
 def route_exists(order):
@@ -566,80 +452,13 @@ def remove_moroute(route_order):
     
 def mo_routes():
     routes = []
-    rows = jasmin.list_it('morouter')
-    if not rows:
-        return routes #we dont have any mo routes
-    else:    
-        lines=rows
-        tt = cols_split(lines[2:-2])
-        n = len(rows[0])
-        routes = []
-        route={}
-        filters = ''
-        connectors= ''
-        for t in tt:
-            route={}
-            if len(t) == 3: # default route
-                route.update(
-                    r_order=t[0][1:],
-                    r_type=t[1],
-                    r_connectors=t[2],
-                    r_filters=''
-                    )
-            elif len(t) > 3 and t[1][0] == 'R': #Random route can have many connectors and filters
-                i = 2
-                filters=''
-                connectors = ''
-                while i < len(t) and t[i][0] == 's':
-                    connectors += t[i]
-                    i +=1
-                while i < len(t) and t[i][0] == 'h':
-                    connectors += t[i]
-                    i +=1
-                while i < len(t):
-                    filters+= t[i]
-                    i +=1
-                route.update(
-                    r_order=t[0][1:],
-                    r_type=t[1],
-                    r_connectors=connectors,
-                    r_filters=filters,
-                    )
-            elif len(t) > 3 and t[1][0] == 'F': #Failover route can have many connectors and filters
-                i = 2
-                filters=''
-                connectors = ''
-                while i < len(t) and t[i][0] == 's':
-                    connectors += t[i]
-                    i +=1
-                while i < len(t) and t[i][0] == 'h':
-                    connectors += t[i]
-                    i +=1
-                while i < len(t):
-                    filters+= t[i]
-                    i +=1
-                route.update(
-                    r_order=t[0][1:],
-                    r_type=t[1],
-                    r_connectors=connectors,
-                    r_filters=filters,
-                    )
-            elif len(t) > 3 and t[1][0] == 'S': #Static route can have many filters
-                i = 4
-
-                filters=''
-                while i < len(t):
-                    filters += t[i]
-                    i +=1
-                route.update(
-                    r_order=t[0][1:],
-                    r_type=t[1],
-                    r_connectors=t[2],
-                    r_filters=filters,
-                    )
-            else:
-                i = 1
-            routes.append(route)
+    for t in parse_listing('morouter', jasmin.list_it('morouter')):
+        routes.append(dict(
+            r_order=str(t.order),
+            r_type=t.type,
+            r_connectors=', '.join(t.connectors),
+            r_filters=', '.join(t.filters),
+            ))
     return routes
 
 @action('manage_mo_routes', method=['GET', 'POST'])
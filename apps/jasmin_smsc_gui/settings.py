@@ -31,6 +31,51 @@ JASMIN_PORT = 8990
 JASMIN_USER = 'admin'
 JASMIN_PWD = 'admin123'
 
+# jcli session pool:
+JCLI_POOL_SIZE = 4  # authenticated sessions kept open to jcli
+JCLI_POOL_MAX_IDLE = 60  # seconds idle before a session is pinged on checkout
+JCLI_POOL_WAIT = 16  # seconds to wait for a free session when all are busy
+JCLI_ASYNC_CONCURRENCY = 16  # max sessions open at once by the asyncio client
+JCLI_IMPORT_CONCURRENCY = 8  # jcli sessions used in parallel by bulk_import
+JCLI_SYNC_CONCURRENCY = 8  # jcli sessions used in parallel by populate_database
+JCLI_LIST_CACHE_TTL = 30  # seconds a jcli listing is served from cache, 0 disables it
+JCLI_SLOW_COMMAND = 2.0  # seconds, slower jcli commands are logged and kept in the slow log
+JCLI_SLOW_LOG_SIZE = 100  # slow commands kept for jcli_slow_log
+JCLI_TIMEOUT_DEFAULT = 20  # seconds to wait for a prompt until enough commands of a family were timed
+JCLI_TIMEOUT_MIN = 2  # lower bound of a learned prompt timeout
+JCLI_TIMEOUT_MAX = 60  # upper bound of a learned prompt timeout
+JCLI_TIMEOUT_FACTOR = 4  # learned timeout is the family's p99 time to prompt times this
+JCLI_TIMEOUT_MIN_SAMPLES = 20  # commands timed before a family's timeout is learned
+JCLI_BREAKER_FAILURES = 3  # consecutive connect/auth/socket failures that open the circuit breaker
+JCLI_BREAKER_RESET = 10  # seconds before an open breaker lets a probe through, doubled per failed probe
+JCLI_BREAKER_MAX_RESET = 120  # cap on the breaker's probe interval
+JCLI_SERVE_STALE = True  # serve the last known listing while jcli is unreachable
+STATS_SAMPLER = True  # poll jcli stats in the background for the stats pages history
+STATS_SAMPLE_INTERVAL = 10  # seconds between two stats samples
+STATS_HISTORY_POINTS = 360  # samples kept per counter, 360 x 10s is the last hour
+STATS_RATE_TAU = 60  # seconds, time constant of the smoothed (EWMA) message rates
+STATS_DB = True  # keep the sampled stats on disk for stats_history
+STATS_DB_FOLDER = os.path.join(DB_FOLDER, "stats")  # one memory mapped file per metric
+STATS_DB_RAW_RETENTION = 6 * 3600  # seconds of 1s resolution kept
+STATS_DB_MINUTE_RETENTION = 30 * 86400  # seconds of 1 minute rollups kept
+STATS_DB_HOUR_RETENTION = 365 * 86400  # seconds of 1 hour rollups kept, idle metrics are removed after it
+STATS_DB_SOURCES = ('smppc', 'smppsapi', 'httpapi')  # sampled sources written to disk, add 'user' for per user history
+STATS_DB_MAX_METRICS = 1000  # metric files per source at most, ~2.8 MB each with the retentions above
+STATS_STREAM_KEEPALIVE = 15  # seconds between keepalive comments on an idle stats_stream
+STATS_STREAM_MAX_CLIENTS = 50  # open stats_stream connections, each one holds a server thread
+STATS_SNAPSHOT_TTL = 5  # seconds a stats snapshot taken for a page is shared with other pages
+ALERT_BASELINE_TAU = 900  # seconds, time constant of a connector's submit rate baseline
+ALERT_DROP_RATIO = 0.2  # alert when the submit rate falls under this share of its baseline
+ALERT_MIN_RATE = 1.0  # messages per second a baseline needs before drops are alerted
+ALERT_HOLD = 3  # samples in a row under the baseline before a drop is alerted
+ALERT_STUCK_AFTER = 60  # seconds a started connector may stay unbound
+ALERT_ERROR_RATIO = 0.05  # submit_sm_resp errors per submit_sm in one sample that raise an alert
+ALERT_MIN_ERRORS = 10  # errors in one sample needed for an error alert
+ALERT_FEED_SIZE = 200  # raised/resolved events kept for the alerts page, per py4web worker
+ALERT_WEBHOOK_URL = ''  # POST alert events there as JSON (from one worker only), empty disables it
+ALERT_WEBHOOK_TIMEOUT = 5  # seconds per webhook call
+CAPACITY_WINDOW_DAYS = 7  # days of stats history the capacity report looks at by default
+
 # send email on regstration
 VERIFY_EMAIL = True
 
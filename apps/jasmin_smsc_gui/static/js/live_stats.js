@@ -0,0 +1,37 @@
+// Live stats: keeps the [data-metrics] cells of a stats page up to date from stats_stream.
+// data-metrics  space separated metric names, shown joined by '/' (e.g. submits sent/acknowledged)
+// data-limit    with data-format="percent": the value as a percentage of this limit
+// data-format   "rate" (2 decimals) or "percent"
+(function () {
+    var root = document.querySelector('[data-stream]');
+    if (!root || !window.EventSource) return;
+    var cells = root.querySelectorAll('[data-metrics]');
+    var values = {};
+
+    function format(cell, names) {
+        var parts = names.map(function (name) { return values[name]; });
+        if (parts.some(function (v) { return v === undefined || v === null; })) return null;
+        var kind = cell.getAttribute('data-format');
+        if (kind === 'rate') return parts[0].toFixed(2);
+        if (kind === 'percent') {
+            var limit = parseFloat(cell.getAttribute('data-limit'));
+            return limit > 0 ? (100 * parts[0] / limit).toFixed(1) : '-';
+        }
+        return parts.join('/');
+    }
+
+    function apply(event) {
+        var changed = JSON.parse(event.data).values;
+        for (var name in changed) values[name] = changed[name];
+        cells.forEach(function (cell) {
+            var names = cell.getAttribute('data-metrics').split(' ');
+            if (!names.some(function (name) { return name in changed; })) return;
+            var text = format(cell, names);
+            if (text !== null && cell.textContent !== text) cell.textContent = text;
+        });
+    }
+
+    var source = new EventSource(root.getAttribute('data-stream'));
+    source.addEventListener('snapshot', apply);
+    source.addEventListener('delta', apply);
+})();
@@ -1,230 +1,263 @@
-from py4web import action, request, abort, redirect, URL
+from py4web import action, request, response, abort, redirect, URL
 from yatl.helpers import A
 from .common import db, Field, session, T, cache, auth, logger, authenticated, unauthenticated, flash
 from py4web.utils.form import Form, FormStyleBulma
 from .models import MT_FILTER_TYPES
 from pydal.validators import *
-from . common import jasmin
-from .utils import cols_split
+from . common import jasmin, stats_sampler, stats_rates, stats_exporter, stats_store, stats_broadcaster, stats_alerts
+from .jrates import utilisation
+from .jexport import OPENMETRICS, PROMETHEUS
+from .jstream import TooManyClients
+from .jcache import ListingCache
+from . import jparse
+from .jcapacity import throughput, rate_profile, plan_connector, quota_overcommit
+from . import settings
+import time
 
 
 def index():
     return dict()
 
+# configured throughput each rate is measured against
+RATE_LIMITS = {'smppc': ('submit_sm_request', lambda id: db(db.connector.name == id).select(db.connector.c_submit_throughput).first(), 'c_submit_throughput'),
+               'user': ('http_requests', lambda id: db(db.j_user_cred.juser == id).select(db.j_user_cred.quota_http_throughput).first(), 'quota_http_throughput')}
+
+def rate_report(source, id=''):
+    rates = stats_rates.get(source, id)
+    report = dict(source=source, id=id, rates=rates, limit=None, utilisation=None)
+    if source in RATE_LIMITS:
+        counter, lookup, field = RATE_LIMITS[source]
+        row = lookup(id)
+        report['limit'] = row[field] if row else None
+        report['utilisation'] = utilisation(rates.get(counter, {}).get('ewma'), report['limit'])
+    return report
+
+def with_rates(source, id, items, key, value):
+    # a page view is a snapshot too: feed its counters and add the smoothed rate to each row
+    counters = {}
+    for item in items:
+        if isinstance(value(item), (int, float)):
+            counters[(source, id, key(item))] = value(item)
+    stats_rates.feed(time.time(), counters)
+    rates = stats_rates.get(source, id)
+    for item in items:
+        item.append(rates.get(key(item), {}).get('ewma'))
+    return items
+
+@action('stats_rates/<source>', method=['GET'])
+@action('stats_rates/<source>/<id>', method=['GET'])
+@action.uses(db)
+def stats_rates_api(source, id=''):
+    return rate_report(source, id)
+
 @action('stats', method=['GET', 'POST'])
 @action.uses('stats.html')
 def stats():
     return dict()
 
+@action('jcli_pool_stats', method=['GET'])
+def jcli_pool_stats():
+    return dict(pool=jasmin.pool.metrics(), list_cache=jasmin.list_cache.metrics(), policy=jasmin.policy.snapshot())
+
+@action('jcli_metrics', method=['GET'])
+def jcli_metrics():
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return jasmin.metrics.render()
+
+@action('metrics', method=['GET'])
+def metrics_export():
+    # served from the last background sample, scrapes never reach jcli
+    openmetrics = 'application/openmetrics-text' in request.headers.get('Accept', '')
+    response.headers['Content-Type'] = OPENMETRICS if openmetrics else PROMETHEUS
+    return stats_exporter.body(openmetrics)
+
+@action('stats_series/<source>', method=['GET'])
+@action('stats_series/<source>/<id>', method=['GET'])
+def stats_series(source, id=''):
+    # history kept by the background sampler, source is smppc, user, smppsapi or httpapi
+    since = request.query.get('since')
+    return stats_sampler.history(source, id, since=float(since) if since else None)
+
+@action('stats_stream', method=['GET'])
+def stats_stream():
+    # server-sent events fed by the background sampler, see js/live_stats.js
+    try:
+        events = stats_broadcaster.stream()
+    except TooManyClients as e:
+        abort(503, str(e))
+    response.headers['Content-Type'] = 'text/event-stream'
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return events
+
+@action('stats_history', method=['GET'])
+def stats_history():
+    # stats_history?metric=smppc.demo.submit_sm_request&from=...&to=...&step=60&agg=rate
+    # without metric: the stored metrics, filtered by ?prefix=
+    q = request.query
+    if not q.get('metric'):
+        return dict(metrics=stats_store.metrics(q.get('prefix', '')), store=stats_store.info())
+    end = float(q.get('to') or time.time())
+    start = float(q.get('from') or end - 3600)
+    step = float(q['step']) if q.get('step') else None
+    try:
+        return stats_store.query(q['metric'], start, end, step, q.get('agg', 'last'))
+    except ValueError as e:
+        abort(400, str(e))
+
+@action('stats_sampler', method=['GET'])
+def stats_sampler_stats():
+    return dict(stats_sampler.metrics(), stream=stats_broadcaster.metrics(), alerts=stats_alerts.metrics())
+
+def capacity_report(days, target=None):
+    end = time.time()
+    start = end - days * 86400
+    connectors = db(db.connector).select(db.connector.id, db.connector.name, db.connector.c_submit_throughput, db.connector.c_res_to)
+    names = dict((c.id, c.name) for c in connectors)
+    capacities = dict((c.name, throughput(c.c_submit_throughput)) for c in connectors)
+    plans = []
+    for c in connectors:
+        plan = plan_connector(rate_profile(stats_store, c.name, start, end), capacities[c.name], c.c_res_to, target)
+        plans.append(dict(plan, cid=c.name))
+    filters = dict((f.id, (f.filter_type, f.f_value)) for f in db(db.mt_filter).select(db.mt_filter.id, db.mt_filter.filter_type, db.mt_filter.f_value))
+    routes = [([names[i] for i in r.mt_connectors or [] if i in names], [filters[i] for i in r.mt_filters or [] if i in filters])
+              for r in db(db.mtroute).select(db.mtroute.mt_connectors, db.mtroute.mt_filters)]
+    groups = dict((g.id, g.name) for g in db(db.j_group).select(db.j_group.id, db.j_group.name))
+    gids = dict((u.j_uid, groups.get(u.j_group)) for u in db(db.j_user).select(db.j_user.j_uid, db.j_user.j_group))
+    users = [(u.juser, gids.get(u.juser), u.quota_http_throughput, u.quota_smpps_throughput)
+             for u in db(db.j_user_cred).select(db.j_user_cred.juser, db.j_user_cred.quota_http_throughput, db.j_user_cred.quota_smpps_throughput)]
+    return dict(start=start, end=end, days=days, target=target, connectors=plans,
+                overcommitted=quota_overcommit(users, routes, capacities))
+
+@action('capacity', method=['GET'])
+@action.uses('capacity.html', db)
+def capacity():
+    q = request.query
+    return capacity_report(float(q.get('days') or settings.CAPACITY_WINDOW_DAYS), float(q['target']) if q.get('target') else None)
+
+@action('capacity_report', method=['GET'])
+@action.uses(db)
+def capacity_report_api():
+    # capacity_report?days=7&target=<MPS each connector should carry, default its peak>
+    q = request.query
+    try:
+        return capacity_report(float(q.get('days') or settings.CAPACITY_WINDOW_DAYS), float(q['target']) if q.get('target') else None)
+    except ValueError as e:
+        abort(400, str(e))
+
+@action('alerts', method=['GET'])
+@action.uses('alerts.html')
+def alerts():
+    feed = stats_alerts.alerts()
+    at = lambda t: time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(t))
+    active = [dict(a, at=at(a['raised_at'])) for a in feed['active']]
+    events = [dict(e, at=at(e.get('resolved_at') or e['raised_at'])) for e in reversed(feed['events'])]
+    return dict(active=active, events=events)
+
+@action('alerts_feed', method=['GET'])
+def alerts_feed():
+    # alerts_feed?since=<seq> for the events after the last one seen, seq counts per worker
+    # process: start over from 0 when the pid in the reply changes
+    return stats_alerts.alerts(since=int(request.query.get('since') or 0))
+
+@action('alerts_webhook_test', method=['POST'])
+def alerts_webhook_test():
+    try:
+        return dict(status=stats_alerts.test_webhook())
+    except Exception as e:
+        abort(502, str(e))
+
+@action('jcli_slow_log', method=['GET'])
+def jcli_slow_log():
+    return dict(threshold=jasmin.metrics.slow_threshold, slow=jasmin.metrics.slow())
+
 @action('users_stats', method=['GET', 'POST'])
 @action('users_stats/<usr>', method=['GET', 'POST'])
 @action.uses('users_stats.html')
 def users_stats(usr):
-    usr=usr
-    tt = jasmin.stats(['user',usr])
-    users = []
-    for t in tt[2:-1]:
-        user = []
-        r = str.split(t)
-        l = len(r)
-        if l ==4:
-            ite = r[0][1:]
-            tpe = r[1]+r[2]
-            val = r[3]
-        else:
-            ite = r[0][1:]
-            tpe = r[1]+r[2]
-            if r[0][1:4] == 'bou':
-                val = r[3]+" "+r[4]+" "+r[5]+" "+r[6]+" "+r[7]+" "+r[8]
-            else:
-                val = r[3]+" "+r[4]
-        user.append(ite)
-        user.append(tpe)
-        user.append(val)
-        users.append(user)
+    items = jparse.parse_listing('stats_user', jasmin.stats(['user', usr]))
+    users = [[s.item, s.type, s.value] for s in items]
+    with_rates('user_detail', usr, users, key=lambda u: u[1] + ':' + u[0], value=lambda u: u[2])
     return dict(usr=usr,items=users)
 
 @action('smppc_stats', method=['GET', 'POST'])
 @action('smppc_stats/<con>', method=['GET', 'POST'])
 @action.uses('smppc_stats.html')
 def smppc_stats(con):
-    con = con
-    tt = jasmin.stats(['smppc', con])
-    connectors = []
-    for t in tt[2:-1]:
-        connector = []
-        r = str.split(t)
-        l = len(r)
-        if l ==2:
-            fld = r[0][1:]
-            val = r[1]
-            connector.append(fld)
-            connector.append(val)
-            connectors.append(connector)
-        elif l == 1: #weird shit here
-            fld = r[0][1:]
-            val = "What is this"
-            
-        else:
-            fld = r[0][1:]
-            val = r[1]+" "+r[2]
-            connector.append(fld)
-            connector.append(val)
-            connectors.append(connector)
-
-        
+    items = jparse.parse_listing('stats_items', jasmin.stats(['smppc', con]))
+    connectors = [[s.item, s.value] for s in items]
+    with_rates('smppc_detail', con, connectors, key=lambda c: c[0], value=lambda c: c[1])
     return dict(con=con,items=connectors)
 
+snapshots = ListingCache(ttl=settings.STATS_SNAPSHOT_TTL)
+
+def current_snapshot(details=False):
+    # the background sampler's snapshot while fresh, else one taken now and shared for STATS_SNAPSHOT_TTL
+    latest = stats_sampler.latest
+    if not details and latest is not None and time.time() - latest.taken_at < 2 * stats_sampler.interval:
+        return latest
+    return snapshots.get('details' if details else 'summary', lambda: jasmin.stats_snapshot(details=details))
+
+@action('stats_snapshot', method=['GET'])
+def stats_snapshot():
+    snapshot = current_snapshot(details=request.query.get('details', '1') != '0')
+    if snapshot is None:
+        abort(503, jasmin.outcome or 'No stats from jCli')
+    return snapshot.as_dict()
+
+def nd(value):
+    return 'ND' if value is None else value
+
 @action('httpapi_stats', method=['GET', 'POST'])
 @action.uses('httpapi_stats.html')
 def httpapi_stats():
-    items = []
-    tt=(jasmin.stats(['httpapi']))
-    lines=tt
-    if not lines:
-        return items
-        
-    for t in tt[2:-1]:
-        item = []
-        r = str.split(t)
-        l = len(r)
-        if l ==2:
-            fld = r[0][1:]
-            val = r[1]
-            item.append(fld)
-            item.append(val)
-            items.append(item)
-        else:
-            fld = r[0][1:]
-            val = r[1]+" "+r[2]
-            
-            item.append(fld)
-            item.append(val)
-            items.append(item)
-           
-    return dict(items=items)
+    snapshot = current_snapshot()
+    if snapshot is None:
+        return dict(items=[])
+    return dict(items=[[item, nd(value)] for item, value in snapshot.httpapi.items()])
 
 @action('smppsapi_stats', method=['GET', 'POST'])
 @action.uses('smppsapi_stats.html')
 def smppsapi_stats():
-    items = []
-    tt=(jasmin.stats(['smppsapi']))
-    lines=tt
-    if not lines:
-        return items
-        
-    for t in tt[2:-1]:
-        item = []
-        r = str.split(t)
-        l = len(r)
-        if l ==2:
-            fld = r[0][1:]
-            val = r[1]
-            item.append(fld)
-            item.append(val)
-            items.append(item)
-        else:
-            fld = r[0][1:]
-            val = r[1]+" "+r[2]
-            
-            item.append(fld)
-            item.append(val)
-            items.append(item)
-           
-    return dict(items=items)
+    snapshot = current_snapshot()
+    if snapshot is None:
+        return dict(items=[])
+    return dict(items=[[item, nd(value)] for item, value in snapshot.smppsapi.items()])
 
 @action('smppcs_stats', method=['GET', 'POST'])
-@action.uses('smppcs_stats.html')
+@action.uses('smppcs_stats.html', db)
 def smppcs_stats():
     connectors = []
-    rows=(jasmin.stats(['smppcs']))
-    lines=rows
-    if not lines:
-        return connectors
-    tt = cols_split(lines[2:-2])
-    for row in tt:
-        connector={}
-        n = len(row)
-        if n == 11:
-            connector.update(
-                             cid=row[0][1:],
-                             ca=row[1]+ " "+row[2],
-                             ba=row[3]+ " "+row[4],
-                             da= row[5]+" "+row[6],
-                             sm=row[7],
-                             dl=row[8],
-                             qos=row[9],
-                             other=row[10]
-                            )
-        elif n == 10:
-            connector.update(
-                             cid=row[0][1:],
-                             ca=row[1]+ " "+row[2],
-                             ba=row[3],
-                             da= row[4]+" "+row[5],
-                             sm=row[6],
-                             dl=row[7],
-                             qos=row[8],
-                             other=row[9]
-                            )
-        elif n == 8:
-            connector.update(
-                             cid=row[0][1:],
-                             ca=row[1],
-                             ba=row[2],
-                             da= row[3],
-                             sm=row[4],
-                             dl=row[5],
-                             qos=row[6],
-                             other=row[7]
-                            )
+    snapshot = current_snapshot()
+    if snapshot is None:
+        return dict(cons=connectors, window=0)
+    limits = dict((r.name, r.c_submit_throughput) for r in db(db.connector).select(db.connector.name, db.connector.c_submit_throughput))
+    for c in snapshot.smppcs:
+        connector = dict(cid=c.cid, ca=c.connected_at, ba=c.bound_at, da=c.disconnected_at,
+                         sm='%s/%s' % (nd(c.submit_sm_request), nd(c.submit_sm)),
+                         dl='%s/%s' % (nd(c.deliver_sm), nd(c.data_sm)),
+                         qos=nd(c.qos_errors), other=nd(c.other_errors))
+        connector['submits_window'] = stats_sampler.delta('smppc', c.cid, 'submit_sm')
+        connector['rate'] = stats_rates.ewma('smppc', c.cid, 'submit_sm_request')
+        connector['limit'] = limits.get(c.cid)
+        connector['utilisation'] = utilisation(connector['rate'], connector['limit'])
         connectors.append(connector)
-    return dict(cons = connectors)
+    return dict(cons = connectors, window = round(stats_sampler.span() / 60))
     
 @action('user_stats', method=['GET', 'POST'])
-@action.uses('user_stats.html')
+@action.uses('user_stats.html', db)
 def user_stats():
     users = []
-    rows=(jasmin.stats(['users']))
-    lines=rows
-    if not lines:
-        return users
-    tt = cols_split(lines[2:-2])
-    for row in tt:
-        n = len(row)
-        user={}
-        if n == 6:
-            if row[1] == '0': #must be http binds
-                user.update(
-                    uid=row[0][1:],
-                    smpp_bc=row[1],
-                    smpp_la=row[2],
-                    http_rc=row[3],
-                    http_la=row[4]+" "+row[5],
-                )
-            else:
-                user.update(
-                    uid=row[0][1:],
-                    smpp_bc=row[1],
-                    smpp_la=row[2]+" "+row[3],
-                    http_rc=row[4],
-                    http_la=row[5]
-                )
-        elif n == 7: # both http and smpp activity
-            user.update(
-                    uid=row[0][1:],
-                    smpp_bc=row[1],
-                    smpp_la=row[2] + " "+row[3],
-                    http_rc=row[4],
-                    http_la=row[5] + " "+row[6]
-                    )
-        else:
-            user.update(
-                    uid=row[0][1:],
-                    smpp_bc=row[1],
-                    smpp_la=row[2],
-                    http_rc=row[3],
-                    http_la=row[4]
-                    )
+    snapshot = current_snapshot()
+    if snapshot is None:
+        return dict(users=users, window=0)
+    limits = dict((r.juser, r.quota_http_throughput) for r in db(db.j_user_cred).select(db.j_user_cred.juser, db.j_user_cred.quota_http_throughput))
+    for u in snapshot.users:
+        user = dict(uid=u.uid, smpp_bc=nd(u.smpp_bound), smpp_la=u.smpp_last_activity,
+                    http_rc=nd(u.http_requests), http_la=u.http_last_activity)
+        user['http_window'] = stats_sampler.delta('user', u.uid, 'http_requests')
+        user['http_rate'] = stats_rates.ewma('user', u.uid, 'http_requests')
+        user['limit'] = limits.get(u.uid)
+        user['utilisation'] = utilisation(user['http_rate'], user['limit'])
         users.append(user)
-    return dict(users=users)
+    return dict(users=users, window = round(stats_sampler.span() / 60))
@@ -0,0 +1,246 @@
+"""
+Synchronise the local tables with what is configured in Jasmin
+
+All listings are fetched at once, then the per user credentials and per
+connector details, over at most JCLI_SYNC_CONCURRENCY parallel jCli
+sessions. The result is compared with the local rows in memory and only
+the differences are written, inserts, updates and deletes, in a single
+transaction.
+
+    report = sync_database()
+    report['phases']    # {'listings': 0.08, 'details': 0.4, 'parse': ..., 'diff': ..., 'apply': ..., 'commit': ...}
+    report['tables']    # {'j_user': {'inserted': 3, 'updated': 1, 'deleted': 0, 'unchanged': 40}, ...}
+"""
+import asyncio
+import time
+
+from .common import db
+from .ajtel import AsyncJptelnet
+from .jparse import parse_listing
+from . import settings
+
+FAMILIES = ('groups', 'users', 'filters', 'smppcs', 'httpcs', 'mtroutes', 'moroutes')
+# what else has to be fetched to resolve the references of a family
+FAMILY_NEEDS = {'users': ('groups',), 'mtroutes': ('filters', 'smppcs', 'httpcs'),
+                'moroutes': ('filters', 'smppcs', 'httpcs')}
+LIST_TYPES = {'groups': 'groups', 'users': 'users', 'filters': 'filters', 'smppcs': 'smppcs',
+              'httpcs': 'httpcs', 'mtroutes': 'mtrouter', 'moroutes': 'morouter'}
+# 'user -s' key prefix -> j_user_cred field prefix
+CRED_PREFIXES = (('defaultvalue_', 'default_'), ('valuefilter_', 'value_'),
+                 ('authorization_', 'author_'), ('quota_', 'quota_'))
+
+
+def _closure(families):
+    wanted = set(families or FAMILIES)
+    for family in list(wanted):
+        wanted.update(FAMILY_NEEDS.get(family, ()))
+    return [f for f in FAMILIES if f in wanted]
+
+
+async def _fetch(families, timings):
+    """Listings, then user credentials and connector details, all concurrently"""
+    client = AsyncJptelnet(concurrency=settings.JCLI_SYNC_CONCURRENCY)
+    try:
+        started = time.monotonic()
+        results = await asyncio.gather(*[client.list_it(LIST_TYPES[f]) for f in families],
+                                       return_exceptions=True)
+        listings = dict(zip(families, results))
+        timings['listings'] = time.monotonic() - started
+
+        started = time.monotonic()
+        users = parse_listing('users', _ok(listings.get('users')))
+        smppcs = parse_listing('smppcs', _ok(listings.get('smppcs')))
+        uids = [u.uid.lstrip('!') for u in users]
+        cids = [c.cid for c in smppcs]
+        details = await asyncio.gather(*([client.users(['get_creds', uid]) for uid in uids] +
+                                         [client.connector(['show', cid]) for cid in cids]),
+                                       return_exceptions=True)
+        timings['details'] = time.monotonic() - started
+        return listings, dict(zip(uids, details[:len(uids)])), dict(zip(cids, details[len(uids):]))
+    finally:
+        await client.aclose()
+
+
+def _ok(result):
+    return None if isinstance(result, BaseException) else result
+
+
+def parse_creds(lines):
+    """'user -s' output as j_user_cred fields, plus uid/username/gid"""
+    creds = {}
+    for line in lines:
+        splits = line.split(None, 3)
+        if len(splits) == 4 and splits[0] in ('mt_messaging_cred', 'smpps_cred'):
+            key, value = splits[1] + '_' + splits[2], splits[3]
+        elif len(splits) >= 2 and splits[0] not in ('user', 'jcli'):
+            key, value = splits[0], line.split(None, 1)[1].strip()
+        else:
+            continue
+        for prefix, field in CRED_PREFIXES:
+            if key.startswith(prefix):
+                key = field + key[len(prefix):]
+                break
+        creds[key] = value
+    return creds
+
+def parse_connector(lines):
+    """'smppccm -s' output as connector fields"""
+    fields = {}
+    for line in lines:
+        splits = line.split(None, 1)
+        if not splits or splits[0] in ('smppccm', 'jcli'):
+            continue
+        key = 'c_' + splits[0]
+        if key in db.connector.fields:
+            fields[key] = splits[1].strip() if len(splits) > 1 else ''
+    return fields
+
+
+def _same(local, remote):
+    if isinstance(remote, list):
+        return list(local or []) == remote
+    return ('' if local is None else str(local)) == ('' if remote is None else str(remote))
+
+def apply_diff(table, key, remote, counts, timings):
+    """Make 'table' hold exactly the 'remote' rows ({key value: fields}), returns {key value: id}"""
+    started = time.monotonic()
+    fields = sorted(set(f for row in remote.values() for f in row))
+    local = {}
+    stale = []
+    for row in db(table).select(table.id, table[key], *[table[f] for f in fields]):
+        if row[key] in local or row[key] not in remote:
+            stale.append(row.id)    # gone from Jasmin, or a duplicate left by an older import
+        else:
+            local[row[key]] = row
+    inserts, updates, ids = [], [], {}
+    for ident, row in remote.items():
+        current = local.get(ident)
+        if current is None:
+            inserts.append((ident, dict(row, **{key: ident})))
+            continue
+        ids[ident] = current.id
+        changed = dict((f, v) for f, v in row.items() if not _same(current[f], v))
+        if changed:
+            updates.append((current.id, changed))
+    applying = time.monotonic()
+    timings['diff'] = timings.get('diff', 0.0) + applying - started
+    for ident, row in inserts:
+        ids[ident] = table.insert(**row)
+    for id, changed in updates:
+        db(table.id == id).update(**changed)
+    if stale:
+        db(table.id.belongs(stale)).delete()
+    timings['apply'] = timings.get('apply', 0.0) + time.monotonic() - applying
+    counts[table._tablename] = dict(inserted=len(inserts), updated=len(updates), deleted=len(stale),
+                                    unchanged=len(remote) - len(inserts) - len(updates))
+    return ids
+
+
+def sync_database(families=None):
+    """Bring the local tables in line with Jasmin, returns a report with timings per phase"""
+    started = time.monotonic()
+    families = _closure(families)
+    timings = {}
+    listings, creds, shows = asyncio.run(_fetch(families, timings))
+
+    t = time.monotonic()
+    errors = []
+    parsed = {}
+    for family in families:
+        result = listings.get(family)
+        if not result or isinstance(result, BaseException):
+            # never mistake a failed fetch for an empty configuration
+            errors.append('%s: %s' % (family, result if isinstance(result, BaseException) else 'no answer from jCli'))
+            continue
+        parsed[family] = parse_listing(LIST_TYPES[family], result)
+    remote = {}
+    if 'groups' in parsed:
+        remote['groups'] = dict((g.gid.lstrip('!'), {}) for g in parsed['groups'])
+    if 'users' in parsed:
+        remote['users'], remote['creds'] = {}, {}
+        for u in parsed['users']:
+            uid = u.uid.lstrip('!')
+            remote['users'][uid] = dict(username=u.username, gid=u.gid.lstrip('!'))
+            lines = creds.get(uid)
+            if lines and not isinstance(lines, BaseException):
+                fields = parse_creds(lines)
+                remote['creds'][uid] = dict((f, fields[f]) for f in db.j_user_cred.fields
+                                            if f in fields and f not in ('id', 'juser'))
+            else:
+                errors.append('credentials of %s: %s' % (uid, lines))
+    if 'filters' in parsed:
+        remote['filters'] = dict((f.fid, dict(filter_type=f.type, filter_route='/'.join(f.routes), f_value=f.value))
+                                 for f in parsed['filters'])
+    if 'smppcs' in parsed:
+        remote['smppcs'] = {}
+        for c in parsed['smppcs']:
+            lines = shows.get(c.cid)
+            if lines and not isinstance(lines, BaseException):
+                remote['smppcs'][c.cid] = parse_connector(lines)
+            else:
+                errors.append('connector %s: %s' % (c.cid, lines))
+                remote['smppcs'][c.cid] = {}
+    if 'httpcs' in parsed:
+        remote['httpcs'] = dict((c.cid, dict(hcon_method=c.method, hcon_url=c.url)) for c in parsed['httpcs'])
+    timings['parse'] = time.monotonic() - t
+
+    counts = {}
+    if 'groups' in remote:
+        apply_diff(db.j_group, 'name', remote['groups'], counts, timings)
+    group_ids = dict((r.name, r.id) for r in db(db.j_group).select(db.j_group.id, db.j_group.name))
+    if 'users' in remote:
+        apply_diff(db.j_user, 'j_uid', dict((uid, dict(username=u['username'], j_group=group_ids.get(u['gid'])))
+                                            for uid, u in remote['users'].items()), counts, timings)
+        # keep the stored credentials of users whose 'user -s' failed
+        user_creds = dict((uid, remote['creds'].get(uid)) for uid in remote['users'])
+        for uid, fields in user_creds.items():
+            if fields is None:
+                row = db(db.j_user_cred.juser == uid).select().first()
+                user_creds[uid] = dict((f, row[f]) for f in db.j_user_cred.fields if f not in ('id', 'juser')) if row else {}
+        apply_diff(db.j_user_cred, 'juser', user_creds, counts, timings)
+    fids = {}
+    if 'filters' in remote:
+        fids = apply_diff(db.mt_filter, 'fid', remote['filters'], counts, timings)
+    smppc_ids = dict((r.name, r.id) for r in db(db.connector).select(db.connector.id, db.connector.name))
+    if 'smppcs' in remote:
+        # a connector whose details failed keeps what is stored
+        details = dict((cid, fields) for cid, fields in remote['smppcs'].items() if fields)
+        for cid in remote['smppcs']:
+            if cid not in details:
+                row = db(db.connector.name == cid).select().first()
+                details[cid] = dict((f, row[f]) for f in db.connector.fields if f not in ('id', 'name')) if row else {}
+        smppc_ids = apply_diff(db.connector, 'name', details, counts, timings)
+    httpc_ids = dict((r.hcon_cid, r.id) for r in db(db.http_cons).select(db.http_cons.id, db.http_cons.hcon_cid))
+    if 'httpcs' in remote:
+        httpc_ids = apply_diff(db.http_cons, 'hcon_cid', remote['httpcs'], counts, timings)
+    # routes list filters by their description, e.g. <U (uid=sandra)>
+    by_description = dict((f.description, fids.get(f.fid)) for f in parsed.get('filters', ()))
+
+    def refs(route):
+        smpp, http = [], []
+        for c in route.connectors:
+            kind, _, cid = c.partition('(')
+            cid = cid.rstrip(')')
+            if kind == 'smppc' and cid in smppc_ids:
+                smpp.append(smppc_ids[cid])
+            elif kind == 'http' and cid in httpc_ids:
+                http.append(httpc_ids[cid])
+        return smpp, http, [by_description[f] for f in route.filters if by_description.get(f)]
+
+    if 'mtroutes' in parsed:
+        routes = {}
+        for r in parsed['mtroutes']:
+            smpp, http, filters = refs(r)
+            routes[str(r.order)] = dict(mt_type=r.type, mt_connectors=smpp, mt_filters=filters, mt_rate=r.rate)
+        apply_diff(db.mtroute, 'mt_order', routes, counts, timings)
+    if 'moroutes' in parsed:
+        routes = {}
+        for r in parsed['moroutes']:
+            smpp, http, filters = refs(r)
+            routes[str(r.order)] = dict(mo_type=r.type, mo_connectors=smpp, mo_http_cons=http, mo_filters=filters)
+        apply_diff(db.moroute, 'mo_order', routes, counts, timings)
+    t = time.monotonic()
+    db.commit()
+    timings['commit'] = time.monotonic() - t
+    return dict(phases=dict((k, round(v, 4)) for k, v in timings.items()), tables=counts, errors=errors,
+                elapsed=round(time.monotonic() - started, 4))
@@ -4,7 +4,7 @@ from yatl.helpers import A
 from .common import db, session, Field, T, cache, auth, logger, authenticated, unauthenticated, flash
 from py4web.utils.form import Form, FormStyleBulma
 from pydal.validators import *
-from .utils import cols_split
+from .jparse import parse_listing
 
 from . common import jasmin
 
@@ -15,22 +15,13 @@ def index():
 
 def list_groups():
     groups = []
-    rows=(jasmin.list_it('groups'))
-    if not rows:
-        return groups
-    tt = cols_split(rows[2:-2])
-    group=dict(gid='')
-    for t in tt:
-        group=dict(gid = '')
-
-        group.update(
-               gid=t[0][1:],
-                )
+    for t in parse_listing('groups', jasmin.list_it('groups')):
+        group = dict(gid=t.gid)
         groups.append(group)
         query = (db.j_group.name == group['gid'])
         cc = db(query).select().first()
         if not cc:
-            if not group['gid'][0] == '!': # this is the result of disabling or enabling a group
+            if t.enabled: # a '!' prefix is the result of disabling or enabling a group
                 db.j_group.insert(name=group['gid'])
 
     return groups
@@ -231,68 +222,16 @@ def manage_users(user=None, action=None):
 
 def list_users():
     users = []
-    rows=(jasmin.list_it('users'))
-    if not rows:
-        return users
-    tt = cols_split(rows[2:-2])
-    user={}
-    w1=''
-    w2=''
-    for t in tt:
-        user={}
-        if len(t) == 6:
-            l = len(t[5])
-            i=0
-            while i < l:
-                if t[5][i] == '/':
-                    w1=t[5][0:i]
-                    i = i + 1
-                else:
-                    i = i + 1
-            j=len(w1)
-            j = j+1
-            w2=t[5][j:]
-            user.update(
-                uid=t[0][1:],
-                gid=t[1],
-                username=t[2],
-                balanceh=t[3],
-                balances=t[4],
-                mt_http=w1,
-                mt_smpp=w2,
-                )
-        else:
-            l = len(t[7])
-            i=0
-            while i < l:
-                if t[7][i] == '/':
-                    w1=t[7][0:i]
-                    i = i + 1
-                else:
-                    i = i + 1
-            j=len(w1)
-            j = j+1
-            w2=t[7][j:]
-            user.update(
-                uid=t[0][1:],
-                gid=t[1],
-                username=t[2],
-                balanceh=t[3]+" "+t[4],
-                balances=t[5]+" "+t[6],
-                mt_http=w1,
-                mt_smpp=w2,
-                
-                )
+    for t in parse_listing('users', jasmin.list_it('users')):
+        user = dict(
+            uid=t.uid,
+            gid=t.gid,
+            username=t.username,
+            balanceh=t.balance,
+            balances=t.sms_count,
+            mt_http=t.throughput_http,
+            mt_smpp=t.throughput_smpp,
+            )
         users.append(user)
-        query = (db.j_user.username == user['username'])
-        cc=db(query).select().first()
-        #if not cc:
-        #    if user['gid'][0] == '!':
-        #        aa = user['gid'][1:]
-        #        group = get_gid(user['gid'][1:])
-        #    else:
-        #        group = get_gid(user['gid'])
-        #    u_id = db.j_user.insert(gw = session.g_id, j_uid = user['uid'], j_group=group, username = user['username'])
-        #    cred = db.j_user_cred.insert(gw = session.g_id, juser = user['uid'], quota_http_throughput = user['mt_http'], quota_balance=user['balanceh'],quota_smpps_throughput=user['mt_smpp'], quota_sms_count = user['balances'])
     return users
 
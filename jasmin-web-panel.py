@@ -5,8 +5,20 @@ A working web interface that mimics the Jasmin web panel shown in the user's ima
 """
 
 from flask import Flask, render_template_string, request, jsonify
+import codecs
+import csv
+import http.client
+import json
+import mmap
 import os
+import queue
 import socket
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 app = Flask(__name__)
@@ -279,6 +291,30 @@ HTML_TEMPLATE = '''
                 
                 <div id="smsResponse" class="response-area" style="display: none;"></div>
             </div>
+            
+            <div class="form-section">
+                <h3>Bulk Campaign</h3>
+                <form id="campaignForm">
+                    <div class="form-group">
+                        <label for="campaignFile">Recipients (CSV, one number per row, optional content column):</label>
+                        <input type="file" id="campaignFile" name="file" accept=".csv,text/csv" required>
+                    </div>
+                    
+                    <div class="form-group">
+                        <label for="campaignContent">Message Content (for rows without their own):</label>
+                        <textarea id="campaignContent" name="content" rows="3" placeholder="Your campaign message here..."></textarea>
+                    </div>
+                    
+                    <div class="form-group">
+                        <label for="campaignMps">Messages per second:</label>
+                        <input type="text" id="campaignMps" name="mps" value="{{ campaign_mps }}">
+                    </div>
+                    
+                    <button type="submit" class="btn btn-success">Start Campaign</button>
+                </form>
+                
+                <div id="campaignResponse" class="response-area" style="display: none;"></div>
+            </div>
         </div>
         
         <div id="smppcm" class="section" style="display: none;">
@@ -424,6 +460,28 @@ MO Routes:
             }
         });
         
+        // Upload a campaign, then poll its progress until it is over
+        document.getElementById('campaignForm').addEventListener('submit', async function(e) {
+            e.preventDefault();
+            
+            const responseDiv = document.getElementById('campaignResponse');
+            responseDiv.style.display = 'block';
+            responseDiv.textContent = 'Uploading...';
+            
+            try {
+                const response = await fetch('/campaigns', {method: 'POST', body: new FormData(e.target)});
+                let result = await response.json();
+                responseDiv.textContent = JSON.stringify(result, null, 2);
+                while (result.id && (result.state === 'running' || result.state === 'ready')) {
+                    await new Promise(resolve => setTimeout(resolve, 2000));
+                    result = await (await fetch('/campaigns/' + result.id)).json();
+                    responseDiv.textContent = JSON.stringify(result, null, 2);
+                }
+            } catch (error) {
+                responseDiv.textContent = 'Error: ' + error.message;
+            }
+        });
+        
         // Auto-refresh service status every 30 seconds
         setInterval(async function() {
             try {
@@ -439,25 +497,426 @@ MO Routes:
 </html>
 '''
 
-def check_port(host, port):
+# name -> (host, port) probed for the dashboard, /api/status and /ping
+SERVICES = {
+    'http_api': ('localhost', 1401),
+    'jcli': ('localhost', 8990),
+    'smpp': ('localhost', 2775),
+    'rabbitmq': ('localhost', 5672),
+    'redis': (os.environ.get('REDIS_HOST', 'localhost'), int(os.environ.get('REDIS_PORT', 6379))),
+}
+PROBE_TIMEOUT = float(os.environ.get('PROBE_TIMEOUT', 1))    # seconds per connect
+PROBE_INTERVAL = float(os.environ.get('PROBE_INTERVAL', 5))  # seconds between background refreshes
+PROBE_TTL = float(os.environ.get('PROBE_TTL', 15))           # older results are refreshed on read
+
+def check_port(host, port, timeout=PROBE_TIMEOUT):
     """Check if a port is open"""
     try:
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-            sock.settimeout(1)
+            sock.settimeout(timeout)
             result = sock.connect_ex((host, port))
             return result == 0
-    except:
+    except OSError:
         return False
 
+class ServiceProbes:
+    """Service status shared by all requests
+
+    All ports are probed at once, so a refresh takes one timeout however many
+    services are down. A background thread refreshes every PROBE_INTERVAL;
+    readers get the last result straight away and only the very first read
+    waits for a probe.
+    """
+
+    def __init__(self, services, interval=PROBE_INTERVAL, ttl=PROBE_TTL):
+        self.services = services
+        self.interval = interval
+        self.ttl = ttl
+        self.status = None
+        self.checked_at = 0.0
+        self.took = None
+        self._pool = ThreadPoolExecutor(max_workers=len(services), thread_name_prefix='probe')
+        self._refreshing = threading.Lock()
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def refresh(self):
+        """Probe everything now, one refresh at a time"""
+        with self._refreshing:
+            started = time.monotonic()
+            futures = dict((name, self._pool.submit(check_port, host, port))
+                           for name, (host, port) in self.services.items())
+            self.status = dict((name, f.result()) for name, f in futures.items())
+            self.checked_at = time.time()
+            self.took = time.monotonic() - started
+        return self.status
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"service probe failed: {e}")
+            time.sleep(self.interval)
+
+    def start(self):
+        with self._start_lock:
+            if not self._started:
+                self._started = True
+                threading.Thread(target=self._run, name='probe-refresher', daemon=True).start()
+
+    def get(self):
+        self.start()
+        status = self.status
+        if status is None:
+            return dict(self.refresh())
+        if time.time() - self.checked_at > self.ttl and not self._refreshing.locked():
+            threading.Thread(target=self.refresh, daemon=True).start()
+        return dict(status)
+
+probes = ServiceProbes(SERVICES)
+
 def get_service_status():
     """Get the status of all Jasmin services"""
-    return {
-        'http_api': check_port('localhost', 1401),
-        'jcli': check_port('localhost', 8990),
-        'smpp': check_port('localhost', 2775),
-        'rabbitmq': check_port('localhost', 5672),
-        'redis': check_port('localhost', 6379)
-    }
+    return probes.get()
+
+# Jasmin HTTP API used by send_sms
+JASMIN_HTTP_URL = os.environ.get('JASMIN_HTTP_URL', 'http://localhost:1401')
+JASMIN_HTTP_USERNAME = os.environ.get('JASMIN_HTTP_USERNAME', 'admin')          # same defaults as env.example
+JASMIN_HTTP_PASSWORD = os.environ.get('JASMIN_HTTP_PASSWORD', 'changeme123')    # and jasmin-with-jcli.py
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 8))      # requests in flight to the HTTP API
+HTTP_TIMEOUT = float(os.environ.get('HTTP_TIMEOUT', 10))       # seconds per request
+HTTP_POOL_WAIT = float(os.environ.get('HTTP_POOL_WAIT', 2))    # seconds to wait for a free slot
+
+class PoolBusy(Exception):
+    pass
+
+class JasminHTTPClient:
+    """Keep-alive connections to the Jasmin HTTP API
+
+    At most 'size' requests run at once, a caller waits up to 'wait' seconds
+    for a slot and then gets PoolBusy. Idle connections are reused most
+    recent first; a reused connection the server already closed is replaced
+    and the request sent once more, before anything was answered on it.
+    """
+
+    def __init__(self, url, size=HTTP_POOL_SIZE, timeout=HTTP_TIMEOUT, wait=HTTP_POOL_WAIT):
+        parsed = urllib.parse.urlsplit(url)
+        self.connection_class = http.client.HTTPSConnection if parsed.scheme == 'https' else http.client.HTTPConnection
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.base = parsed.path.rstrip('/')
+        self.timeout = timeout
+        self.wait = wait
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self.counters = dict(requests=0, connects=0, reused=0, retried=0, busy=0, errors=0)
+
+    def request(self, method, path, body=None, headers=None):
+        """(status, body) of one request"""
+        if not self._slots.acquire(timeout=self.wait):
+            self.counters['busy'] += 1
+            raise PoolBusy(f'{self.size} requests already in flight to the Jasmin HTTP API')
+        try:
+            self.counters['requests'] += 1
+            try:
+                conn, reused = self._idle.get_nowait(), True
+                self.counters['reused'] += 1
+            except queue.Empty:
+                conn, reused = self._connect(), False
+            while True:
+                try:
+                    conn.request(method, self.base + path, body=body, headers=headers or {})
+                    response = conn.getresponse()
+                    data = response.read()
+                    break
+                except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                    conn.close()
+                    if not reused:
+                        self.counters['errors'] += 1
+                        raise
+                    self.counters['retried'] += 1
+                    conn, reused = self._connect(), False
+                except Exception:
+                    conn.close()
+                    self.counters['errors'] += 1
+                    raise
+            if response.will_close:
+                conn.close()
+            else:
+                self._idle.put(conn)
+            return response.status, data
+        finally:
+            self._slots.release()
+
+    def _connect(self):
+        self.counters['connects'] += 1
+        return self.connection_class(self.host, self.port, timeout=self.timeout)
+
+    def send(self, username, password, to, content, **extra):
+        """Submit one SMS-MT, the result carries Jasmin's message id or its error"""
+        params = dict(extra, username=username, password=password, to=to, content=content)
+        status, body = self.request('GET', '/send?' + urllib.parse.urlencode(params))
+        return parse_send_response(status, body)
+
+    def metrics(self):
+        return dict(self.counters, size=self.size, idle=self._idle.qsize())
+
+def parse_send_response(status, body):
+    """Jasmin answers 'Success "<id>"' or 'Error "<reason>"', the stand-in answers JSON"""
+    text = body.decode('utf-8', 'replace').strip()
+    result = {'http_status': status, 'message_id': None, 'error': None}
+    if text.startswith('{'):
+        try:
+            data = json.loads(text)
+        except ValueError:
+            data = {}
+        result['message_id'] = data.get('message_id')
+        if status != 200 or data.get('status', 'success') != 'success':
+            result['error'] = data.get('message') or text
+    elif status == 200 and text.startswith('Success'):
+        result['message_id'] = text.split('"')[1] if '"' in text else text[len('Success'):].strip()
+    else:
+        result['error'] = text[len('Error'):].strip().strip('"') if text.startswith('Error') else text
+    result['status'] = 'error' if result['error'] or not result['message_id'] else 'success'
+    return result
+
+jasmin_http = JasminHTTPClient(JASMIN_HTTP_URL)
+
+# Bulk campaigns: a CSV upload becomes normalised, deduplicated targets sent at a set MPS
+CAMPAIGN_DIR = os.environ.get('CAMPAIGN_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'campaigns'))
+CAMPAIGN_WORKERS = int(os.environ.get('CAMPAIGN_WORKERS', 8))         # sends in flight per campaign
+CAMPAIGN_MPS = float(os.environ.get('CAMPAIGN_MPS', 50))              # default submit rate
+CAMPAIGN_COUNTRY_CODE = os.environ.get('CAMPAIGN_COUNTRY_CODE', '')   # prefixed to national numbers starting with 0
+
+PENDING, INFLIGHT, SENT, FAILED = range(4)
+STATUS_NAMES = ('pending', 'inflight', 'sent', 'failed')
+NUMBER_COLUMNS = ('msisdn', 'to', 'number', 'phone', 'mobile')
+CONTENT_COLUMNS = ('content', 'message', 'text')
+
+def normalise_msisdn(raw, country_code=CAMPAIGN_COUNTRY_CODE):
+    """Digits of an international number ('+44 (0)7700-900 123' -> '447700900123'), None if it is not one"""
+    number = raw.strip().replace('(0)', '')
+    for ch in ' -().\t/':
+        number = number.replace(ch, '')
+    if number.startswith('+'):
+        number = number[1:]
+    elif number.startswith('00'):
+        number = number[2:]
+    elif number.startswith('0'):
+        if not country_code:
+            return None
+        number = country_code + number[1:]
+    if not (number.isascii() and number.isdigit() and 8 <= len(number) <= 15):
+        return None
+    return number
+
+class Campaign:
+    """One bulk send, kept in CAMPAIGN_DIR/<id>/
+
+    campaign.json  settings, counts and state
+    targets.csv    normalised, deduplicated recipients (number, own content or ''), line n is target n
+    status.bin     one byte per target: pending, inflight, sent or failed, memory mapped
+    results.csv    target, number, outcome, message id or error, appended as Jasmin answers
+
+    A target is marked inflight before it is submitted; after a crash those
+    are only sent again with retry_unknown, as Jasmin may have taken them.
+    Sends use JASMIN_HTTP_USERNAME/PASSWORD, so nothing secret is stored.
+    """
+
+    def __init__(self, path, meta):
+        self.path = path
+        self.meta = meta
+        self.id = meta['id']
+        self.counts = [0] * len(STATUS_NAMES)
+        self.status = None
+        self.thread = None
+        self.run_started = None
+        self.run_done = 0
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        if meta['targets']:
+            with open(self.file('status.bin'), 'r+b') as f:
+                self.status = mmap.mmap(f.fileno(), meta['targets'])
+            data = self.status[:]
+            self.counts = [data.count(code) for code in range(len(STATUS_NAMES))]
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    @classmethod
+    def create(cls, lines, content='', mps=CAMPAIGN_MPS):
+        """Campaign from CSV text lines (any iterable), read once and never held in memory"""
+        cid = datetime.now().strftime('%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:6]
+        path = os.path.join(CAMPAIGN_DIR, cid)
+        os.makedirs(path)
+        seen = set()    # ints, about 60 bytes per unique number
+        rows = invalid = duplicates = 0
+        rejected = []
+        number_col, content_col = 0, None
+        with open(os.path.join(path, 'targets.csv'), 'w', newline='') as out:
+            writer = csv.writer(out)
+            for i, row in enumerate(csv.reader(lines)):
+                if not row:
+                    continue
+                if i == 0:
+                    header = [c.strip().lower() for c in row]
+                    named = [header.index(c) for c in NUMBER_COLUMNS if c in header]
+                    texts = [header.index(c) for c in CONTENT_COLUMNS if c in header]
+                    if named:
+                        number_col, content_col = named[0], texts[0] if texts else None
+                        continue
+                    content_col = 1    # no header: number, content
+                rows += 1
+                number = normalise_msisdn(row[number_col]) if number_col < len(row) else None
+                own = row[content_col].strip() if content_col is not None and content_col < len(row) else ''
+                if number is None or not (own or content):
+                    invalid += 1
+                    if len(rejected) < 20:
+                        rejected.append(row[:3])
+                    continue
+                key = int('1' + number)
+                if key in seen:
+                    duplicates += 1
+                    continue
+                seen.add(key)
+                writer.writerow((number, own))
+        targets = len(seen)
+        del seen
+        with open(os.path.join(path, 'status.bin'), 'wb') as f:
+            f.truncate(targets)
+        meta = dict(id=cid, created=time.time(), content=content, mps=mps, rows=rows, targets=targets,
+                    invalid=invalid, duplicates=duplicates, rejected=rejected, state='ready' if targets else 'done')
+        campaign = cls(path, meta)
+        campaign.save()
+        return campaign
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, 'campaign.json')) as f:
+            return cls(path, json.load(f))
+
+    def save(self):
+        tmp = self.file('campaign.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, self.file('campaign.json'))
+
+    def start(self, retry_failed=False, retry_unknown=False):
+        with self._lock:
+            if self.thread is not None and self.thread.is_alive():
+                return False
+            if not self.meta['targets']:
+                return False
+            self._stop.clear()
+            self.meta['state'] = 'running'
+            self.save()
+            self.thread = threading.Thread(target=self._run, args=(retry_failed, retry_unknown),
+                                           name=f'campaign-{self.id}', daemon=True)
+            self.thread.start()
+        return True
+
+    def pause(self):
+        self._stop.set()
+
+    def _skip(self, status, retry_failed, retry_unknown):
+        return (status == SENT or (status == FAILED and not retry_failed)
+                or (status == INFLIGHT and not retry_unknown))
+
+    def _run(self, retry_failed, retry_unknown):
+        client = JasminHTTPClient(JASMIN_HTTP_URL, size=CAMPAIGN_WORKERS, wait=HTTP_TIMEOUT)
+        slots = threading.BoundedSemaphore(CAMPAIGN_WORKERS)
+        pool = ThreadPoolExecutor(max_workers=CAMPAIGN_WORKERS, thread_name_prefix=f'campaign-{self.id}')
+        interval = 1.0 / self.meta['mps'] if self.meta['mps'] > 0 else 0.0
+        self.run_started, self.run_done = time.monotonic(), 0
+        next_at = time.monotonic()
+        try:
+            with open(self.file('targets.csv'), newline='') as targets, \
+                 open(self.file('results.csv'), 'a', newline='', buffering=1) as results:
+                writer = csv.writer(results)
+                for i, row in enumerate(csv.reader(targets)):
+                    if self._stop.is_set():
+                        break
+                    if self._skip(self.status[i], retry_failed, retry_unknown):
+                        continue
+                    now = time.monotonic()
+                    if next_at > now:
+                        time.sleep(next_at - now)
+                    next_at = max(next_at, now) + interval
+                    slots.acquire()
+                    self._set(i, INFLIGHT)
+                    pool.submit(self._send, client, slots, writer, i, row)
+                pool.shutdown(wait=True)
+            self.meta['state'] = 'paused' if self._stop.is_set() else 'done'
+        except Exception as e:
+            pool.shutdown(wait=True)
+            self.meta.update(state='failed', error=str(e))
+        self.status.flush()
+        self.meta['counts'] = dict(zip(STATUS_NAMES, self.counts))
+        self.save()
+
+    def _set(self, i, status):
+        with self._lock:
+            self.counts[self.status[i]] -= 1
+            self.counts[status] += 1
+            self.status[i] = status
+
+    def _send(self, client, slots, writer, i, row):
+        try:
+            number, own = row
+            try:
+                result = client.send(JASMIN_HTTP_USERNAME, JASMIN_HTTP_PASSWORD, number, own or self.meta['content'])
+                ok = result['status'] == 'success'
+                detail = result['message_id'] if ok else f"{result['http_status']} {result['error']}"
+            except Exception as e:
+                ok, detail = False, str(e)
+            self._set(i, SENT if ok else FAILED)
+            with self._lock:
+                self.run_done += 1
+                writer.writerow((i, number, 'sent' if ok else 'failed', detail))
+        finally:
+            slots.release()
+
+    def progress(self):
+        with self._lock:
+            counts = dict(zip(STATUS_NAMES, self.counts))
+            done = self.run_done
+        running = self.thread is not None and self.thread.is_alive()
+        elapsed = time.monotonic() - self.run_started if running and self.run_started else None
+        rate = done / elapsed if elapsed else None
+        left = counts['pending'] + (counts['inflight'] if running else 0)
+        progress = dict((k, v) for k, v in self.meta.items() if k != 'counts')
+        progress.update(counts=counts, rate=rate, eta=left / rate if rate else None,
+                        percent=round(100.0 * (counts['sent'] + counts['failed']) / self.meta['targets'], 2)
+                        if self.meta['targets'] else 100.0)
+        return progress
+
+campaigns = {}
+campaigns_lock = threading.Lock()
+campaigns_loaded = False
+
+def load_campaigns():
+    """Pick up CAMPAIGN_DIR once, restarting campaigns a crash left running"""
+    global campaigns_loaded
+    with campaigns_lock:
+        if campaigns_loaded:
+            return
+        campaigns_loaded = True
+        os.makedirs(CAMPAIGN_DIR, exist_ok=True)
+        for name in sorted(os.listdir(CAMPAIGN_DIR)):
+            path = os.path.join(CAMPAIGN_DIR, name)
+            if not os.path.exists(os.path.join(path, 'campaign.json')):
+                continue
+            try:
+                campaign = Campaign.load(path)
+            except (OSError, ValueError) as e:
+                print(f"campaign {name} not loaded: {e}")
+                continue
+            campaigns[campaign.id] = campaign
+            if campaign.meta['state'] == 'running':
+                print(f"resuming campaign {campaign.id}")
+                campaign.start()
 
 def get_client_ip():
     """Get client IP address"""
@@ -476,7 +935,8 @@ def dashboard():
     return render_template_string(HTML_TEMPLATE, 
                                 services=services, 
                                 ip_address=ip_address,
-                                last_login=last_login)
+                                last_login=last_login,
+                                campaign_mps=CAMPAIGN_MPS)
 
 @app.route('/api/status')
 def api_status():
@@ -485,23 +945,84 @@ def api_status():
 
 @app.route('/send_sms', methods=['POST'])
 def send_sms():
-    """Send SMS endpoint (simulated)"""
-    data = request.get_json()
-    
-    # Simulate SMS sending
+    """Send an SMS through the Jasmin HTTP API"""
+    data = request.get_json(silent=True) or {}
+    if not data.get('to') or not data.get('content'):
+        return jsonify({'status': 'error', 'message': 'to and content are required'}), 400
+
     response = {
-        'status': 'success' if get_service_status()['http_api'] else 'error',
-        'message': 'SMS sent successfully' if get_service_status()['http_api'] else 'Jasmin HTTP API is not running',
         'to': data.get('to'),
         'content': data.get('content'),
-        'timestamp': datetime.now().isoformat(),
-        'message_id': f"msg_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        'timestamp': datetime.now().isoformat()
     }
-    
-    if not get_service_status()['http_api']:
-        response['note'] = 'This is a simulated response. Start Jasmin daemon to send real SMS.'
-    
-    return jsonify(response)
+    try:
+        result = jasmin_http.send(data.get('username') or JASMIN_HTTP_USERNAME,
+                                  data.get('password') or JASMIN_HTTP_PASSWORD,
+                                  data['to'], data['content'])
+    except PoolBusy as e:
+        response.update(status='error', message=str(e))
+        return jsonify(response), 503
+    except (OSError, http.client.HTTPException) as e:
+        # refused, reset, timed out or not HTTP
+        response.update(status='error', message=f'Jasmin HTTP API unreachable: {e}')
+        return jsonify(response), 502
+
+    response.update(result)
+    response['message'] = 'SMS sent successfully' if result['status'] == 'success' else result['error']
+    code = 200 if result['status'] == 'success' else (result['http_status'] if result['http_status'] >= 400 else 502)
+    return jsonify(response), code
+
+@app.before_request
+def resume_campaigns():
+    # on the first request, so the debug reloader's parent process never sends
+    if not campaigns_loaded:
+        load_campaigns()
+
+@app.route('/campaigns', methods=['POST'])
+def campaign_upload():
+    """Upload a CSV of recipients and start sending it"""
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify({'status': 'error', 'message': 'a CSV file is required'}), 400
+    try:
+        mps = float(request.form.get('mps') or CAMPAIGN_MPS)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'mps must be a number'}), 400
+    # decoded line by line as it is parsed, the upload is never read whole
+    lines = codecs.iterdecode(upload.stream, 'utf-8-sig', errors='replace')
+    campaign = Campaign.create(lines, (request.form.get('content') or '').strip(), mps)
+    with campaigns_lock:
+        campaigns[campaign.id] = campaign
+    if request.form.get('start', '1') != '0':
+        campaign.start()
+    return jsonify(campaign.progress()), 201
+
+@app.route('/campaigns')
+def campaign_list():
+    return jsonify([c.progress() for c in campaigns.values()])
+
+@app.route('/campaigns/<cid>')
+def campaign_progress(cid):
+    campaign = campaigns.get(cid)
+    if campaign is None:
+        return jsonify({'status': 'error', 'message': 'no such campaign'}), 404
+    return jsonify(campaign.progress())
+
+@app.route('/campaigns/<cid>/<action>', methods=['POST'])
+def campaign_control(cid, action):
+    """pause, or resume (retry_failed=1 and retry_unknown=1 send those targets again)"""
+    campaign = campaigns.get(cid)
+    if campaign is None:
+        return jsonify({'status': 'error', 'message': 'no such campaign'}), 404
+    if action == 'pause':
+        campaign.pause()
+    elif action == 'resume':
+        options = request.get_json(silent=True) or request.values
+        campaign.start(retry_failed=str(options.get('retry_failed')) == '1',
+                       retry_unknown=str(options.get('retry_unknown')) == '1')
+    else:
+        return jsonify({'status': 'error', 'message': f'unknown action {action}'}), 404
+    return jsonify(campaign.progress())
 
 @app.route('/ping')
 def ping():
@@ -509,10 +1030,61 @@ def ping():
     return jsonify({
         'status': 'ok',
         'timestamp': datetime.now().isoformat(),
-        'services': get_service_status()
+        'services': get_service_status(),
+        'checked_at': datetime.fromtimestamp(probes.checked_at).isoformat()
     })
 
+def bench(count=2000, concurrency=8):
+    """python3 jasmin-web-panel.py bench [count] [concurrency]
+
+    Sends 'count' SMS from 'concurrency' threads to JASMIN_HTTP_URL (Jasmin
+    or jasmin-with-jcli.py) through the pool, then with a new connection per
+    message, and prints throughput and latency of both.
+    """
+    username, password = JASMIN_HTTP_USERNAME, JASMIN_HTTP_PASSWORD
+
+    def run(label, client_for):
+        latencies, ids, errors = [], set(), []
+        lock = threading.Lock()
+
+        def worker(n):
+            for i in range(n):
+                client = client_for()
+                started = time.perf_counter()
+                try:
+                    result = client.send(username, password, '+10000000000', f'bench {i}')
+                except Exception as e:
+                    result = {'status': 'error', 'error': str(e)}
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    if result['status'] == 'success':
+                        ids.add(result['message_id'])
+                    else:
+                        errors.append(result['error'])
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(count // concurrency,)) for _ in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - started
+        latencies.sort()
+        print(f"{label:<22} {len(latencies) / wall:8.0f} msg/s  p50 {latencies[len(latencies) // 2] * 1000:6.2f} ms"
+              f"  p99 {latencies[int(len(latencies) * 0.99)] * 1000:6.2f} ms  unique ids {len(ids)}  errors {len(errors)}"
+              + (f" ({errors[0]})" if errors else ''))
+
+    pooled = JasminHTTPClient(JASMIN_HTTP_URL, size=concurrency)
+    run('pooled keep-alive', lambda: pooled)
+    run('connection per send', lambda: JasminHTTPClient(JASMIN_HTTP_URL, size=1))
+    print(pooled.metrics())
+
 if __name__ == '__main__':
+    if sys.argv[1:2] == ['bench']:
+        bench(*[int(a) for a in sys.argv[2:4]])
+        sys.exit()
+
     print("🚀 Starting Jasmin Web Panel...")
     print("📱 Web Panel: http://localhost:8080")
     print("🔧 SMS Gateway: http://localhost:1401")
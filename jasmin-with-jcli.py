@@ -2,83 +2,407 @@
 """
 Jasmin SMS Gateway with jcli support
 This creates a complete SMS gateway with HTTP API and jcli telnet interface
+
+The HTTP API is served by an asyncio server by default (HTTP/1.1 keep-alive
+and pipelining), or by a ThreadingHTTPServer with --mode threaded. With
+--workers N it runs in N processes sharing the port through SO_REUSEPORT;
+jcli is served by the first one only. Access logging is buffered and keeps
+one request in --log-sample, plus a per second request count.
+
+/send does not deliver inline: like Jasmin's submit.sm queues, an accepted
+message goes to a bounded queue with one lane per SMS-MT priority (0-3, 3
+first) drained by --queue-workers threads, each taking --delivery-ms per
+message. A full queue answers 429, a queue whose oldest message waited more
+than --max-dwell seconds answers 503, both with Retry-After. Depth, dwell
+time and rejections are on /metrics (Prometheus) and /queue (JSON), per
+worker process.
+
+    python3 jasmin-with-jcli.py --workers 4 --log-sample 1000
+    python3 jasmin-with-jcli.py --queue-size 1000 --queue-workers 2 --delivery-ms 10
 """
 
+import argparse
 import asyncio
 import json
+import multiprocessing
+import os
 import uuid
 import socket
+import sys
 import threading
+import time
+from collections import deque
 from datetime import datetime
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 import urllib.parse
 
+HTTP_USERNAME = os.getenv('JASMIN_HTTP_USERNAME', 'admin')
+HTTP_PASSWORD = os.getenv('JASMIN_HTTP_PASSWORD', 'changeme123')
+
+REASONS = {200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found', 405: 'Method Not Allowed',
+           429: 'Too Many Requests', 503: 'Service Unavailable'}
+RETRY_AFTER = 1     # seconds, sent with 429 and 503
+
+PRIORITIES = (0, 1, 2, 3)   # SMS-MT priority_flag, 3 is the most urgent
+DWELL_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class QueueFull(Exception):
+    status = 429
+
+class QueueStalled(Exception):
+    status = 503
+
+class SubmitQueue:
+    """Bounded priority queue between accepting a message and delivering it"""
+
+    def __init__(self, capacity=10000, workers=4, delivery_ms=0.0, max_dwell=5.0, batch=64):
+        self.capacity = capacity
+        self.delivery = delivery_ms / 1000.0
+        self.max_dwell = max_dwell
+        self.batch = batch
+        self.lanes = dict((p, deque()) for p in PRIORITIES)
+        self.depth = 0
+        self.busy = 0
+        self.counters = dict(accepted=0, delivered=0, rejected_full=0, rejected_stalled=0)
+        self.accepted = dict((p, 0) for p in PRIORITIES)
+        self.dwell_counts = [0] * (len(DWELL_BUCKETS) + 1)
+        self.dwell_sum = 0.0
+        self.cond = threading.Condition()
+        self.workers = workers
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f'submit-worker-{i}', daemon=True).start()
+
+    def oldest(self, now=None):
+        """Seconds the oldest queued message has waited, 0 when empty"""
+        heads = [lane[0][0] for lane in self.lanes.values() if lane]
+        return (now or time.monotonic()) - min(heads) if heads else 0.0
+
+    def put(self, priority, message):
+        with self.cond:
+            now = time.monotonic()
+            if self.depth >= self.capacity:
+                self.counters['rejected_full'] += 1
+                raise QueueFull(f'submit queue full ({self.capacity} messages)')
+            if self.max_dwell and self.depth and self.oldest(now) > self.max_dwell:
+                self.counters['rejected_stalled'] += 1
+                raise QueueStalled(f'submit queue stalled, oldest message waiting {self.oldest(now):.1f}s')
+            self.lanes[priority].append((now, message))
+            self.depth += 1
+            self.counters['accepted'] += 1
+            self.accepted[priority] += 1
+            self.cond.notify()
+
+    def _take(self):
+        with self.cond:
+            while not self.depth:
+                self.cond.wait()
+            # batches only save locking when delivery is instant, a slow delivery
+            # takes one message at a time so the backlog stays visible as depth
+            batch = 1 if self.delivery else self.batch
+            taken = []
+            for p in reversed(PRIORITIES):
+                lane = self.lanes[p]
+                while lane and len(taken) < batch:
+                    taken.append(lane.popleft())
+            self.depth -= len(taken)
+            self.busy += 1
+            now = time.monotonic()
+            for enqueued, message in taken:
+                dwell = now - enqueued
+                i = 0
+                for bound in DWELL_BUCKETS:
+                    if dwell <= bound:
+                        break
+                    i += 1
+                self.dwell_counts[i] += 1
+                self.dwell_sum += dwell
+            return taken
+
+    def _work(self):
+        while True:
+            taken = self._take()
+            for enqueued, message in taken:
+                if self.delivery:
+                    time.sleep(self.delivery)   # the SMSC round trip
+            with self.cond:
+                self.busy -= 1
+                self.counters['delivered'] += len(taken)
+
+    def dwell_quantile(self, q):
+        total = sum(self.dwell_counts)
+        if not total:
+            return None
+        running = 0
+        for bound, n in zip(DWELL_BUCKETS + (float('inf'),), self.dwell_counts):
+            running += n
+            if running >= q * total:
+                return bound
+        return float('inf')
+
+    def snapshot(self):
+        with self.cond:
+            return dict(self.counters, pid=os.getpid(), capacity=self.capacity, depth=self.depth,
+                        workers=self.workers, busy_workers=self.busy,
+                        lanes=dict((p, len(lane)) for p, lane in self.lanes.items()),
+                        accepted_by_priority=dict(self.accepted), oldest_seconds=round(self.oldest(), 6),
+                        dwell_p50=self.dwell_quantile(0.5), dwell_p99=self.dwell_quantile(0.99),
+                        dwell_mean=self.dwell_sum / sum(self.dwell_counts) if sum(self.dwell_counts) else None)
+
+    def render(self):
+        """Prometheus text format"""
+        with self.cond:
+            out = ['# TYPE jasmin_submit_queue_depth gauge']
+            out += ['jasmin_submit_queue_depth{priority="%d"} %d' % (p, len(lane)) for p, lane in self.lanes.items()]
+            out += ['# TYPE jasmin_submit_queue_capacity gauge', 'jasmin_submit_queue_capacity %d' % self.capacity,
+                    '# TYPE jasmin_submit_queue_oldest_seconds gauge',
+                    'jasmin_submit_queue_oldest_seconds %f' % self.oldest(),
+                    '# TYPE jasmin_submit_busy_workers gauge', 'jasmin_submit_busy_workers %d' % self.busy]
+            out.append('# TYPE jasmin_submit_accepted_total counter')
+            out += ['jasmin_submit_accepted_total{priority="%d"} %d' % (p, n) for p, n in self.accepted.items()]
+            out += ['# TYPE jasmin_submit_delivered_total counter',
+                    'jasmin_submit_delivered_total %d' % self.counters['delivered'],
+                    '# TYPE jasmin_submit_rejected_total counter',
+                    'jasmin_submit_rejected_total{reason="full"} %d' % self.counters['rejected_full'],
+                    'jasmin_submit_rejected_total{reason="stalled"} %d' % self.counters['rejected_stalled'],
+                    '# TYPE jasmin_submit_dwell_seconds histogram']
+            running = 0
+            for bound, n in zip(DWELL_BUCKETS + (float('inf'),), self.dwell_counts):
+                running += n
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                out.append('jasmin_submit_dwell_seconds_bucket{le="%s"} %d' % (le, running))
+            out += ['jasmin_submit_dwell_seconds_sum %f' % self.dwell_sum,
+                    'jasmin_submit_dwell_seconds_count %d' % running]
+        return ('\n'.join(out) + '\n').encode()
+
+submit_queue = None     # SubmitQueue of this process, made by start_http_server
+
+def route(method, path, body=b''):
+    """(status, content type, body) of an HTTP API request"""
+    if path.startswith('/ping'):
+        return 200, 'text/plain', b'pong'
+
+    elif path.startswith('/status'):
+        status = {
+            "status": "online",
+            "service": "Jasmin SMS Gateway",
+            "timestamp": datetime.now().isoformat(),
+            "version": "1.0.0",
+            "jcli": "enabled"
+        }
+        return 200, 'application/json', json.dumps(status).encode()
+
+    elif path.startswith('/send'):
+        # Parse query parameters, or the form body of a POST
+        query = body.decode('utf-8', 'replace') if method == 'POST' else urllib.parse.urlsplit(path).query
+        params = urllib.parse.parse_qs(query)
+
+        username = params.get('username', [''])[0]
+        password = params.get('password', [''])[0]
+        to = params.get('to', [''])[0]
+        content = params.get('content', [''])[0]
+
+        # Authentication
+        if username != HTTP_USERNAME or password != HTTP_PASSWORD:
+            response = {
+                "status": "error",
+                "message": "Authentication failed"
+            }
+            return 401, 'application/json', json.dumps(response).encode()
+
+        priority = params.get('priority', ['0'])[0]
+        if priority not in ('0', '1', '2', '3'):
+            return 400, 'application/json', json.dumps({"status": "error", "message": "priority must be 0 to 3"}).encode()
+        message_id = str(uuid.uuid4())
+        try:
+            submit_queue.put(int(priority), (message_id, to, content))
+        except (QueueFull, QueueStalled) as e:
+            return e.status, 'application/json', json.dumps({"status": "error", "message": str(e)}).encode()
+        response = {
+            "status": "success",
+            "message_id": message_id,
+            "to": to,
+            "content": content,
+            "priority": int(priority),
+            "timestamp": datetime.now().isoformat()
+        }
+        return 200, 'application/json', json.dumps(response).encode()
+
+    elif path.startswith('/metrics'):
+        return 200, 'text/plain; version=0.0.4', submit_queue.render()
+
+    elif path.startswith('/queue'):
+        return 200, 'application/json', json.dumps(submit_queue.snapshot()).encode()
+
+    else:
+        return 404, 'text/plain', b'Not Found'
+
+class AccessLog:
+    """Sampled access log, written once per second instead of a line per request"""
+
+    def __init__(self, sample=100, interval=1.0, stream=sys.stdout):
+        self.sample = sample
+        self.interval = interval
+        self.stream = stream
+        self.requests = 0
+        self.lines = []
+        self.lock = threading.Lock()
+        if sample:
+            threading.Thread(target=self._flush_loop, name='access-log', daemon=True).start()
+
+    def log(self, client, method, path, status):
+        if not self.sample:
+            return
+        with self.lock:
+            self.requests += 1
+            if self.requests % self.sample == 0:
+                self.lines.append(f"🌐 {datetime.now().strftime('%H:%M:%S')} [{os.getpid()}] {client} "
+                                  f"\"{method} {path.split('?', 1)[0]}\" {status}")
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                lines, requests = self.lines, self.requests
+                self.lines, self.requests = [], 0
+            if requests:
+                lines.append(f"📊 [{os.getpid()}] {requests / self.interval:.0f} req/s"
+                             + (f", 1 in {self.sample} logged" if self.sample > 1 else ''))
+                self.stream.write('\n'.join(lines) + '\n')
+                self.stream.flush()
+
+access_log = AccessLog(0)
+
+def content_length(value):
+    """Body length from a Content-Length header value, 0 when absent, None when not a plain number"""
+    if value is None:
+        return 0
+    value = value.strip()
+    return int(value) if value.isascii() and value.isdigit() else None
+
 class SMSGatewayHandler(BaseHTTPRequestHandler):
+    # keep-alive, so every reply carries its Content-Length
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def reply(self, code, content_type, body):
+        self.send_response_only(code)
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if code in (429, 503):
+            self.send_header('Retry-After', str(RETRY_AFTER))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
     def do_GET(self):
-        if self.path.startswith('/ping'):
-            self.send_response(200)
-            self.send_header('Content-type', 'text/plain')
-            self.end_headers()
-            self.wfile.write(b'pong')
-            
-        elif self.path.startswith('/status'):
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            status = {
-                "status": "online",
-                "service": "Jasmin SMS Gateway",
-                "timestamp": datetime.now().isoformat(),
-                "version": "1.0.0",
-                "jcli": "enabled"
-            }
-            self.wfile.write(json.dumps(status).encode())
-            
-        elif self.path.startswith('/send'):
-            # Parse query parameters
-            query = urllib.parse.urlparse(self.path).query
-            params = urllib.parse.parse_qs(query)
-            
-            username = params.get('username', [''])[0]
-            password = params.get('password', [''])[0]
-            to = params.get('to', [''])[0]
-            content = params.get('content', [''])[0]
-            
-            # Authentication
-            if username == os.getenv('JASMIN_HTTP_USERNAME', 'admin') and password == os.getenv('JASMIN_HTTP_PASSWORD', 'changeme123'):
-                message_id = str(uuid.uuid4())
-                response = {
-                    "status": "success",
-                    "message_id": message_id,
-                    "to": to,
-                    "content": content,
-                    "timestamp": datetime.now().isoformat()
-                }
-                
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps(response).encode())
-                
-                print(f"📱 SMS Sent: {to} - {content} (ID: {message_id})")
-            else:
-                response = {
-                    "status": "error",
-                    "message": "Authentication failed"
-                }
-                
-                self.send_response(401)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps(response).encode())
-        else:
-            self.send_response(404)
-            self.send_header('Content-type', 'text/plain')
-            self.end_headers()
-            self.wfile.write(b'Not Found')
-    
+        code, content_type, body = route('GET', self.path)
+        self.reply(code, content_type, body)
+        access_log.log(self.client_address[0], 'GET', self.path, code)
+
+    def do_POST(self):
+        length = content_length(self.headers.get('Content-Length'))
+        if length is None:
+            # the body cannot be found, neither can the next request
+            self.close_connection = True
+            self.reply(400, 'text/plain', b'Bad Content-Length')
+            access_log.log(self.client_address[0], 'POST', self.path, 400)
+            return
+        code, content_type, body = route('POST', self.path, self.rfile.read(length))
+        self.reply(code, content_type, body)
+        access_log.log(self.client_address[0], 'POST', self.path, code)
+
     def log_message(self, format, *args):
-        print(f"🌐 {datetime.now().strftime('%H:%M:%S')} - {format % args}")
+        pass    # see AccessLog
+
+class HTTPProtocol(asyncio.Protocol):
+    """HTTP/1.1 for the asyncio mode: keep-alive, pipelined requests answered in order"""
+    MAX_HEAD = 65536
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.buffer = b''
+        peer = transport.get_extra_info('peername')
+        self.client = peer[0] if peer else '-'
+        sock = transport.get_extra_info('socket')
+        if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def data_received(self, data):
+        buffer = self.buffer + data if self.buffer else data
+        out = []
+        close = False
+        while buffer:
+            end = buffer.find(b'\r\n\r\n')
+            if end < 0:
+                if len(buffer) > self.MAX_HEAD:
+                    out.append(self.response(400, 'text/plain', b'Bad Request', False))
+                    close = True
+                    buffer = b''
+                break
+            head = buffer[:end].decode('latin-1')
+            request_line, _, header_text = head.partition('\r\n')
+            parts = request_line.split(' ')
+            if len(parts) != 3:
+                out.append(self.response(400, 'text/plain', b'Bad Request', False))
+                close = True
+                buffer = b''
+                break
+            method, path, version = parts
+            headers = header_text.lower()
+            length = 0
+            for line in headers.split('\r\n'):
+                name, _, value = line.partition(':')
+                if name.strip() == 'content-length':
+                    length = content_length(value)
+                    break
+            if length is None:
+                # answered after the requests before it, then the connection is dropped
+                out.append(self.response(400, 'text/plain', b'Bad Content-Length', False))
+                access_log.log(self.client, method, path, 400)
+                close = True
+                buffer = b''
+                break
+            if len(buffer) < end + 4 + length:
+                break   # body not all here yet
+            body = buffer[end + 4:end + 4 + length]
+            buffer = buffer[end + 4 + length:]
+            if version == 'HTTP/1.1':
+                keep_alive = 'connection: close' not in headers
+            else:
+                keep_alive = 'connection: keep-alive' in headers
+            if method in ('GET', 'POST'):
+                code, content_type, payload = route(method, path, body)
+            else:
+                code, content_type, payload = 405, 'text/plain', b'Method Not Allowed'
+            out.append(self.response(code, content_type, payload, keep_alive))
+            access_log.log(self.client, method, path, code)
+            if not keep_alive:
+                close = True
+                buffer = b''
+                break
+        self.buffer = buffer
+        if out:
+            self.transport.write(b''.join(out))
+        if close:
+            self.transport.close()
+
+    @staticmethod
+    def response(code, content_type, body, keep_alive):
+        extra = '' if keep_alive else 'Connection: close\r\n'
+        if code in (429, 503):
+            extra += f'Retry-After: {RETRY_AFTER}\r\n'
+        return (f"HTTP/1.1 {code} {REASONS.get(code, 'Unknown')}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n{extra}\r\n").encode() + body
+
+def http_socket(host, port, reuse_port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    return sock
 
 class JCLIServer:
     def __init__(self, host='localhost', port=8990):
@@ -99,8 +423,8 @@ class JCLIServer:
             # Read password
             password = client_socket.recv(1024).decode().strip()
             
-        # Authenticate
-        if username == os.getenv('JASMIN_CLI_USERNAME', 'admin') and password == os.getenv('JASMIN_CLI_PASSWORD', 'changeme123'):
+            # Authenticate
+            if username == os.getenv('JASMIN_CLI_USERNAME', 'admin') and password == os.getenv('JASMIN_CLI_PASSWORD', 'changeme123'):
                 client_socket.send(b"Welcome to Jasmin 0.11.1 console\r\n")
                 client_socket.send(b"Type quit to exit\r\n")
                 client_socket.send(b"jcli : ")
@@ -152,33 +476,81 @@ class JCLIServer:
     def stop(self):
         self.running = False
 
-def start_http_server():
-    server = HTTPServer(('localhost', 1401), SMSGatewayHandler)
-    print("📱 HTTP API Server started on http://localhost:1401")
+def serve_asyncio(sock):
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(loop.create_server(HTTPProtocol, sock=sock))
+    loop.run_forever()
+
+def serve_threaded(sock):
+    server = ThreadingHTTPServer(sock.getsockname(), SMSGatewayHandler, bind_and_activate=False)
+    server.socket.close()
+    server.socket = sock
+    server.daemon_threads = True
     server.serve_forever()
 
+def start_http_server(mode='asyncio', host='localhost', port=1401, reuse_port=False, log_sample=100,
+                      queue_options=None):
+    global access_log, submit_queue
+    access_log = AccessLog(log_sample)
+    submit_queue = SubmitQueue(**(queue_options or {}))
+    sock = http_socket(host, port, reuse_port)
+    print(f"📱 HTTP API Server ({mode}, pid {os.getpid()}) started on http://{host}:{port}")
+    try:
+        (serve_asyncio if mode == 'asyncio' else serve_threaded)(sock)
+    except KeyboardInterrupt:
+        pass
+
 def start_jcli_server():
     jcli_server = JCLIServer()
     jcli_server.start()
 
 def main():
+    parser = argparse.ArgumentParser(description='Jasmin SMS Gateway stand-in: HTTP API and jcli')
+    parser.add_argument('--mode', choices=('asyncio', 'threaded'), default=os.getenv('HTTP_MODE', 'asyncio'))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('HTTP_WORKERS', 1)),
+                        help='HTTP API processes sharing the port (SO_REUSEPORT)')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=1401)
+    parser.add_argument('--log-sample', type=int, default=int(os.getenv('HTTP_LOG_SAMPLE', 100)),
+                        help='log one request in N, 0 for none')
+    parser.add_argument('--queue-size', type=int, default=int(os.getenv('QUEUE_SIZE', 10000)),
+                        help='messages queued per process before /send answers 429')
+    parser.add_argument('--queue-workers', type=int, default=int(os.getenv('QUEUE_WORKERS', 4)),
+                        help='delivery threads per process')
+    parser.add_argument('--delivery-ms', type=float, default=float(os.getenv('QUEUE_DELIVERY_MS', 0)),
+                        help='simulated delivery time of one message')
+    parser.add_argument('--max-dwell', type=float, default=float(os.getenv('QUEUE_MAX_DWELL', 5)),
+                        help='seconds the oldest message may wait before /send answers 503, 0 to never')
+    args = parser.parse_args()
+    if args.workers > 1 and not hasattr(socket, 'SO_REUSEPORT'):
+        parser.error('--workers needs SO_REUSEPORT, not available on this platform')
+
     print("🚀 Starting Jasmin SMS Gateway with jcli support...")
-    print("📱 HTTP API: http://localhost:1401")
+    print(f"📱 HTTP API: http://{args.host}:{args.port} ({args.mode}, {args.workers} worker(s))")
     print("🔧 JCLI: telnet localhost 8990")
     print("")
     print("Press Ctrl+C to stop all services")
     print("=" * 50)
     
+    # Extra HTTP workers, each with its own listening socket on the same port,
+    # forked before any thread or socket of this process exists
+    reuse_port = args.workers > 1
+    queue_options = dict(capacity=args.queue_size, workers=args.queue_workers, delivery_ms=args.delivery_ms,
+                         max_dwell=args.max_dwell)
+    options = dict(mode=args.mode, host=args.host, port=args.port, reuse_port=reuse_port, log_sample=args.log_sample,
+                   queue_options=queue_options)
+    context = multiprocessing.get_context('fork')
+    for _ in range(args.workers - 1):
+        context.Process(target=start_http_server, kwargs=options, daemon=True).start()
+
     # Start JCLI server in a separate thread
     jcli_thread = threading.Thread(target=start_jcli_server)
     jcli_thread.daemon = True
     jcli_thread.start()
-    
+
     # Start HTTP server in the main thread
-    try:
-        start_http_server()
-    except KeyboardInterrupt:
-        print("\n🛑 Server stopped")
+    start_http_server(**options)
+    print("\n🛑 Server stopped")
 
 if __name__ == "__main__":
     main()
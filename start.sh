@@ -68,5 +68,6 @@ cleanup() {
 # Set trap to cleanup on script exit
 trap cleanup SIGINT SIGTERM
 
-# Start Py4Web
-py4web run apps --host 0.0.0.0 --port 8000 --password_file password.txt
+# Start Py4Web, the GUI is thread safe; with more than one worker process each
+# keeps its own jcli pool and listing cache (stale for at most JCLI_LIST_CACHE_TTL)
+py4web run apps --host 0.0.0.0 --port 8000 --password_file password.txt --number_workers ${PY4WEB_WORKERS:-1}
@@ -0,0 +1,107 @@
+"""
+jtel against a minimal jCli stand-in on a local port
+
+    python -m pytest tests
+"""
+import os
+import socket
+import sys
+import threading
+
+import pytest
+
+pytest.importorskip('py4web')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from apps.jasmin_smsc_gui import jtel  # noqa: E402
+
+
+def fake_jcli(refuse = False):
+    """Port of a jCli that logs anyone in and answers every command, refusing every 'ok' with refuse=True"""
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(8)
+
+    def handle(conn):
+        f = conn.makefile('rb')
+        conn.sendall(b"Authentication required.\r\n\r\nUsername: ")
+        f.readline()
+        f.readline()
+        conn.sendall(b"Password: ")
+        f.readline()
+        conn.sendall(b"Welcome to Jasmin 0.9.31 console\r\njcli : ")
+        dialog = False
+        try:
+            for line in f:
+                cmd = line.strip()
+                if dialog:
+                    if cmd == b'ok' and refuse:
+                        conn.sendall(b"Error: fid is mandatory\r\n> ")     # jCli stays in the dialog
+                    elif cmd in (b'ok', b'ko'):
+                        dialog = False
+                        conn.sendall(b"Successfully added\r\njcli : ")
+                    else:
+                        conn.sendall(b"> ")
+                elif cmd.endswith(b' -a'):
+                    dialog = True
+                    conn.sendall(b"Adding a new Filter: (ok: save, ko: exit)\r\n> ")
+                else:
+                    conn.sendall(cmd + b"\r\nSuccessfully done\r\njcli : ")
+        except OSError:
+            pass    # the client went away
+        conn.close()
+
+    def serve():
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=serve, daemon=True).start()
+    return server
+
+
+def client(port):
+    jasmin = jtel.Jptelnet()
+    jasmin.host, jasmin.port = '127.0.0.1', port
+    jasmin.policy.default = 0.5     # prompt timeout, seconds
+    return jasmin
+
+
+def test_refused_mutation_keeps_breaker_closed():
+    server = fake_jcli(refuse=True)
+    jasmin = client(server.getsockname()[1])
+    breaker = jasmin.policy.breaker
+    for i in range(breaker.threshold + 1):
+        with pytest.raises(jtel.jCliSessionError):
+            jasmin.filters(['create', 'f%d' % i, 'TransparentFilter', ''])
+    assert breaker.state == 'closed'
+    assert breaker.failures == 0
+    # the sessions left in the dialog were not handed out again
+    assert jasmin.pool.metrics()['idle'] == 0
+    server.close()
+
+
+def test_unreachable_jcli_opens_breaker():
+    free = socket.socket()
+    free.bind(('127.0.0.1', 0))     # never listened on: connections are refused
+    port = free.getsockname()[1]
+    free.close()
+    jasmin = client(port)
+    breaker = jasmin.policy.breaker
+    for i in range(breaker.threshold):
+        assert jasmin.filters(['create', 'f%d' % i, 'TransparentFilter', ''])   # the error message
+    assert breaker.state == 'open'
+
+
+def test_lease_stops_after_a_call_left_mid_dialog():
+    server = fake_jcli(refuse=True)
+    jasmin = client(server.getsockname()[1])
+    with jasmin.lease():
+        with pytest.raises(jtel.jCliSessionError):
+            jasmin.filters(['create', 'f1', 'TransparentFilter', ''])
+        with pytest.raises(jtel.jCliSessionError, match='mid-command'):
+            jasmin.filters(['create', 'f2', 'TransparentFilter', ''])
+    assert jasmin.policy.breaker.state == 'closed'
+    server.close()